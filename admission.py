@@ -0,0 +1,315 @@
+import contextlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from llm_metrics import get_metrics
+
+# Admission control for upstream OpenAI calls, shared by every session in the process.
+# - A token bucket per limit (requests and tokens per minute), resynced from the
+#   x-ratelimit-* headers of every response, holds requests back instead of letting
+#   them fail with 429s.
+# - Retryable failures (429, timeouts, connection errors, 5xx) back off exponentially
+#   with full jitter, honouring Retry-After; a 429 pauses the whole bucket, so waiting
+#   callers do not stampede the API the moment one retry succeeds.
+# - Each Streamlit session may only have a few calls in flight. Speculative calls have a
+#   cap of their own, so a prefetch never holds the slot of a call the user is waiting for.
+# - Work that cannot be admitted in time raises Overloaded, and failures that outlast the
+#   retries raise Unavailable; callers catch both (SHED_ERRORS) and degrade gracefully
+#   (cached or template summary, "Lex is busy") instead of showing a traceback.
+# Speculative work (prefetch) runs at low priority and is shed first.
+
+logger = logging.getLogger("fitx.admission")
+
+DEFAULT_RPM = int(os.getenv("FITX_RATE_LIMIT_RPM", "500"))
+DEFAULT_TPM = int(os.getenv("FITX_RATE_LIMIT_TPM", "300000"))
+MAX_WAIT = float(os.getenv("FITX_ADMISSION_MAX_WAIT", "20"))  # seconds a call may queue
+MAX_ATTEMPTS = int(os.getenv("FITX_ADMISSION_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+SESSION_CONCURRENCY = int(os.getenv("FITX_SESSION_CONCURRENCY", "2"))
+SESSION_PREFETCH_CONCURRENCY = int(os.getenv("FITX_SESSION_PREFETCH_CONCURRENCY", "2"))  # speculative calls, capped apart
+LOW_PRIORITY_RESERVE = 0.2  # share of each bucket speculative work may not dip into
+
+BUSY_MESSAGE = "Lex is busy right now 😅 Give it a few seconds and try again!"
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Unavailable(Overloaded):
+    # A retryable upstream error (429, timeout, connection, 5xx) that outlasted the retries
+    pass
+
+
+# What callers catch to fall back to a degraded response
+SHED_ERRORS = (Overloaded,)
+
+
+def retryable_errors():
+    # The SDK is imported lazily (see llm_client); whenever a call has failed it is loaded
+    import openai
+
+    return (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def parse_duration(value):
+    # x-ratelimit-reset-* values look like "1s", "6m0s", "20ms" or "0.5s"
+    if not value:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def retry_after(exc):
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+def backoff_delay(attempt, floor=None):
+    # Full jitter: uniform in [0, min(cap, base * 2^attempt)], never below Retry-After
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, floor or 0.0)
+
+
+class Bucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = self.capacity / 60.0  # refill per second
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)  # oversized requests wait for a full bucket
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def sync(self, limit, remaining, reset, now):
+        # The server's view wins: its limit sizes the bucket, and the time until the
+        # window is full again (reset) sets how fast it refills
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.level = min(remaining, self.capacity)
+        if reset and self.level < self.capacity:
+            self.rate = (self.capacity - self.level) / reset
+        else:
+            self.rate = self.capacity / 60.0
+        self.updated = now
+
+
+class AdmissionController:
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, max_wait=MAX_WAIT, session_concurrency=SESSION_CONCURRENCY, prefetch_concurrency=SESSION_PREFETCH_CONCURRENCY):
+        self.buckets = {"requests": Bucket(rpm), "tokens": Bucket(tpm)}
+        self.max_wait = max_wait
+        self.session_concurrency = session_concurrency
+        self.prefetch_concurrency = prefetch_concurrency
+        self.paused_until = 0.0
+        self.sessions = {}  # (session id, low priority) -> calls in flight
+        self._lock = threading.Lock()
+        self._sessions_cond = threading.Condition()
+
+    def acquire(self, site, tokens, low_priority=False):
+        costs = {"requests": 1, "tokens": tokens}
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                for bucket in self.buckets.values():
+                    bucket.refill(now)
+                if low_priority and any(bucket.level - costs[name] < bucket.capacity * LOW_PRIORITY_RESERVE for name, bucket in self.buckets.items()):
+                    self._shed(site, "low_priority")
+                wait = max([self.paused_until - now] + [bucket.wait_time(costs[name]) for name, bucket in self.buckets.items()])
+                if wait <= 0:
+                    for name, bucket in self.buckets.items():
+                        bucket.level -= costs[name]
+                    break
+                if now + wait > deadline:
+                    self._shed(site, "rate_limit")
+            time.sleep(min(wait, 1.0))
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            get_metrics().observe_admission_wait(site, waited)
+        return waited
+
+    def _shed(self, site, reason):
+        get_metrics().observe_shed(site, reason)
+        logger.warning("shedding %s call (%s)", site, reason)
+        raise Overloaded(reason)
+
+    def pause(self, seconds):
+        # After a 429 nobody goes upstream until the window has passed
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers):
+        limits = {
+            name: (headers.get(f"x-ratelimit-limit-{name}"), headers.get(f"x-ratelimit-remaining-{name}"), headers.get(f"x-ratelimit-reset-{name}"))
+            for name in self.buckets
+        }
+        if not any(limit or remaining for limit, remaining, _ in limits.values()):
+            return
+        with self._lock:
+            now = time.monotonic()
+            for name, (limit, remaining, reset) in limits.items():
+                try:
+                    self.buckets[name].sync(
+                        float(limit) if limit else None,
+                        float(remaining) if remaining else None,
+                        parse_duration(reset),
+                        now,
+                    )
+                except ValueError:
+                    continue
+
+    @contextlib.contextmanager
+    def session_slot(self, site, session_id, low_priority=False):
+        if session_id is None:
+            yield
+            return
+        key = (session_id, low_priority)
+        limit = self.prefetch_concurrency if low_priority else self.session_concurrency
+        deadline = time.monotonic() + self.max_wait
+        with self._sessions_cond:
+            while self.sessions.get(key, 0) >= limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._shed(site, "session_cap")
+                self._sessions_cond.wait(remaining)
+            self.sessions[key] = self.sessions.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._sessions_cond:
+                self.sessions[key] -= 1
+                if not self.sessions[key]:
+                    del self.sessions[key]
+                self._sessions_cond.notify_all()
+
+    def call(self, site, tokens, create, low_priority=False):
+        # Runs create() once admitted, retrying retryable failures with backoff
+        for attempt in range(MAX_ATTEMPTS):
+            self.acquire(site, tokens, low_priority)
+            try:
+                return create()
+            except retryable_errors() as exc:
+                floor = retry_after(exc)
+                delay = backoff_delay(attempt, floor)
+                if type(exc).__name__ == "RateLimitError":
+                    self.pause(delay)
+                # Out of attempts, or the server wants longer than a user should wait
+                if attempt == MAX_ATTEMPTS - 1 or delay > self.max_wait:
+                    raise Unavailable(f"{type(exc).__name__} after {attempt + 1} attempts") from exc
+                logger.info("%s attempt %d failed with %s, retrying in %.2fs", site, attempt + 1, type(exc).__name__, delay)
+                time.sleep(delay)
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission():
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
+
+
+def observe_response(response):
+    # httpx response hook (see llm_client): keeps the buckets in line with the account's limits
+    get_admission().observe_headers(response.headers)
+
+
+_priority = threading.local()
+
+
+@contextlib.contextmanager
+def low_priority():
+    # Calls created inside this block are speculative and shed first
+    previous = getattr(_priority, "low", False)
+    _priority.low = True
+    try:
+        yield
+    finally:
+        _priority.low = previous
+
+
+def is_low_priority():
+    return getattr(_priority, "low", False)
+
+
+_session = threading.local()
+
+
+@contextlib.contextmanager
+def session_scope(session_id):
+    # Attributes calls made inside this block to `session_id` (sessions outside Streamlit)
+    previous = getattr(_session, "id", None)
+    _session.id = session_id
+    try:
+        yield
+    finally:
+        _session.id = previous
+
+
+_cancel = threading.local()
+
+
+class Cancelled(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def cancel_scope(is_cancelled):
+    # Calls created inside this block raise Cancelled once is_cancelled() is true: before
+    # they go upstream and at each delta, whether or not anything renders them
+    previous = getattr(_cancel, "check", None)
+    _cancel.check = is_cancelled
+    try:
+        yield
+    finally:
+        _cancel.check = previous
+
+
+def cancellation_check():
+    return getattr(_cancel, "check", None)
+
+
+def current_session_id():
+    session_id = getattr(_session, "id", None)
+    if session_id is not None:
+        return session_id
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+def estimate_request_tokens(params):
+    prompt = sum(len(str(msg.get("content", ""))) for msg in params.get("messages", ())) // 4
+    return prompt + (params.get("max_tokens") or 256)
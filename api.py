@@ -0,0 +1,204 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from admission import BUSY_MESSAGE, SHED_ERRORS, Overloaded
+from coach import GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS
+from engine import InvalidAnswer, UnknownSession, get_engine
+from funnel import InvalidTransition, Step
+from llm_metrics import get_metrics
+
+# HTTP API over the coaching engine, for the mobile app and the web widget:
+#   uvicorn api:app --workers 4 --port 8000
+# Workers keep no session state (see engine.py), so any number of them can run behind
+# one load balancer as long as they share FITX_CACHE_DIR / FITX_CONVERSATIONS_DB.
+# Sessions answer with a resume_token (needs FITX_RESUME_SECRET); POST /v1/sessions with
+# {"resume": token} continues that conversation at the chat step. Nothing else resumes one:
+# emails given during onboarding are never confirmed.
+# Summary, meal plan and chat take ?stream=true and then answer with server-sent events:
+#   event: delta  data: {"text": "..."}   a piece of the reply
+#   event: reset  data: {}                the reply is re-sent from the start (continued or regenerated)
+#   event: done   data: {"text": "..."}   the complete reply
+#   event: error  data: {"error": "busy", "message": "..."}
+# Engine calls block (OpenAI SDK, admission waits), so they run on a pool of
+# FITX_API_THREADS threads; the event loop only relays their output.
+
+logger = logging.getLogger("fitx.api")
+
+API_THREADS = int(os.getenv("FITX_API_THREADS", "64"))
+
+_executor = ThreadPoolExecutor(max_workers=API_THREADS, thread_name_prefix="fitx-api")
+
+app = FastAPI(title="FitxFearless coaching API")
+
+
+class StartRequest(BaseModel):
+    resume: str | None = None
+
+
+class Answers(BaseModel):
+    name: str | None = None
+    email: str | None = None
+    goal: str | None = None
+    struggle: str | None = None
+    timeline: str | None = None
+
+
+class MealPlanRequest(BaseModel):
+    preferences: str = ""
+
+
+class ChatRequest(BaseModel):
+    message: str
+
+
+async def run(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+@app.exception_handler(UnknownSession)
+async def unknown_session(request, exc):
+    return JSONResponse({"detail": "unknown session"}, status_code=404)
+
+
+@app.exception_handler(InvalidAnswer)
+async def invalid_answer(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=422)
+
+
+@app.exception_handler(InvalidTransition)
+async def invalid_transition(request, exc):
+    return JSONResponse({"detail": str(exc)}, status_code=409)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request, exc):
+    return JSONResponse({"detail": BUSY_MESSAGE}, status_code=503, headers={"Retry-After": "5"})
+
+
+class Disconnected(Exception):
+    pass
+
+
+def event_stream(call):
+    # Runs call(render) on the pool and relays what it renders as server-sent events;
+    # a client that disconnects cancels the upstream completion
+    closed = threading.Event()
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        rendered = []
+
+        def emit(event, data):
+            if not closed.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+        def render(stream):
+            if rendered:
+                emit("reset", {})
+            rendered.append(True)
+            iterator = iter(stream)
+            try:
+                for delta in iterator:
+                    if closed.is_set():
+                        raise Disconnected()
+                    emit("delta", {"text": delta})
+            finally:
+                iterator.close()
+
+        def work():
+            try:
+                emit("done", {"text": call(render)})
+            except Disconnected:
+                pass
+            except SHED_ERRORS:
+                emit("error", {"error": "busy", "message": BUSY_MESSAGE})
+            except Exception as exc:
+                logger.exception("streamed engine call failed")
+                emit("error", {"error": type(exc).__name__, "message": str(exc)})
+
+        _executor.submit(work)
+        try:
+            while True:
+                event, data = await queue.get()
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                if event in ("done", "error"):
+                    return
+        finally:
+            closed.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"ok": True}
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(get_metrics().render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/v1/options")
+async def options():
+    return {"goal": GOAL_OPTIONS, "struggle": STRUGGLE_OPTIONS, "timeline": TIMELINE_OPTIONS}
+
+
+@app.post("/v1/sessions", status_code=201)
+async def start_session(request: StartRequest | None = None):
+    return await run(get_engine().start, request.resume if request else None)
+
+
+@app.get("/v1/sessions/{session_id}")
+async def get_session(session_id: str):
+    return await run(get_engine().session, session_id)
+
+
+@app.post("/v1/sessions/{session_id}/answers")
+async def answer(session_id: str, answers: Answers):
+    # The current onboarding step's answers: name, email and goal, then struggle, then timeline
+    return await run(get_engine().answer, session_id, answers.model_dump(exclude_none=True))
+
+
+@app.post("/v1/sessions/{session_id}/summary")
+async def summary(session_id: str, stream: bool = False):
+    engine = get_engine()
+    await run(engine.require, session_id, Step.SUMMARY)  # errors before the stream starts
+    if stream:
+        return event_stream(functools.partial(engine.summary, session_id))
+    return {"text": await run(engine.summary, session_id)}
+
+
+@app.post("/v1/sessions/{session_id}/meal-plan")
+async def meal_plan(session_id: str, request: MealPlanRequest, stream: bool = False):
+    engine = get_engine()
+    await run(engine.require, session_id, Step.MEAL_PLAN)
+    if stream:
+        return event_stream(functools.partial(engine.meal_plan, session_id, request.preferences))
+    return {"text": await run(engine.meal_plan, session_id, request.preferences)}
+
+
+@app.post("/v1/sessions/{session_id}/chat")
+async def chat(session_id: str, request: ChatRequest, stream: bool = False):
+    engine = get_engine()
+    await run(engine.require, session_id, Step.CHAT)
+    if not request.message.strip():
+        raise InvalidAnswer("message is empty")
+    if stream:
+        return event_stream(functools.partial(engine.chat, session_id, request.message))
+    return {"text": await run(engine.chat, session_id, request.message)}
+
+
+@app.get("/v1/sessions/{session_id}/messages")
+async def messages(session_id: str):
+    return await run(get_engine().messages, session_id)
@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+# Throughput of the HTTP API (api.py under uvicorn) against the local mock OpenAI server:
+# N sessions walk onboarding, the streamed summary and meal plan, and chat turns over
+# HTTP/SSE with a given concurrency. --compare then walks the same number of sessions
+# through the Streamlit app (scenarios.py) against the same mock and prints both.
+#   python benchmarks/api_bench.py --sessions 40 --concurrency 20 --workers 4 --compare
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, BENCH_DIR)
+
+from mock_openai import MockOpenAI  # noqa: E402
+from run import percentile  # noqa: E402
+
+STEPS = ("lead", "struggle", "timeline", "summary", "meal_plan", "chat_turn")
+MEAL_INPUTS = ("", "vegetarian", "keto", "no dairy", "gluten free, no nuts", "high protein", "vegan")
+CHAT_MESSAGES = (
+    "How many times a week should I train?",
+    "What should I eat before a workout?",
+    "I skipped yesterday, how do I get back on track?",
+    "Can you give me a quick leg workout?",
+    "How much protein do I need?",
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api(workers, env):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/healthz", timeout=1).raise_for_status()
+            return server, url
+        except httpx.HTTPError:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("API did not come up within 60s")
+
+
+def read_events(response):
+    # The final text of an SSE reply and the time to its first delta
+    started = time.perf_counter()
+    ttft, event = None, None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: "):
+            data = json.loads(line[6:])
+            if event == "delta" and ttft is None:
+                ttft = time.perf_counter() - started
+            elif event == "done":
+                return data["text"], ttft
+            elif event == "error":
+                raise RuntimeError(f"{data['error']}: {data['message']}")
+    raise RuntimeError("stream ended without a done event")
+
+
+class ApiSession:
+    def __init__(self, index, url, options, chat_turns=3, seed=None):
+        self.index = index
+        self.url = url
+        self.options = options
+        self.chat_turns = chat_turns
+        self.random = random.Random(seed)
+        self.steps = []  # {"step", "ms", "ttft_ms"}
+        self.error = None
+
+    def _step(self, name, action):
+        start = time.perf_counter()
+        ttft = action()
+        self.steps.append({"step": name, "ms": (time.perf_counter() - start) * 1000, "ttft_ms": ttft * 1000 if ttft is not None else None})
+
+    def run(self):
+        rnd = self.random
+        try:
+            with httpx.Client(base_url=self.url, timeout=120) as client:
+                session_id = client.post("/v1/sessions").raise_for_status().json()["session_id"]
+                base = f"/v1/sessions/{session_id}"
+
+                def answer(**answers):
+                    client.post(f"{base}/answers", json=answers).raise_for_status()
+
+                def streamed(path, body=None):
+                    with client.stream("POST", f"{base}/{path}", params={"stream": "true"}, json=body) as response:
+                        response.raise_for_status()
+                        return read_events(response)[1]
+
+                self._step("lead", lambda: answer(name=f"Api {self.index}", email=f"api{self.index}@example.com", goal=rnd.choice(self.options["goal"])))
+                self._step("struggle", lambda: answer(struggle=rnd.choice(self.options["struggle"])))
+                self._step("timeline", lambda: answer(timeline=rnd.choice(self.options["timeline"])))
+                self._step("summary", lambda: streamed("summary"))
+                self._step("meal_plan", lambda: streamed("meal-plan", {"preferences": rnd.choice(MEAL_INPUTS)}))
+                for _ in range(self.chat_turns):
+                    self._step("chat_turn", lambda: streamed("chat", {"message": rnd.choice(CHAT_MESSAGES)}))
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        return self
+
+
+def summarize(sessions):
+    report = {}
+    for step in STEPS:
+        entries = [entry for session in sessions for entry in session.steps if entry["step"] == step]
+        if not entries:
+            continue
+        timings = [entry["ms"] for entry in entries]
+        ttfts = [entry["ttft_ms"] for entry in entries if entry["ttft_ms"] is not None]
+        report[step] = {
+            "count": len(entries),
+            "p50_ms": round(percentile(timings, 50), 1),
+            "p95_ms": round(percentile(timings, 95), 1),
+            "p99_ms": round(percentile(timings, 99), 1),
+            "mean_ms": round(statistics.mean(timings), 1),
+            "ttft_p50_ms": round(percentile(ttfts, 50), 1) if ttfts else None,
+        }
+    return report
+
+
+def walk(sessions, concurrency, make):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        done = list(pool.map(lambda i: make(i).run(), range(sessions)))
+    return done, time.perf_counter() - started
+
+
+def throughput(sessions, wall):
+    ok = sum(session.error is None for session in sessions)
+    return {"sessions_ok": ok, "wall_s": round(wall, 2), "sessions_per_min": round(ok / wall * 60, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API throughput against a local mock OpenAI server")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--chat-turns", type=int, default=3)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-sec", type=float, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", action="store_true", help="also walk the Streamlit app (scenarios.py)")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/api-<timestamp>.json)")
+    args = parser.parse_args()
+
+    mock = MockOpenAI(args.ttft_ms, tokens_per_sec=args.tokens_per_sec, seed=args.seed)
+    base_url = mock.start()
+    env = dict(os.environ, OPENAI_API_KEY="mock", OPENAI_BASE_URL=base_url, FITX_CACHE_DIR=tempfile.mkdtemp(prefix="fitx-api-"))
+    server, url = start_api(args.workers, env)
+    try:
+        options = httpx.get(f"{url}/v1/options").json()
+        sessions, wall = walk(args.sessions, args.concurrency, lambda i: ApiSession(i, url, options, args.chat_turns, seed=args.seed * 100003 + i))
+    finally:
+        server.terminate()
+        server.wait()
+    api_calls = mock.stats["requests"]
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "api": {**throughput(sessions, wall), "upstream_calls": api_calls, "steps": summarize(sessions)},
+        "errors": [f"api session {session.index}: {session.error}" for session in sessions if session.error],
+    }
+
+    if args.compare:
+        # In this process, with its own caches, so neither run warms the other
+        os.environ.update(OPENAI_API_KEY="mock", OPENAI_BASE_URL=base_url, FITX_CACHE_DIR=tempfile.mkdtemp(prefix="fitx-st-"))
+        from scenarios import Session
+
+        sessions, wall = walk(args.sessions, args.concurrency, lambda i: Session(i, args.chat_turns, seed=args.seed * 100003 + i))
+        result["streamlit"] = {**throughput(sessions, wall), "upstream_calls": mock.stats["requests"] - api_calls}
+        result["errors"] += [f"streamlit session {session.index}: {session.error}" for session in sessions if session.error]
+    mock.stop()
+
+    out = args.out or os.path.join(RESULTS_DIR, "api-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{'front end':<12}{'sessions':>10}{'wall s':>9}{'sessions/min':>14}{'upstream':>10}")
+    for name in ("api", "streamlit"):
+        if name in result:
+            row = result[name]
+            print(f"{name:<12}{row['sessions_ok']:>10}{row['wall_s']:>9}{row['sessions_per_min']:>14}{row['upstream_calls']:>10}")
+    print(f"\n{'api step':<12}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttft p50':>10}")
+    for step, row in result["api"]["steps"].items():
+        print(f"{step:<12}{row['count']:>5}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{str(row['ttft_p50_ms'] or '-'):>10}")
+    for error in result["errors"]:
+        print(error)
+    print(f"Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import gc
+import json
+import math
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Capacity test for one Streamlit process: ramps the number of concurrent users walking
+# fitxfearless_full_app.py (scenarios.py, one shared runtime like a single server
+# process) against the latency-injected mock OpenAI server, one level at a time, and
+# records per level (the mock runs in its own process, so none of this is its load):
+# - memory: process RSS with the level's sessions still held (their session_state,
+#   histories and rendered voice components), fitted across levels into a baseline plus
+#   MB per session
+# - threads: steps in flight (script threads busy), live threads and CPU cores used; a
+#   Python process tops out near one core, so cpu_cores close to 1.0 means script runs
+#   are queueing on the GIL rather than waiting on OpenAI
+# - latency: p50/p95 of the steps that only rerun the script (no model call) and of the
+#   model-bound steps, plus errors and calls shed by admission control
+# A level fails when errors, shed calls, either p95 or peak RSS exceed their limits; the
+# ramp stops at the first failure (--keep-going runs every level). The report sizes
+# replicas for a target number of concurrent sessions.
+#   python benchmarks/capacity.py --levels 5,10,20,40,80 --think-ms 2000 --target-sessions 500
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, BENCH_DIR)
+
+from api_bench import free_port  # noqa: E402
+from run import percentile  # noqa: E402
+
+# Steps that only rerun the script: what every click costs, whatever OpenAI is doing
+RERUN_STEPS = ("lead", "struggle", "summary_rerun", "confirm_email", "open_chat")
+MODEL_STEPS = ("timeline", "meal_plan", "chat_turn")
+SAMPLE_INTERVAL = 0.05
+
+
+def start_mock(args):
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, "mock_openai.py"), "--port", str(port),
+               "--ttft-ms", str(args.ttft_ms), "--tokens-per-sec", str(args.tokens_per_sec), "--seed", str(args.seed)]
+    if args.rpm:
+        command += ["--rpm", str(args.rpm)]
+    mock = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return mock, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            if mock.poll() is not None:
+                raise RuntimeError("mock OpenAI server exited during startup")
+            time.sleep(0.1)
+    mock.terminate()
+    raise RuntimeError("mock OpenAI server did not come up within 30s")
+
+
+def rss_bytes():
+    # Current resident set size (Linux); peak RSS elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Sampler:
+    # Background sampling of RSS, live threads and steps in flight during one level
+    def __init__(self):
+        self.in_flight = 0
+        self.samples = []  # (rss, threads, in_flight)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.samples.append((rss_bytes(), threading.active_count(), self.in_flight))
+
+    def start(self):
+        self.samples = []
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="capacity-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def step_stats(sessions, steps):
+    timings = [entry["ms"] for session in sessions for entry in session.steps if entry["step"] in steps]
+    if not timings:
+        return {"count": 0, "p50_ms": None, "p95_ms": None}
+    return {"count": len(timings), "p50_ms": round(percentile(timings, 50), 1), "p95_ms": round(percentile(timings, 95), 1)}
+
+
+def run_level(users, sampler, make_session, shed_total):
+    gc.collect()
+    rss_before = rss_bytes()
+    shed_before = shed_total()
+    cpu_before = time.process_time()
+    sampler.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        sessions = list(pool.map(lambda i: make_session(i).run(), range(users)))
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    sampler.stop()
+    gc.collect()
+    rss_held = rss_bytes()  # the level's sessions are still referenced here
+
+    samples = sampler.samples or [(rss_held, threading.active_count(), 0)]
+    errors = [session.error for session in sessions if session.error]
+    steps = sum(len(session.steps) for session in sessions)
+    level = {
+        "users": users,
+        "wall_s": round(wall, 2),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / users, 3),
+        "shed": shed_total() - shed_before,
+        "steps": steps,
+        "rerun": step_stats(sessions, RERUN_STEPS),
+        "model": step_stats(sessions, MODEL_STEPS),
+        "rss_before_mb": round(rss_before / 2**20, 1),
+        "rss_held_mb": round(rss_held / 2**20, 1),
+        "rss_peak_mb": round(max(sample[0] for sample in samples) / 2**20, 1),
+        "threads_peak": max(sample[1] for sample in samples),
+        "in_flight_mean": round(statistics.mean(sample[2] for sample in samples), 2),
+        "in_flight_peak": max(sample[2] for sample in samples),
+        "script_thread_busy": round(statistics.mean(sample[2] for sample in samples) / users, 2),
+        "cpu_cores": round(cpu / wall, 2),
+        "error_samples": errors[:3],
+    }
+    return level, sessions
+
+
+def failures(level, args):
+    reasons = []
+    if level["error_rate"] > args.max_error_rate:
+        reasons.append(f"error rate {level['error_rate']:.0%} > {args.max_error_rate:.0%}")
+    if level["shed"] / max(1, level["steps"]) > args.max_shed_rate:
+        reasons.append(f"{level['shed']} calls shed")
+    p95 = level["rerun"]["p95_ms"]
+    if p95 is not None and p95 > args.rerun_slo_ms:
+        reasons.append(f"rerun p95 {p95:.0f} ms > {args.rerun_slo_ms:.0f} ms")
+    p95 = level["model"]["p95_ms"]
+    if p95 is not None and p95 > args.model_slo_ms:
+        reasons.append(f"model step p95 {p95:.0f} ms > {args.model_slo_ms:.0f} ms")
+    if args.replica_memory_mb and level["rss_peak_mb"] > args.replica_memory_mb:
+        reasons.append(f"peak RSS {level['rss_peak_mb']:.0f} MB > {args.replica_memory_mb:.0f} MB")
+    return reasons
+
+
+def memory_fit(levels):
+    # Baseline and MB per held session, fitted over (users, RSS with the sessions held)
+    if len(levels) < 2:
+        level = levels[0]
+        return level["rss_before_mb"], max(0.0, (level["rss_held_mb"] - level["rss_before_mb"]) / level["users"])
+    slope, intercept = statistics.linear_regression([level["users"] for level in levels], [level["rss_held_mb"] for level in levels])
+    return intercept, max(0.0, slope)
+
+
+def size_replicas(levels, args):
+    passing = [level for level in levels if not level["failures"]]
+    baseline_mb, per_session_mb = memory_fit(levels)
+    report = {"baseline_mb": round(baseline_mb, 1), "per_session_mb": round(per_session_mb, 3)}
+    if not passing:
+        report.update(sessions_per_replica=0, limited_by="the smallest level already fails", replicas=None)
+        return report
+    by_latency = max(level["users"] for level in passing)
+    limits = {"latency/errors": by_latency}
+    if args.replica_memory_mb and per_session_mb:
+        limits["memory"] = int((args.replica_memory_mb - baseline_mb) / per_session_mb)
+    limited_by = min(limits, key=limits.get)
+    tested_up_to = levels[-1]["users"] if not levels[-1]["failures"] else None
+    sessions_per_replica = max(1, int(limits[limited_by] * args.headroom))
+    report.update(
+        max_passing_users=by_latency,
+        first_failure=next(({"users": level["users"], "reasons": level["failures"]} for level in levels if level["failures"]), None),
+        untested_above=tested_up_to,  # every level passed: the real limit is higher
+        limits=limits,
+        limited_by=limited_by,
+        headroom=args.headroom,
+        sessions_per_replica=sessions_per_replica,
+        replicas=math.ceil(args.target_sessions / sessions_per_replica) if args.target_sessions else None,
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session capacity of one Streamlit process against a mock OpenAI server")
+    parser.add_argument("--levels", default="5,10,20,40", help="concurrent users per level, ascending")
+    parser.add_argument("--chat-turns", type=int, default=3)
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause before each step (0: users click as fast as the app answers)")
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-sec", type=float, default=40)
+    parser.add_argument("--rpm", type=int, help="rate limit the mock enforces (requests per minute)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rerun-slo-ms", type=float, default=1000, help="p95 limit for steps that only rerun the script")
+    parser.add_argument("--model-slo-ms", type=float, default=10000, help="p95 limit for steps that wait on the model")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-shed-rate", type=float, default=0.05, help="calls shed by admission control per step")
+    parser.add_argument("--replica-memory-mb", type=float, help="memory limit of one replica")
+    parser.add_argument("--headroom", type=float, default=0.7, help="share of the measured limit to plan for")
+    parser.add_argument("--target-sessions", type=int, help="concurrent sessions to size replicas for")
+    parser.add_argument("--keep-going", action="store_true", help="run every level, even after one fails")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/capacity-<timestamp>.json)")
+    args = parser.parse_args()
+    user_levels = sorted(int(level) for level in args.levels.split(","))
+
+    mock, base_url = start_mock(args)
+    # Must be set before the app creates its shared client and caches
+    os.environ.update(OPENAI_API_KEY="mock", OPENAI_BASE_URL=base_url, FITX_CACHE_DIR=tempfile.mkdtemp(prefix="fitx-capacity-"))
+    from scenarios import Session
+    from llm_metrics import get_metrics
+
+    sampler = Sampler()
+
+    class LoadSession(Session):
+        def _step(self, name, action):
+            if args.think_ms:
+                time.sleep(args.think_ms / 1000 * self.random.uniform(0.5, 1.5))
+            sampler.enter()
+            try:
+                super()._step(name, action)
+            finally:
+                sampler.exit()
+
+    def shed_total():
+        return sum(get_metrics().counters["fitx_llm_shed_total"].values())
+
+    # One warm-up session, so imports and script compilation are not charged to the first level
+    LoadSession(-1, 0, seed=args.seed).run()
+
+    levels = []
+    offset = 0
+    for users in user_levels:
+        level, sessions = run_level(users, sampler, lambda i: LoadSession(offset + i, args.chat_turns, seed=args.seed * 100003 + offset + i), shed_total)
+        offset += users
+        del sessions
+        levels.append(level)
+        level["failures"] = failures(level, args)
+        status = "FAIL: " + "; ".join(level["failures"]) if level["failures"] else "ok"
+        print(f"{users:>5} users  rerun p95 {level['rerun']['p95_ms']} ms  model p95 {level['model']['p95_ms']} ms  "
+              f"RSS {level['rss_held_mb']} MB  cpu {level['cpu_cores']}  {status}", flush=True)
+        if level["failures"] and not args.keep_going:
+            break
+    mock.terminate()
+    mock.wait()
+
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "levels": levels,
+        "capacity": size_replicas(levels, args),
+        "upstream_calls": sum(get_metrics().counters["fitx_llm_calls_total"].values()),
+    }
+    out = args.out or os.path.join(RESULTS_DIR, "capacity-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\n{'users':>6}{'rerun p50':>11}{'rerun p95':>11}{'model p95':>11}{'errors':>8}{'shed':>6}{'RSS MB':>8}{'threads':>9}{'busy':>6}{'cpu':>6}")
+    for level in levels:
+        print(f"{level['users']:>6}{str(level['rerun']['p50_ms']):>11}{str(level['rerun']['p95_ms']):>11}{str(level['model']['p95_ms']):>11}"
+              f"{level['errors']:>8}{level['shed']:>6}{level['rss_held_mb']:>8}{level['threads_peak']:>9}{level['script_thread_busy']:>6}{level['cpu_cores']:>6}")
+    capacity = result["capacity"]
+    print(f"\nmemory: {capacity['baseline_mb']} MB baseline + {capacity['per_session_mb']} MB per session")
+    if capacity["sessions_per_replica"]:
+        print(f"capacity: {capacity['max_passing_users']} concurrent users passed; limited by {capacity['limited_by']} "
+              f"-> plan {capacity['sessions_per_replica']} sessions per replica ({capacity['headroom']:.0%} headroom)")
+        if capacity["untested_above"]:
+            print(f"every level passed: the limit is above {capacity['untested_above']} users, add higher --levels")
+        if capacity["first_failure"]:
+            print(f"first failure at {capacity['first_failure']['users']} users: " + "; ".join(capacity["first_failure"]["reasons"]))
+        if capacity["replicas"]:
+            print(f"{args.target_sessions} concurrent sessions -> {capacity['replicas']} replicas")
+    else:
+        print(f"capacity: {capacity['limited_by']}")
+    print(f"Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Session-state memory: chat histories as lists of dicts vs. MessageStore, resident and
+# spilled. Every session gets its own message strings, as real sessions do.
+#   python benchmarks/memory.py --sessions 1000 --turns 50
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_store import MessageStore, MessageSpool  # noqa: E402
+
+SYSTEM_PROMPT = "You are Lex, a friendly, motivating AI fitness coach for FitxFearless. " * 4
+WORDS = "squats protein sleep cardio recovery lunges meal plan water stretch goal progress rest week reps".split()
+
+
+def conversation(rng, turns):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for _ in range(turns):
+        messages.append({"role": "user", "content": " ".join(rng.choices(WORDS, k=rng.randint(5, 25)))})
+        messages.append({"role": "assistant", "content": " ".join(rng.choices(WORDS, k=rng.randint(30, 60)))})
+    return messages
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    sessions = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return sessions, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chat history memory per layout")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=50, help="user/assistant exchanges per session")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    messages = args.sessions * (args.turns * 2 + 1)
+
+    def dicts():
+        rng = random.Random(args.seed)
+        return [conversation(rng, args.turns) for _ in range(args.sessions)]
+
+    def stores():
+        rng = random.Random(args.seed)
+        return [MessageStore(conversation(rng, args.turns), spool=False) for _ in range(args.sessions)]
+
+    rows = []
+    sessions, size, elapsed = measure(dicts)
+    rows.append(("list of dicts", size, elapsed))
+    del sessions
+    sessions, size, elapsed = measure(stores)
+    rows.append(("MessageStore", size, elapsed))
+
+    spool = MessageSpool(idle_seconds=0, directory=tempfile.mkdtemp(prefix="fitx-spill-"))
+    for store in sessions:
+        spool.register(store)
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    spool.sweep()
+    spill_time = time.perf_counter() - started
+    spilled = sum(sys.getsizeof(store) + sys.getsizeof(store._roles) for store in sessions)
+    tracemalloc.stop()
+    rows.append(("MessageStore, spilled", spilled, spill_time))
+
+    started = time.perf_counter()
+    for store in sessions:
+        store.messages()
+    rehydrate = time.perf_counter() - started
+
+    print(f"{args.sessions} sessions x {args.turns} turns ({messages} messages)")
+    print(f"{'layout':<24}{'total MB':>10}{'per session KB':>16}{'build/spill s':>15}")
+    for name, size, elapsed in rows:
+        print(f"{name:<24}{size / 2**20:>10.1f}{size / args.sessions / 1024:>16.1f}{elapsed:>15.2f}")
+    saved = rows[0][1] - rows[1][1]
+    print(f"\nresident saving {saved / 2**20:.1f} MB ({saved / rows[0][1]:.0%}), {saved / messages:.0f} bytes per message")
+    print(f"rehydrating all sessions took {rehydrate:.2f}s ({rehydrate / args.sessions * 1000:.2f} ms per session)")
+
+
+if __name__ == "__main__":
+    main()
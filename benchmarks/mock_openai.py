@@ -0,0 +1,258 @@
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI chat completions API.
+# Returns canned completions (summary, meal plan, context summary or chat reply, picked
+# from the request) with a log-normal time-to-first-token and a normally distributed
+# token rate, in both streaming (SSE) and non-streaming modes. Small models ("mini" in the
+# name) answer `small_model_speedup` times faster. With `rpm` set it enforces a requests-per-
+# minute limit like the real API: x-ratelimit-* headers on every response and a 429 with
+# Retry-After once the sliding one-minute window is full. With `long_meal_plans` the meal
+# plan runs past the apps' 300-token cap, like verbose real plans; a continuation request
+# (the cut-off reply sent back as the assistant turn) gets the rest. Requests for a JSON object
+# (response_format) get the meal plan phrasing the local planner asks for. Point the apps at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+#   python benchmarks/mock_openai.py --port 8765 --ttft-ms 400 --tokens-per-sec 40
+
+SUMMARY = (
+    "You're off to a great start! 💪 Your goal is clear, and knowing what holds you back is half the battle. "
+    "Start with three short sessions a week, keep your meals simple and protein-rich, and track one small win every day. "
+    "Stay consistent and you'll see real progress on your timeline."
+)
+MEAL_PLAN = (
+    "Day 1:\n- Breakfast: Greek yogurt with berries and oats\n- Lunch: Quinoa salad with chickpeas and spinach\n- Dinner: Baked salmon with roasted vegetables\n\n"
+    "Day 2:\n- Breakfast: Veggie omelette with wholegrain toast\n- Lunch: Turkey and avocado wrap\n- Dinner: Stir-fried tofu with brown rice\n\n"
+    "Day 3:\n- Breakfast: Overnight oats with chia seeds\n- Lunch: Lentil soup with a side salad\n- Dinner: Grilled chicken with sweet potato and greens"
+)
+MEAL_PREP_NOTE = " - prep it the night before, keep the portion about the size of your palm, add a handful of greens and drink a big glass of water with it"
+MEAL_PLAN_LONG = "\n".join(line + MEAL_PREP_NOTE if line.startswith("- ") else line for line in MEAL_PLAN.split("\n"))
+MEAL_PLAN_VOICE = json.dumps({
+    "intro": "Here's your 3-day plan, built around what you eat! 🥗",
+    "days": [
+        "Cook a double batch of lunch tonight and you're set for tomorrow.",
+        "Prep breakfast the night before so busy mornings stay on track.",
+        "Swap any side for extra greens if you're still hungry.",
+    ],
+    "outro": "Stick with it for three days and you'll feel the difference! 💪",
+}, ensure_ascii=False)
+CONTEXT_SUMMARY = "The user wants to get fitter, trains three times a week and asked about legs and protein. Lex suggested progressive overload."
+CHAT_REPLY = "Love that energy! 🔥 Try 3 sets of 10 squats, lunges and push-ups today, then rest a minute between sets. You've got this!"
+
+
+def canned_reply(body, long_meal_plans=False):
+    messages = body.get("messages", [])
+    if len(messages) >= 2 and messages[-2]["role"] == "assistant" and "cut off" in messages[-1]["content"]:
+        # A continuation: the rest of whichever reply was cut off
+        partial = messages[-2]["content"]
+        for full in (MEAL_PLAN_LONG, MEAL_PLAN, SUMMARY, CHAT_REPLY):
+            if full.startswith(partial):
+                return full[len(partial):]
+        return CHAT_REPLY
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return MEAL_PLAN_VOICE
+    prompt = json.dumps(messages)
+    if "meal plan" in prompt.lower():
+        return MEAL_PLAN_LONG if long_meal_plans else MEAL_PLAN
+    if "running summary" in prompt:
+        return CONTEXT_SUMMARY
+    if "Goal:" in prompt and "Timeline:" in prompt and body.get("max_tokens") == 150:
+        return SUMMARY
+    return CHAT_REPLY
+
+
+def tokenize(text):
+    # Rough word-level chunks, close enough to how completions stream
+    words = text.split(" ")
+    return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+
+class MockOpenAI:
+    def __init__(self, ttft_ms=400, ttft_sigma=0.3, tokens_per_sec=40, tokens_per_sec_jitter=8, seed=None, small_model_speedup=2.0, rpm=None, long_meal_plans=False):
+        self.ttft_ms = ttft_ms
+        self.long_meal_plans = long_meal_plans
+        self.rpm = rpm
+        self.admitted = collections.deque()  # arrival times inside the current minute
+        self.small_model_speedup = small_model_speedup
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.tokens_per_sec_jitter = tokens_per_sec_jitter
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "streamed": 0, "completion_tokens": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def speedup(self, model):
+        return self.small_model_speedup if "mini" in model else 1.0
+
+    def sample_ttft(self, model):
+        with self._lock:
+            ttft = self.ttft_ms / 1000 * self.random.lognormvariate(0, self.ttft_sigma) if self.ttft_ms else 0.0
+        return ttft / self.speedup(model)
+
+    def sample_token_delay(self, model):
+        with self._lock:
+            rate = max(1.0, self.random.gauss(self.tokens_per_sec, self.tokens_per_sec_jitter))
+        return 1.0 / (rate * self.speedup(model)) if self.tokens_per_sec else 0.0
+
+    def admit(self):
+        # (admitted, rate-limit headers); sliding one-minute window over admitted requests
+        if not self.rpm:
+            return True, {}
+        with self._lock:
+            now = time.monotonic()
+            while self.admitted and now - self.admitted[0] >= 60:
+                self.admitted.popleft()
+            admitted = len(self.admitted) < self.rpm
+            if admitted:
+                self.admitted.append(now)
+            else:
+                self.stats["rate_limited"] += 1
+            reset = 60 - (now - self.admitted[0]) if self.admitted else 0.0
+            headers = {
+                "x-ratelimit-limit-requests": str(self.rpm),
+                "x-ratelimit-remaining-requests": str(self.rpm - len(self.admitted)),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            }
+        if not admitted:
+            headers["retry-after-ms"] = str(int(reset * 1000))
+        return admitted, headers
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                admitted, self.rate_headers = mock.admit()
+                if not admitted:
+                    self._json({"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}}, 429)
+                    return
+                full = tokenize(canned_reply(body, mock.long_meal_plans))
+                chunks = full[:body.get("max_tokens") or len(full)]
+                finish_reason = "stop" if len(chunks) == len(full) else "length"
+                prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(chunks),
+                    "total_tokens": prompt_tokens + len(chunks),
+                    "prompt_tokens_details": {"cached_tokens": 0},
+                }
+                with mock._lock:
+                    mock.stats["requests"] += 1
+                    mock.stats["streamed"] += bool(body.get("stream"))
+                    mock.stats["completion_tokens"] += len(chunks)
+
+                completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+                model = body.get("model", "gpt-4")
+                time.sleep(mock.sample_ttft(model))
+                if body.get("stream"):
+                    self._stream(completion_id, model, chunks, finish_reason, usage, body)
+                else:
+                    for _ in chunks[1:]:
+                        time.sleep(mock.sample_token_delay(model))
+                    self._json({
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(chunks)}, "finish_reason": finish_reason}],
+                        "usage": usage,
+                    })
+
+            def _headers(self, status=200):
+                self.send_response(status)
+                for name, value in self.rate_headers.items():
+                    self.send_header(name, value)
+
+            def _json(self, payload, status=200):
+                data = json.dumps(payload).encode("utf-8")
+                self._headers(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, completion_id, model, chunks, finish_reason, usage, body):
+                self._headers()
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")  # keeps the connection reusable
+                self.end_headers()
+
+                def write(data):
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+
+                def event(choices, extra=None):
+                    payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": choices}
+                    payload.update(extra or {})
+                    write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+                try:
+                    for i, chunk in enumerate(chunks):
+                        if i:
+                            time.sleep(mock.sample_token_delay(model))
+                        delta = {"role": "assistant", "content": chunk} if i == 0 else {"content": chunk}
+                        event([{"index": 0, "delta": delta, "finish_reason": None}])
+                    event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        event([], {"usage": usage})
+                    write(b"data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # client cancelled the stream
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="mock-openai", daemon=True).start()
+        return self.base_url
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=400, help="median time to first token")
+    parser.add_argument("--ttft-sigma", type=float, default=0.3, help="log-normal spread of time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=40)
+    parser.add_argument("--tokens-per-sec-jitter", type=float, default=8)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--small-model-speedup", type=float, default=2.0)
+    parser.add_argument("--rpm", type=int, help="requests per minute before answering 429")
+    parser.add_argument("--long-meal-plans", action="store_true", help="meal plans longer than the 300-token cap")
+    args = parser.parse_args()
+
+    server = MockOpenAI(args.ttft_ms, args.ttft_sigma, args.tokens_per_sec, args.tokens_per_sec_jitter, args.seed, args.small_model_speedup, args.rpm, args.long_meal_plans)
+    print(f"Mock OpenAI listening on {server.start(args.host, args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Offline load driver: starts the mock OpenAI server, walks N funnel sessions through
+# fitxfearless_full_app.py with a given concurrency, and writes p50/p95/p99 per step plus
+# script runs per step to benchmarks/results/<timestamp>.json. --profile adds import times
+# and script-run latency per step (see profiling.py).
+#   python benchmarks/run.py --sessions 20 --concurrency 5 --ttft-ms 400 --tokens-per-sec 40
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, BENCH_DIR)
+
+from mock_openai import MockOpenAI  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(sessions, steps):
+    report = {}
+    for step in steps:
+        entries = [entry for session in sessions for entry in session.steps if entry["step"] == step]
+        if not entries:
+            continue
+        timings = [entry["ms"] for entry in entries]
+        report[step] = {
+            "count": len(entries),
+            "p50_ms": round(percentile(timings, 50), 1),
+            "p95_ms": round(percentile(timings, 95), 1),
+            "p99_ms": round(percentile(timings, 99), 1),
+            "mean_ms": round(statistics.mean(timings), 1),
+            "paint_p50_ms": round(percentile([entry["paint_ms"] for entry in entries], 50), 1),
+            "runs_per_step": round(statistics.mean(entry["runs"] for entry in entries), 2),
+            "reruns_per_step": round(statistics.mean(max(0, entry["runs"] - 1) for entry in entries), 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline funnel benchmark against a local mock OpenAI server")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--chat-turns", type=int, default=3)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--ttft-sigma", type=float, default=0.3)
+    parser.add_argument("--tokens-per-sec", type=float, default=40)
+    parser.add_argument("--tokens-per-sec-jitter", type=float, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--small-model-speedup", type=float, default=2.0)
+    parser.add_argument("--rpm", type=int, help="rate limit the mock enforces (requests per minute)")
+    parser.add_argument("--long-meal-plans", action="store_true", help="mock meal plans run past the max_tokens cap")
+    parser.add_argument("--profile", action="store_true", help="time imports and script runs per step (FITX_PROFILE=1)")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    mock = MockOpenAI(args.ttft_ms, args.ttft_sigma, args.tokens_per_sec, args.tokens_per_sec_jitter, args.seed, args.small_model_speedup, args.rpm, args.long_meal_plans)
+    cache_dir = tempfile.mkdtemp(prefix="fitx-bench-")
+    # Must be set before the apps create their shared client and caches
+    os.environ.update(OPENAI_API_KEY="mock", OPENAI_BASE_URL=mock.start(), FITX_CACHE_DIR=cache_dir)
+    if args.profile:
+        os.environ["FITX_PROFILE"] = "1"
+        sys.path.insert(0, os.path.dirname(BENCH_DIR))
+        import profiling  # noqa: F401  first, so its import hook sees every app module
+
+    from scenarios import STEPS, Session  # puts the repo root on sys.path
+    from llm_metrics import get_metrics
+    from model_router import route_report
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        sessions = list(pool.map(
+            lambda i: Session(i, args.chat_turns, seed=args.seed * 100003 + i).run(),
+            range(args.sessions),
+        ))
+    wall = time.perf_counter() - started
+    mock.stop()
+
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "wall_s": round(wall, 2),
+        "sessions_ok": sum(session.error is None for session in sessions),
+        "errors": [f"session {session.index}: {session.error}" for session in sessions if session.error],
+        "upstream": mock.stats,
+        "steps": summarize(sessions, STEPS),
+        "routes": route_report(),
+        "throughput_rpm": round(mock.stats["requests"] / wall * 60, 1),
+        "shed": {f"{site}/{reason}": count for (site, reason), count in get_metrics().counters["fitx_llm_shed_total"].items()},
+        "prefetch_hit_rate": {kind: round(get_metrics().hit_rate(kind), 2) for kind in ("meal_plan", "chat_opener")},
+        "continuations": {f"{site}/{outcome}": count for (site, outcome), count in get_metrics().counters["fitx_llm_continuations_total"].items()},
+        "regenerations_saved": get_metrics().regenerations_saved(),
+        "meal_plan_sources": get_metrics().meal_plan_sources(),
+    }
+    if args.profile:
+        result["profile"] = profiling.report()
+
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{result['sessions_ok']}/{args.sessions} sessions ok in {wall:.1f}s, {mock.stats['requests']} upstream calls "
+          f"({result['throughput_rpm']}/min, {mock.stats['rate_limited']} rate limited)")
+    print(f"{'step':<15}{'n':>5}{'paint p50':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'reruns':>8}")
+    for step, row in result["steps"].items():
+        print(f"{step:<15}{row['count']:>5}{row['paint_p50_ms']:>11}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['reruns_per_step']:>8}")
+    print(f"\n{'route':<28}{'calls':>6}{'p50 ms':>10}{'p95 ms':>10}{'tokens':>8}{'cost $':>10}")
+    for route in result["routes"]:
+        print(f"{route['site'] + ' / ' + route['model']:<28}{route['calls']:>6}{route['p50_ms']:>10}{route['p95_ms']:>10}{route['completion_tokens']:>8}{route['cost_usd']:>10.4f}")
+    print("\nprefetch hit rate: " + ", ".join(f"{kind} {rate:.0%}" for kind, rate in result["prefetch_hit_rate"].items()))
+    print("meal plans: " + (", ".join(f"{source} {count}" for source, count in result["meal_plan_sources"].items()) or "none"))
+    print("regenerations saved by continuations: " + (", ".join(f"{site} {count}" for site, count in result["regenerations_saved"].items()) or "none"))
+    if args.profile:
+        profile = result["profile"]
+        print(f"\nimports {profile['import_ms']} ms; heaviest: " + ", ".join(f"{row['module']} {row['self_ms']}" for row in profile["heaviest_imports"][:5]))
+        print(f"{'script run':<15}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for step, row in profile["steps"].items():
+            print(f"{step:<15}{row['runs']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['max_ms']:>10}")
+    for error in result["errors"]:
+        print(error)
+    print(f"Saved {out}")
+
+
+if __name__ == "__main__":
+    main()
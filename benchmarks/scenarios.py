@@ -0,0 +1,154 @@
+import contextlib
+import os
+import random
+import sys
+import time
+from unittest.mock import MagicMock
+
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner
+
+# AppTest-driven walk of the full funnel in fitxfearless_full_app.py:
+# lead form -> struggle -> timeline (+ summary) -> confirm email -> meal plan -> chat.
+# Each step records its wall time and how many script runs it took, so reruns that
+# slip back in (e.g. a transition that needs a second click) show up in the report.
+# LLM calls run as background jobs (jobs.py): a step's paint time is when its script run
+# returned, its wall time includes waiting for the jobs and the rerun that shows them.
+# Set OPENAI_BASE_URL / OPENAI_API_KEY before the first session, see run.py.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import funnel  # noqa: E402
+from coach import GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS  # noqa: E402
+
+APP = os.path.join(ROOT, "fitxfearless_full_app.py")
+STEPS = ("lead", "struggle", "timeline", "summary_rerun", "confirm_email", "meal_plan", "open_chat", "chat_turn")
+MEAL_INPUTS = ("", "vegetarian", "keto", "no dairy", "gluten free, no nuts", "high protein", "vegan")  # "" keeps the goal default
+CHAT_MESSAGES = (
+    "How many times a week should I train?",
+    "What should I eat before a workout?",
+    "I skipped yesterday, how do I get back on track?",
+    "Can you give me a quick leg workout?",
+    "How much protein do I need?",
+)
+
+_original_init = funnel.Funnel.__init__
+
+
+def _counting_init(self, state=None):
+    # Every script run builds exactly one Funnel, so this counts runs per session
+    _original_init(self, state)
+    self.state["_bench_runs"] = self.state.get("_bench_runs", 0) + 1
+
+
+funnel.Funnel.__init__ = _counting_init
+
+
+def _share_runtime():
+    # AppTest installs a mock Runtime, patches config and compiles the script into a fresh
+    # ScriptCache on every run, then resets the globals; with sessions on several threads one
+    # run would tear down another's (and concurrent compiles can crash the parser). Share one
+    # runtime and one script cache instead, like the single server process the sessions model.
+    script_cache = ScriptCache()
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type("SessionRuntime", (Runtime,), {})
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda options: contextlib.nullcontext()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    script_cache.get_bytecode(APP)  # compile up front, before sessions start in parallel
+
+
+_share_runtime()
+
+
+def _button(at, label):
+    return next(button for button in at.button if button.label.startswith(label))
+
+
+class Session:
+    def __init__(self, index, chat_turns=3, seed=None, timeout=60):
+        self.index = index
+        self.chat_turns = chat_turns
+        self.random = random.Random(seed)
+        self.timeout = timeout
+        self.steps = []  # {"step", "ms", "paint_ms", "runs", "ok"}
+        self.error = None
+        self.at = None
+
+    def _runs(self):
+        return self.at.session_state["_bench_runs"] if "_bench_runs" in self.at.session_state else 0
+
+    def _settle(self):
+        # In a browser, the fragment polling an unfinished job reruns the app once the job
+        # is done; AppTest has to be told to
+        if "jobs" not in self.at.session_state:
+            return
+        board = self.at.session_state["jobs"]
+        deadline = time.monotonic() + self.timeout
+        while board.busy() and not self.at.exception:
+            for job in list(board.jobs.values()):
+                if not job.wait(max(0.0, deadline - time.monotonic())):
+                    raise TimeoutError(f"{job.kind} job still running after {self.timeout}s")
+            self.at.run()
+
+    def _step(self, name, action):
+        runs = self._runs()
+        start = time.perf_counter()
+        action()
+        paint_ms = (time.perf_counter() - start) * 1000
+        runs = self._runs() - runs
+        self._settle()
+        ms = (time.perf_counter() - start) * 1000
+        ok = not self.at.exception
+        self.steps.append({"step": name, "ms": ms, "paint_ms": paint_ms, "runs": runs, "ok": ok})
+        if not ok:
+            raise RuntimeError(f"{name}: {self.at.exception[0].value}")
+
+    def run(self):
+        rnd = self.random
+        try:
+            self.at = AppTest.from_file(APP, default_timeout=self.timeout)
+            self.at.run()
+
+            def lead():
+                self.at.text_input[0].input(f"Bench {self.index}")
+                self.at.text_input[1].input(f"bench{self.index}@example.com")
+                self.at.selectbox[0].select(rnd.choice(GOAL_OPTIONS))
+                _button(self.at, "Start Coaching").click().run()
+
+            def struggle():
+                self.at.radio[0].set_value(rnd.choice(STRUGGLE_OPTIONS))
+                _button(self.at, "Next").click().run()
+
+            def timeline():
+                self.at.radio[0].set_value(rnd.choice(TIMELINE_OPTIONS))
+                _button(self.at, "Next").click().run()
+
+            def meal_plan():
+                self.at.text_input(key="meal_input").input(rnd.choice(MEAL_INPUTS))
+                _button(self.at, "Generate Meal Plan").click().run()
+
+            def chat_turn():
+                self.at.text_input(key="chat_input").input(rnd.choice(CHAT_MESSAGES)).run()
+
+            self._step("lead", lead)
+            self._step("struggle", struggle)
+            self._step("timeline", timeline)  # lands on step 3 and renders the summary
+            self._step("summary_rerun", self.at.run)  # any widget interaction reruns the summary
+            self._step("confirm_email", lambda: _button(self.at, "Send & Continue").click().run())
+            self._step("meal_plan", meal_plan)
+            self._step("open_chat", lambda: _button(self.at, "💬").click().run())
+            for _ in range(self.chat_turns):
+                self._step("chat_turn", chat_turn)
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+        return self
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+# Render time per rerun of the step 5 chat transcript: the old loop (one st.markdown per
+# message) vs. transcript.Transcript, at 10, 100 and 1,000 turns.
+#   python benchmarks/transcript_render.py [--reruns 20] [--json out.json]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def chat_page():
+    import streamlit as st
+    from transcript import Transcript
+
+    if st.session_state.mode == "legacy":
+        for msg in st.session_state.chat_history:
+            if msg["role"] == "user":
+                st.markdown(f"**You:** {msg['content']}")
+            elif msg["role"] == "assistant":
+                st.markdown(f"**Lex:** {msg['content']}")
+    else:
+        if "transcript" not in st.session_state:
+            st.session_state.transcript = Transcript()
+        st.session_state.transcript.render(st.session_state.chat_history)
+    st.text_input("Type your message here...", key="chat_input")
+
+
+def make_history(turns):
+    history = [{"role": "system", "content": "You are Lex."}]
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}: how many sets should I do for legs this week?"})
+        history.append({"role": "assistant", "content": f"Answer {i}: aim for 10–12 hard sets, spread over two sessions 💪 " * 3})
+    return history
+
+
+def measure(mode, turns, reruns):
+    at = AppTest.from_function(chat_page, default_timeout=120)
+    at.session_state["mode"] = mode
+    at.session_state["chat_history"] = make_history(turns)
+    at.run()  # first render builds any caches
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "mode": mode,
+        "turns": turns,
+        "elements": len(at.markdown),
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": round(statistics.median(timings), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chat transcript render time per rerun")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    results = [measure(mode, turns, args.reruns) for turns in args.turns for mode in ("legacy", "transcript")]
+    print(f"{'turns':>6} {'mode':>11} {'elements':>9} {'mean ms':>9} {'p50 ms':>8}")
+    for row in results:
+        print(f"{row['turns']:>6} {row['mode']:>11} {row['elements']:>9} {row['mean_ms']:>9} {row['p50_ms']:>8}")
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results, out, indent=2)
@@ -0,0 +1,212 @@
+import json
+import logging
+import re
+
+from admission import BUSY_MESSAGE, SHED_ERRORS
+from llm_metrics import get_metrics, record_cache
+from meal_cache import get_meal_cache
+from meal_planner import get_recipe_book, parse_voice, plan_meals, plan_outline, render_plan
+from model_router import get_router, routed_completion
+from prompt_layout import task_messages
+from summary_cache import get_summary_cache
+from summary_catalog import fingerprint, get_summary_catalog
+
+logger = logging.getLogger("fitx.coach")
+
+# Onboarding answer options (shared by the multi-step apps)
+GOAL_OPTIONS = ["🏋️‍♂️ Build muscle", "🔥 Lose fat", "🏃‍♀️ Improve endurance", "💪 Get in shape overall"]
+STRUGGLE_OPTIONS = ["⏳ Not enough time", "🥗 Struggle with diet", "💡 Lack of motivation", "🤷 Not sure what works for me"]
+TIMELINE_OPTIONS = ["✅ ASAP", "🗓️ Within a month", "📅 In 2–3 months"]
+
+# Meal plan preferences used when the user leaves the field blank (also what step 3 prefetches)
+DEFAULT_MEAL_INPUTS = dict(zip(GOAL_OPTIONS, ["high protein", "high protein, low carb", "balanced, carb-rich", "balanced"]))
+
+# Bump whenever a prompt changes so cached responses are not reused.
+# Models come from model_router; the routed model is part of each cache key.
+SUMMARY_PROMPT_VERSION = 2
+MEAL_PLAN_PROMPT_VERSION = 2
+MEAL_PLAN_VOICE_VERSION = 1
+MEAL_PLAN_VOICE_TOKENS = 160
+
+
+def is_valid_email(email):
+    pattern = r"^[\w\.-]+@[\w\.-]+\.\w+$"
+    return re.match(pattern, email)
+
+
+# Static instructions first and the user's answers last, so the prefix is cacheable
+SUMMARY_INSTRUCTIONS = """
+You are a helpful assistant acting as a friendly fitness coach.
+The user message contains the user’s answers about their goal, struggle and timeline.
+Write a warm, encouraging summary of their fitness journey and next steps.
+"""
+
+MEAL_PLAN_INSTRUCTIONS = """
+You are a helpful fitness meal planner.
+Create a simple 3-day meal plan for someone with the dietary preferences/restrictions given in the user message.
+"""
+
+# The local planner has already picked the meals; the model only adds Lex's words around them
+MEAL_PLAN_VOICE_INSTRUCTIONS = """
+You are Lex, a friendly, energetic fitness coach.
+The user message is a 3-day meal plan already chosen to fit the user's dietary preferences/restrictions.
+Do not add, remove or change any meal, and do not mention calories or macros.
+Reply with only a JSON object with these keys:
+- "intro": one short, upbeat sentence introducing the plan
+- "days": a list of three tips, one per day, each at most 15 words (prep, timing or a swap that keeps the restrictions)
+- "outro": one short motivating sentence
+"""
+
+
+# Shown when the summary can be neither served from a catalog/cache nor generated (overload)
+FALLBACK_SUMMARY = (
+    "{greeting}your goal is to {goal}, and your biggest hurdle right now is \"{struggle}\". "
+    "That's a great place to start! 💪 Pick two or three short workouts you can keep every week, "
+    "keep your meals simple, and you'll be on track to see results {timeline}."
+)
+
+
+def _plain(option):
+    # "🏋️‍♂️ Build muscle" -> "build muscle", "✅ ASAP" -> "ASAP"
+    text = re.sub(r"^[^\w]+", "", option).strip()
+    return text if text.isupper() else text[:1].lower() + text[1:]
+
+
+def fallback_summary(answers, name=None):
+    text = FALLBACK_SUMMARY.format(
+        greeting=f"{name}, " if name else "",
+        goal=_plain(answers["goal"]),
+        struggle=_plain(answers["struggle"]),
+        timeline=_plain(answers["timeline"]),
+    )
+    return text[:1].upper() + text[1:]
+
+
+def summary_messages(answers):
+    return task_messages(SUMMARY_INSTRUCTIONS, f"""
+Here are the user’s answers:
+Goal: {answers['goal']}
+Struggle: {answers['struggle']}
+Timeline: {answers['timeline']}
+""")
+
+
+def default_meal_input(goal):
+    return DEFAULT_MEAL_INPUTS.get(goal, "balanced")
+
+
+def summary_fingerprint():
+    # Identifies the option lists and prompt a summary catalog was built for
+    return fingerprint(GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS, SUMMARY_PROMPT_VERSION)
+
+
+# Generate personalized summary: from the precomputed catalog (personalised with `name`) when
+# one matches the current options, else from the summary cache, else live from OpenAI GPT.
+# A live completion is streamed through `render` (e.g. st.write_stream) if given.
+def generate_summary(client, answers, cache=None, render=None, name=None, catalog=None):
+    catalog = catalog or get_summary_catalog(summary_fingerprint())
+    summary = catalog.lookup(answers, name) if catalog else None
+    record_cache("summary_catalog", hit=summary is not None)
+    if summary is not None:
+        return summary
+
+    cache = cache or get_summary_cache()
+    messages = summary_messages(answers)
+    model = get_router().pick("summary", messages)
+    generated = []
+
+    def _generate():
+        generated.append(True)
+        return routed_completion(
+            client, "summary", messages,
+            render=render,
+            temperature=0.7,
+            max_tokens=150
+        ).text
+
+    try:
+        summary = cache.get_or_create(answers, model, SUMMARY_PROMPT_VERSION, _generate)
+    except SHED_ERRORS as exc:  # overloaded: a template summary, never cached
+        logger.warning("summary degraded to template: %s", type(exc).__name__)
+        return fallback_summary(answers, name)
+    record_cache("summary", hit=not generated)
+    return summary
+
+
+def meal_plan_messages(meal_input):
+    return task_messages(MEAL_PLAN_INSTRUCTIONS, f"Dietary preferences/restrictions: {meal_input}")
+
+
+def meal_plan_voice_messages(meal_input, plan):
+    request = json.dumps({"preferences": meal_input, "days": plan_outline(plan)}, ensure_ascii=False)
+    return task_messages(MEAL_PLAN_VOICE_INSTRUCTIONS, request)
+
+
+def _show(render, text):
+    # `render` takes a stream of deltas; a finished text is a single delta
+    if render is not None:
+        render(delta for delta in (text,))
+
+
+# Generate a 3-day meal plan, served from the meal-plan cache (exact or near-duplicate
+# preferences) when possible. On a miss the local planner assembles it from the recipe
+# dataset and the model only phrases it (a short JSON reply); preferences the planner
+# cannot honour get a free-prose plan streamed through `render`.
+def generate_meal_plan(client, meal_input, cache=None, render=None):
+    cache = cache or get_meal_cache()
+    plan = plan_meals(meal_input)
+    if plan is None:
+        return _prose_meal_plan(client, meal_input, cache, render)
+
+    messages = meal_plan_voice_messages(meal_input, plan)
+    namespace = f"{get_router().pick('meal_plan_voice', messages)}:planner:{get_recipe_book().fingerprint}:{MEAL_PLAN_VOICE_VERSION}"
+    meal_plan = cache.get(meal_input, namespace=namespace)
+    record_cache("meal_plan", hit=meal_plan is not None)
+    if meal_plan is not None:
+        return meal_plan
+
+    _show(render, render_plan(plan))  # complete already; the phrased version replaces it
+    try:
+        reply = routed_completion(
+            client, "meal_plan_voice", messages,
+            temperature=0.7,
+            max_tokens=MEAL_PLAN_VOICE_TOKENS,
+            response_format={"type": "json_object"}
+        ).text
+    except SHED_ERRORS as exc:  # overloaded: the plan without Lex's words, never cached
+        logger.warning("meal plan left unphrased: %s", type(exc).__name__)
+        get_metrics().observe_meal_plan("planner_unphrased")
+        return render_plan(plan)
+    voice = parse_voice(reply)
+    if voice is None:  # not retried on the large model (see model_router.NO_FALLBACK), never cached
+        logger.warning("meal plan phrasing is not the expected JSON, serving the plan unphrased")
+        get_metrics().observe_meal_plan("planner_unphrased")
+        return render_plan(plan)
+    meal_plan = render_plan(plan, voice)
+    _show(render, meal_plan)
+    get_metrics().observe_meal_plan("planner")
+    cache.set(meal_input, meal_plan, namespace=namespace)
+    return meal_plan
+
+
+def _prose_meal_plan(client, meal_input, cache, render):
+    messages = meal_plan_messages(meal_input)
+    namespace = f"{get_router().pick('meal_plan', messages)}:{MEAL_PLAN_PROMPT_VERSION}"
+    meal_plan = cache.get(meal_input, namespace=namespace)
+    record_cache("meal_plan", hit=meal_plan is not None)
+    if meal_plan is not None:
+        return meal_plan
+
+    try:
+        meal_plan = routed_completion(
+            client, "meal_plan", messages,
+            render=render,
+            temperature=0.7,
+            max_tokens=300
+        ).text
+    except SHED_ERRORS as exc:
+        logger.warning("meal plan degraded to busy message: %s", type(exc).__name__)
+        return BUSY_MESSAGE
+    get_metrics().observe_meal_plan("prose")
+    cache.set(meal_input, meal_plan, namespace=namespace)
+    return meal_plan
@@ -0,0 +1,121 @@
+import functools
+import logging
+import math
+import threading
+
+from llm_stream import stream_completion
+from model_router import routed_completion
+from prompt_layout import chat_messages, task_messages
+
+try:
+    import tiktoken
+except ImportError:  # budgeting falls back to a character estimate
+    tiktoken = None
+
+# Bounded, token-budgeted view of a chat history.
+# The full transcript stays in session state for display; only the view built here
+# is sent to the model: pinned system prompt + user profile, a rolling summary of
+# older turns, and the most recent turns verbatim (laid out by prompt_layout so the
+# static prefix stays cacheable; folding in batches keeps the prefix stable between folds).
+
+logger = logging.getLogger("fitx.context")
+
+DEFAULT_MODEL = "gpt-4"
+DEFAULT_KEEP_TURNS = 6  # user/assistant exchanges kept verbatim
+DEFAULT_FOLD_EVERY = 4  # fold older exchanges in batches so summarizing is not a per-turn call
+DEFAULT_MAX_PROMPT_TOKENS = 3000
+TOKENS_PER_MESSAGE = 3  # chat format overhead per message
+TOKENS_PER_REPLY = 3  # every reply is primed with <|start|>assistant<|message|>
+
+SUMMARY_INSTRUCTIONS = """
+You maintain a running summary of a coaching chat between a user and Lex, their fitness coach.
+Update the existing summary with the new messages below. Keep facts the coach needs later:
+the user's goals, constraints, preferences, progress and any advice already given.
+Reply with the updated summary only, in at most 120 words.
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # BPE files unavailable (e.g. offline)
+        return None
+
+
+def count_text_tokens(text, model=DEFAULT_MODEL):
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages, model=DEFAULT_MODEL):
+    total = TOKENS_PER_REPLY
+    for msg in messages:
+        total += TOKENS_PER_MESSAGE + count_text_tokens(msg["role"], model) + count_text_tokens(msg["content"], model)
+    return total
+
+
+class ContextWindow:
+    def __init__(self, model=DEFAULT_MODEL, keep_turns=DEFAULT_KEEP_TURNS, fold_every=DEFAULT_FOLD_EVERY, max_prompt_tokens=DEFAULT_MAX_PROMPT_TOKENS, summary_model=None):
+        self.model = model
+        self.keep_turns = keep_turns
+        self.fold_every = fold_every
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summary_model = summary_model  # None: routed by model_router
+        self.summary = ""
+        self.folded = 0  # number of conversation messages already folded into the summary
+        self.turn_stats = []  # per turn: prompt tokens sent vs. tokens of the full history
+        self._lock = threading.Lock()  # a superseded reply may still be folding when the next one builds
+
+    def reset(self):
+        self.summary = ""
+        self.folded = 0
+        self.turn_stats = []
+
+    def _fold(self, client, messages):
+        # Incremental: only the newly evicted messages are sent, together with the previous summary
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        prompt = f"Existing summary:\n{self.summary or '(none yet)'}\n\nNew messages:\n{transcript}"
+        messages = task_messages(SUMMARY_INSTRUCTIONS, prompt)
+        if self.summary_model:
+            stream = stream_completion(client, "context_summary", model=self.summary_model, messages=messages, temperature=0.3, max_tokens=200)
+        else:
+            stream = routed_completion(client, "context_summary", messages, temperature=0.3, max_tokens=200)
+        self.summary = stream.read().strip()
+
+    def build(self, client, history, memory=None):
+        with self._lock:
+            system_prompts = [msg["content"] for msg in history if msg["role"] == "system"]
+            turns = [msg for msg in history if msg["role"] != "system"]
+            if len(turns) < self.folded:  # history was reset underneath us
+                self.reset()
+
+            def assemble(start):
+                return chat_messages(system_prompts, memory, self.summary, turns[start:])
+
+            start = self.folded
+            if len(turns) - self.keep_turns * 2 - start >= self.fold_every * 2:
+                start = len(turns) - self.keep_turns * 2
+                if turns[start]["role"] == "assistant":  # keep exchanges whole
+                    start += 1
+            # Drop further verbatim turns while over budget, always keeping the newest message
+            while start < len(turns) - 1 and count_message_tokens(assemble(start), self.model) > self.max_prompt_tokens:
+                start += 1
+            if start > self.folded:
+                self._fold(client, turns[self.folded:start])
+                self.folded = start
+
+            messages = assemble(start)
+            stats = {
+                "prompt_tokens": count_message_tokens(messages, self.model),
+                "full_history_tokens": count_message_tokens(chat_messages(system_prompts, memory, "", turns), self.model),
+            }
+            self.turn_stats.append(stats)
+            logger.info("prompt_tokens=%d full_history_tokens=%d", stats["prompt_tokens"], stats["full_history_tokens"])
+            return messages
@@ -0,0 +1,224 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from context_window import ContextWindow
+from funnel import Step, missing_fields
+from message_store import MessageStore
+
+# Durable conversations for returning users.
+# Every chat turn is appended to a log table as it happens; a per-user snapshot holds the
+# profile (memory) and the context window's rolling summary together with the last turn
+# that summary covers. Resuming reads the snapshot plus the log tail after it, so the cost
+# depends on the recent, unsummarized turns only, never on the length of the conversation.
+# Each conversation has a random key. A returning user is recognised by a signed resume
+# link only (?resume=<token>, needs FITX_RESUME_SECRET), kept in the page URL, and lands on
+# step 5 with their profile and recent context without any LLM call. Emails are never
+# confirmed, so typing one at step 0 starts a new conversation: it must not open, or
+# write to, the conversation of whoever used that address before.
+# The same database keeps the funnel state of API sessions (engine.py), so any API worker
+# process can serve any request of a session.
+
+logger = logging.getLogger("fitx.conversations")
+
+CACHE_DIR = os.getenv("FITX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+DEFAULT_DB_PATH = os.getenv("FITX_CONVERSATIONS_DB", os.path.join(CACHE_DIR, "conversations.sqlite3"))
+RESUME_SECRET = os.getenv("FITX_RESUME_SECRET", "")
+MAX_TAIL_TURNS = 50  # upper bound on turns restored verbatim
+PROFILE_FIELDS = ("name", "email", "goal", "struggle", "timeline")
+
+
+def new_conversation_key():
+    return secrets.token_hex(16)
+
+
+def resume_token(key, secret=RESUME_SECRET):
+    if not secret:
+        return None
+    signature = hmac.new(secret.encode("utf-8"), key.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+    return f"{key}.{signature}"
+
+
+def verify_token(token, secret=RESUME_SECRET):
+    # The user key when the token was signed with our secret, else None
+    if not secret or not token or "." not in token:
+        return None
+    key = token.split(".", 1)[0]
+    return key if hmac.compare_digest(resume_token(key, secret), token) else None
+
+
+def _connect(path):
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")  # a crash may lose the last turns, never the database
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS turns ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " user_key TEXT NOT NULL,"
+        " role TEXT NOT NULL,"
+        " content TEXT NOT NULL,"
+        " created_at REAL NOT NULL)"
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS turns_user ON turns (user_key, id)")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS snapshots ("
+        " user_key TEXT PRIMARY KEY,"
+        " profile TEXT NOT NULL,"
+        " summary TEXT NOT NULL,"
+        " covered_turn_id INTEGER NOT NULL,"
+        " updated_at REAL NOT NULL)"
+    )
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        " id TEXT PRIMARY KEY,"
+        " state TEXT NOT NULL,"
+        " updated_at REAL NOT NULL)"
+    )
+    db.commit()
+    return db
+
+
+class Conversation:
+    def __init__(self, key, profile, summary, turns):
+        self.key = key
+        self.profile = profile
+        self.summary = summary
+        self.turns = turns  # [{"role", "content"}, ...] not covered by the summary, oldest first
+
+
+class ConversationStore:
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._db = _connect(path)
+        self._lock = threading.Lock()
+
+    def append_turn(self, key, role, content):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO turns (user_key, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (key, role, content, time.time())
+            )
+            self._db.commit()
+
+    def save_snapshot(self, key, profile, summary, unsummarized):
+        # The summary covers every logged turn except the newest `unsummarized` ones
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM turns WHERE user_key = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                (key, unsummarized)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO snapshots (user_key, profile, summary, covered_turn_id, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(profile, ensure_ascii=False), summary, row[0] if row else 0, time.time())
+            )
+            self._db.commit()
+
+    def load(self, key, max_turns=MAX_TAIL_TURNS):
+        with self._lock:
+            snapshot = self._db.execute(
+                "SELECT profile, summary, covered_turn_id FROM snapshots WHERE user_key = ?", (key,)
+            ).fetchone()
+            if snapshot is None:
+                return None
+            rows = self._db.execute(
+                "SELECT role, content FROM turns WHERE user_key = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (key, snapshot[2], max_turns)
+            ).fetchall()
+        turns = [{"role": role, "content": content} for role, content in reversed(rows)]
+        return Conversation(key, json.loads(snapshot[0]), snapshot[1], turns)
+
+    def save_session(self, session_id, state):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state, ensure_ascii=False), time.time())
+            )
+            self._db.commit()
+
+    def load_session(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+        return _store
+
+
+class ConversationLog:
+    # One per session (kept in st.session_state): records turns and keeps the snapshot current
+    def __init__(self, store=None):
+        self.store = store or get_conversation_store()
+        self.key = None
+        self.saved = None  # (profile, summary) last written
+
+    def record(self, role, content):
+        if self.key:
+            self.store.append_turn(self.key, role, content)
+
+    def checkpoint(self, state):
+        # Called once per script run; writes only when the profile or summary changed
+        memory = state["memory"]
+        if not memory.get("email"):  # before the lead form, or after Start Over
+            self.key, self.saved = None, None
+            return
+        if self.key is None:
+            self.key = new_conversation_key()
+        key = self.key
+        profile = {field: memory[field] for field in PROFILE_FIELDS if memory.get(field)}
+        context_window = state.get("context_window")
+        summary = context_window.summary if context_window else ""
+        if (profile, summary) != self.saved:
+            history = state.get("chat_history")
+            turns = len(history) - history.count_role("system") if history is not None else 0
+            folded = context_window.folded if context_window else 0
+            self.store.save_snapshot(key, profile, summary, max(0, turns - folded))
+            self.saved = (profile, summary)
+        import streamlit as st  # ConversationLog is the Streamlit side; the store itself is headless
+
+        token = resume_token(key)
+        if token and st.query_params.get("resume") != token:
+            st.query_params["resume"] = token  # reloading or bookmarking the page resumes
+
+    def reset(self):
+        # The chat was cleared: the next checkpoint moves the snapshot past every logged turn
+        self.saved = None
+
+    def restore(self, state, conversation, system_prompt):
+        # Rebuilds memory, chat history and context window for step 5
+        memory = dict(conversation.profile)
+        state["memory"] = memory
+        state["chat_history"] = MessageStore([{"role": "system", "content": system_prompt}] + conversation.turns)
+        context_window = ContextWindow()
+        context_window.summary = conversation.summary
+        state["context_window"] = context_window
+        self.key = conversation.key
+        self.saved = ({field: memory[field] for field in PROFILE_FIELDS if memory.get(field)}, conversation.summary)
+        logger.info("resumed conversation with %d recent turns", len(conversation.turns))
+
+    def resume_from_link(self, state, system_prompt):
+        import streamlit as st
+
+        key = verify_token(st.query_params.get("resume"))
+        conversation = self.store.load(key) if key else None
+        if conversation is None or missing_fields(Step.CHAT, conversation.profile):
+            return False
+        self.restore(state, conversation, system_prompt)
+        state["step"] = int(Step.CHAT)  # before the script reads the step, so no rerun is needed
+        return True
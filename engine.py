@@ -0,0 +1,218 @@
+import logging
+import secrets
+import threading
+
+from admission import session_scope
+from coach import GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS, default_meal_input, generate_meal_plan, generate_summary, is_valid_email
+from context_window import ContextWindow
+from conversation_store import PROFILE_FIELDS, get_conversation_store, new_conversation_key, resume_token, verify_token
+from funnel import Funnel, InvalidTransition, Step, missing_fields
+from lead_sink import get_lead_sink
+from llm_client import LazyClient
+from message_store import MessageStore
+from model_router import routed_completion
+from prompt_layout import LEX_SYSTEM_PROMPT
+
+# Headless coaching engine: onboarding, summary, meal plan and chat, without Streamlit.
+# - The functions below work on explicit state; the Streamlit apps call them with their
+#   session_state, so the coaching logic exists once.
+# - CoachEngine serves sessions identified by an id, for the HTTP API (api.py). It keeps
+#   nothing in memory between calls: the funnel state lives in the conversation store
+#   under the session id, chat turns and the rolling summary under the user, so every
+#   API worker process can serve every request of a session.
+#   Each session writes to a conversation of its own; only its signed resume token (see
+#   conversation_store) continues it later, never the email given during onboarding.
+# Answers are validated against the same option lists and step rules as the apps.
+
+logger = logging.getLogger("fitx.engine")
+
+CHAT_PARAMS = {"temperature": 0.7, "max_tokens": 300}
+
+# Answers each onboarding step takes, with their allowed values (None: free text)
+STEP_ANSWERS = {
+    Step.LEAD: {"name": None, "email": None, "goal": GOAL_OPTIONS},
+    Step.STRUGGLE: {"struggle": STRUGGLE_OPTIONS},
+    Step.TIMELINE: {"timeline": TIMELINE_OPTIONS},
+}
+
+
+class InvalidAnswer(ValueError):
+    pass
+
+
+class UnknownSession(KeyError):
+    pass
+
+
+def summarize(client, memory, render=None):
+    # The step 3 summary for a completed profile
+    answers = {field: memory[field] for field in ("goal", "struggle", "timeline")}
+    return generate_summary(client, answers, render=render, name=memory.get("name"))
+
+
+def generate_reply(client, history, context_window, memory=None, render=None, **params):
+    # Lex's reply to the newest user message in `history` (a MessageStore), not appended:
+    # background jobs (jobs.py) leave the history to the script thread
+    stream = routed_completion(
+        client, "chat",
+        context_window.build(client, history, memory),
+        render=render,
+        depth=history.count_role("user"),
+        **params
+    )
+    return stream.text
+
+
+def chat_reply(client, history, context_window, memory=None, render=None, **params):
+    # As generate_reply, appended to `history`
+    reply = generate_reply(client, history, context_window, memory, render=render, **params)
+    history.append({"role": "assistant", "content": reply})
+    return reply
+
+
+def profile_of(memory):
+    return {field: memory[field] for field in PROFILE_FIELDS if memory.get(field)}
+
+
+class CoachEngine:
+    def __init__(self, client=None, store=None, system_prompt=LEX_SYSTEM_PROMPT):
+        self.client = client or LazyClient()
+        self.store = store or get_conversation_store()
+        self.system_prompt = system_prompt
+
+    def _load(self, session_id):
+        state = self.store.load_session(session_id)
+        if state is None:
+            raise UnknownSession(session_id)
+        state.setdefault("conversation", new_conversation_key())  # sessions saved before conversations had keys
+        return state
+
+    def _view(self, session_id, state):
+        return {
+            "session_id": session_id,
+            "step": Funnel(state).step.name.lower(),
+            "profile": profile_of(state["memory"]),
+            "resume_token": resume_token(state["conversation"]),  # None without FITX_RESUME_SECRET
+        }
+
+    def start(self, resume=None):
+        # A new session; a valid resume token continues that conversation at the chat step
+        session_id = secrets.token_urlsafe(16)
+        key = verify_token(resume)
+        conversation = self.store.load(key) if key else None
+        if conversation is not None and not missing_fields(Step.CHAT, conversation.profile):
+            state = {"step": int(Step.CHAT), "memory": dict(conversation.profile), "conversation": key}
+            logger.info("API session resumed a conversation with %d recent turns", len(conversation.turns))
+        else:
+            state = {"step": int(Step.LEAD), "memory": {}, "conversation": new_conversation_key()}
+        self.store.save_session(session_id, state)
+        return self._view(session_id, state)
+
+    def session(self, session_id):
+        return self._view(session_id, self._load(session_id))
+
+    def require(self, session_id, step):
+        # The session's state when it has everything `step` needs
+        state = self._load(session_id)
+        missing = missing_fields(step, state["memory"])
+        if missing:
+            raise InvalidTransition(f"{step.name.lower()} requires {', '.join(missing)}; finish onboarding first")
+        return state
+
+    def _advance(self, session_id, state, target):
+        funnel = Funnel(state)
+        while funnel.step < target:
+            funnel.go(Step(funnel.step + 1), rerun=False)
+        self.store.save_session(session_id, state)
+
+    def answer(self, session_id, answers):
+        # Onboarding: takes the current step's answers and moves to the next step
+        state = self._load(session_id)
+        funnel = Funnel(state)
+        step = funnel.step
+        expected = STEP_ANSWERS.get(step)
+        if expected is None:
+            raise InvalidTransition(f"onboarding is complete (step {step.name.lower()})")
+        unexpected = sorted(field for field, value in answers.items() if value is not None and field not in expected)
+        if unexpected:
+            raise InvalidAnswer(f"step {step.name.lower()} does not take {', '.join(unexpected)}")
+        values = {}
+        for field, options in expected.items():
+            value = (answers.get(field) or "").strip()
+            if not value:
+                raise InvalidAnswer(f"{field} is required")
+            if options is not None and value not in options:
+                raise InvalidAnswer(f"{field} must be one of: {', '.join(options)}")
+            values[field] = value
+        if step == Step.LEAD and not is_valid_email(values["email"]):
+            raise InvalidAnswer("email is not a valid address")
+        funnel.memory.update(values)
+
+        if step == Step.LEAD:
+            get_lead_sink().submit("api_lead", funnel.memory)
+        funnel.go(Step(step + 1), rerun=False)
+        self._checkpoint(state)
+        self.store.save_session(session_id, state)
+        return self._view(session_id, state)
+
+    def _checkpoint(self, state):
+        # Keeps the session's snapshot profile current, as ConversationLog does for the apps
+        key = state["conversation"]
+        conversation = self.store.load(key)
+        summary, unsummarized = (conversation.summary, len(conversation.turns)) if conversation else ("", 0)
+        self.store.save_snapshot(key, profile_of(state["memory"]), summary, unsummarized)
+
+    def summary(self, session_id, render=None):
+        state = self.require(session_id, Step.SUMMARY)
+        with session_scope(session_id):
+            return summarize(self.client, state["memory"], render=render)
+
+    def meal_plan(self, session_id, preferences="", render=None):
+        state = self.require(session_id, Step.MEAL_PLAN)
+        meal_input = preferences.strip() or default_meal_input(state["memory"]["goal"])
+        with session_scope(session_id):
+            meal_plan = generate_meal_plan(self.client, meal_input, render=render)
+        self._advance(session_id, state, Step.MEAL_PLAN)
+        return meal_plan
+
+    def chat(self, session_id, message, render=None):
+        # One chat turn; the context comes from the store, so no worker keeps the history
+        message = message.strip()
+        if not message:
+            raise InvalidAnswer("message is empty")
+        state = self.require(session_id, Step.CHAT)
+        self._advance(session_id, state, Step.CHAT)
+        memory = state["memory"]
+        key = state["conversation"]
+        conversation = self.store.load(key)
+        turns = conversation.turns if conversation else []
+        history = MessageStore([{"role": "system", "content": self.system_prompt}] + turns, spool=False)
+        context_window = ContextWindow()
+        context_window.summary = conversation.summary if conversation else ""
+
+        history.append({"role": "user", "content": message})
+        self.store.append_turn(key, "user", message)
+        with session_scope(session_id):
+            reply = chat_reply(self.client, history, context_window, memory, render=render, **CHAT_PARAMS)
+        self.store.append_turn(key, "assistant", reply)
+        unsummarized = len(history) - history.count_role("system") - context_window.folded
+        self.store.save_snapshot(key, profile_of(memory), context_window.summary, unsummarized)
+        return reply
+
+    def messages(self, session_id):
+        conversation = self.store.load(self._load(session_id)["conversation"])
+        if conversation is None:
+            return {"summary": "", "turns": []}
+        return {"summary": conversation.summary, "turns": conversation.turns}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CoachEngine()
+        return _engine
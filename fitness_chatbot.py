@@ -1,19 +1,20 @@
+import profiling
+profiling.start_run()  # first: with FITX_PROFILE=1 the run includes the imports below
+
 import streamlit as st
-from openai import OpenAI
 import os
+from admission import BUSY_MESSAGE, SHED_ERRORS
+from context_window import ContextWindow
+from engine import generate_reply
+from jobs import JobBoard, show_job
+from llm_client import LazyClient
+from message_store import MessageStore
+from prompt_layout import LEX_SYSTEM_PROMPT as SYSTEM_PROMPT
+from transcript import Transcript
 
-# Set your OpenAI API key securely
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
-# -------------------------------
-# 🧠 Lex's personality system prompt
-SYSTEM_PROMPT = """
-You are Lex, a friendly, energetic, and motivational fitness coach.
-You always speak in an upbeat, supportive tone. You use emojis sometimes to sound fun and engaging.
-You're casual and feel like a gym buddy. If the user feels down or unmotivated, cheer them up.
-
-Avoid sounding robotic or formal. Keep your replies short, helpful, and fun. Be proactive and helpful.
-"""
+# Set your OpenAI API key securely (the pooled client is shared across sessions and reruns)
+client = LazyClient(api_key=st.secrets["OPENAI_API_KEY"])
+client.prepare()  # loads while the page renders, ahead of the first message
 
 # -------------------------------
 # 🎯 Streamlit App Layout
@@ -25,28 +26,43 @@ st.markdown("Welcome! I'm **Lex**, your assistant coach. Let’s get you started
 # -------------------------------
 # 💬 Conversation Session
 if "messages" not in st.session_state:
-    st.session_state.messages = [
+    st.session_state.messages = MessageStore([
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "assistant", "content": "Hey! I'm Lex, your AI fitness buddy 💪 What's your goal today? Let's make it happen!"}
-    ]
+    ])
+if "context_window" not in st.session_state:
+    st.session_state.context_window = ContextWindow()
+if "transcript" not in st.session_state:
+    st.session_state.transcript = Transcript()
+if "jobs" not in st.session_state:
+    st.session_state.jobs = JobBoard()  # Lex's replies are written in the background
+jobs = st.session_state.jobs
 
-# Show conversation
-for msg in st.session_state.messages[1:]:
-    st.chat_message(msg["role"]).markdown(msg["content"])
+# Show conversation (older turns come from a cached block, the newest as chat bubbles)
+st.session_state.transcript.render(st.session_state.messages, chat_bubbles=True)
 
 # User input
 if prompt := st.chat_input("Type your message here…"):
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
+    # Supersedes the reply still being written to an earlier message
+    messages, context_window = st.session_state.messages, st.session_state.context_window
+    jobs.submit("reply", lambda job: generate_reply(client, messages, context_window, render=job.render))
 
-    # Get AI response
+# AI response, shown as it streams in
+if (reply_job := jobs.get("reply")) is not None:
     with st.chat_message("assistant"):
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=st.session_state.messages,
-        )
-        msg = response.choices[0].message.content
-        st.markdown(msg)
-
-    st.session_state.messages.append({"role": "assistant", "content": msg})
+        if show_job(reply_job):
+            jobs.pop("reply")
+            try:
+                reply = reply_job.result()
+            except SHED_ERRORS:
+                st.warning(BUSY_MESSAGE)
+            except Exception:  # logged by the job
+                st.error("Lex couldn't reply just now. Please try again.")
+            else:
+                st.session_state.messages.append({"role": "assistant", "content": reply})
+                st.markdown(reply)
+
+profiling.finish_run("chat")
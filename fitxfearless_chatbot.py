@@ -1,60 +1,28 @@
+import profiling
+profiling.start_run()  # first: with FITX_PROFILE=1 the run includes the imports below
+
 import streamlit as st
-import re
 import os
-import sys
-from openai import OpenAI
-import streamlit.components.v1 as components  # for voice input/output
-
-# Voice input/output HTML+JS snippet (for meal planner input mic)
-VOICE_HTML = """
-<script>
-var recognition = new(window.SpeechRecognition || window.webkitSpeechRecognition)();
-recognition.lang = 'en-US';
-recognition.interimResults = false;
-recognition.maxAlternatives = 1;
-
-function startRecognition() {
-    recognition.start();
-}
-
-recognition.onresult = function(event) {
-    const transcript = event.results[0][0].transcript;
-    const inputBox = window.parent.document.querySelector('input#meal_input');
-    if(inputBox) {
-        inputBox.value = transcript;
-        inputBox.dispatchEvent(new Event('input', { bubbles: true }));
-    }
-}
-</script>
-<button onclick="startRecognition()">🎤 Speak</button>
-"""
-
-# Chat voice input HTML+JS snippet for chat input mic
-CHAT_VOICE_HTML = """
-<script>
-var recognition = new(window.SpeechRecognition || window.webkitSpeechRecognition)();
-recognition.lang = 'en-US';
-recognition.interimResults = false;
-recognition.maxAlternatives = 1;
-
-function startRecognition() {
-    recognition.start();
-}
-
-recognition.onresult = function(event) {
-    const transcript = event.results[0][0].transcript;
-    const inputBox = window.parent.document.querySelector('input#chat_input');
-    if(inputBox) {
-        inputBox.value = transcript;
-        inputBox.dispatchEvent(new Event('input', { bubbles: true }));
-    }
-}
-</script>
-<button onclick="startRecognition()">🎤 Speak</button>
-"""
-
-# OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from coach import GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS, default_meal_input, generate_meal_plan, is_valid_email
+from admission import BUSY_MESSAGE, SHED_ERRORS
+from context_window import ContextWindow
+from conversation_store import ConversationLog
+from engine import CHAT_PARAMS, generate_reply, summarize
+from funnel import Funnel, Step
+from jobs import JobBoard, show_job
+from lead_sink import get_lead_sink
+from llm_client import LazyClient
+from message_store import MessageStore
+from prefetch import Prefetcher
+from transcript import Transcript, format_message
+from voice import speak_aloud, speech_input
+
+# Lex's chat persona (step 5)
+SYSTEM_PROMPT = "You are Lex, a friendly and helpful AI fitness coach. Provide encouragement, advice, and support about fitness, nutrition, and motivation."
+
+# OpenAI client (process-wide, pooled connections reused across reruns); the SDK loads in
+# the background from step 2, before the first LLM call at step 3
+client = LazyClient()
 
 st.set_page_config(page_title="FitxFearless AI Coach", page_icon="💪")
 st.title("💪 FitxFearless AI Coach")
@@ -63,51 +31,33 @@ Welcome! I'm **Lex**, your assistant coach.
 Let’s get you started on your fitness journey. Ready? 👇
 """)
 
-# Initialize memory in session state
-if "memory" not in st.session_state:
-    st.session_state.memory = {}
-
-# Email validation function
-def is_valid_email(email):
-    pattern = r"^[\w\.-]+@[\w\.-]+\.\w+$"
-    return re.match(pattern, email)
-
-# Function to generate personalized summary using OpenAI GPT
-def generate_summary(answers):
-    prompt = f"""
-You are a friendly fitness coach assistant.
-Here are the user’s answers:
-Goal: {answers['goal']}
-Struggle: {answers['struggle']}
-Timeline: {answers['timeline']}
-
-Write a warm, encouraging summary of their fitness journey and next steps.
-"""
-    response = client.chat.completions.create(
-        model="gpt-4",  # or "gpt-3.5-turbo"
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=150
-    )
-    return response.choices[0].message.content
+# Step flow control (initializes step + memory in session state)
+funnel = Funnel(st.session_state)
+
+# Returning users with a signed resume link go straight to the chat; turns and the
+# profile are persisted as they change
+if "conversation" not in st.session_state:
+    st.session_state.conversation = ConversationLog()
+    st.session_state.conversation.resume_from_link(st.session_state, SYSTEM_PROMPT)
+st.session_state.conversation.checkpoint(st.session_state)
+
+step = funnel.step
 
-# Helper function to rerun app (replaces st.experimental_rerun)
-def rerun_app():
-    sys.exit()
+# Speculative work started at step 3 (default meal plan, chat opener)
+if "prefetch" not in st.session_state:
+    st.session_state.prefetch = Prefetcher(client)
 
-# Step flow control
-if "step" not in st.session_state:
-    st.session_state.step = 0  # start from 0 to capture lead first
+# LLM calls run as background jobs; each run renders what they have so far
+if "jobs" not in st.session_state:
+    st.session_state.jobs = JobBoard()
+jobs = st.session_state.jobs
 
 # Step 0: Lead Capture Form
-if st.session_state.step == 0:
+if step == Step.LEAD:
     with st.form("lead_form"):
         name = st.text_input("What's your name?", value=st.session_state.memory.get("name", ""))
         email = st.text_input("Your email?", value=st.session_state.memory.get("email", ""))
-        goal_options = ["🏋️‍♂️ Build muscle", "🔥 Lose fat", "🏃‍♀️ Improve endurance", "💪 Get in shape overall"]
+        goal_options = GOAL_OPTIONS
         goal = st.selectbox(
             "What is your primary fitness goal?", goal_options,
             index=goal_options.index(st.session_state.memory["goal"]) if st.session_state.memory.get("goal") in goal_options else 0
@@ -118,69 +68,73 @@ if st.session_state.step == 0:
                 st.session_state.memory["name"] = name
                 st.session_state.memory["email"] = email
                 st.session_state.memory["goal"] = goal
-                st.session_state.step = 1
-                rerun_app()  # rerun app to proceed
+                get_lead_sink().submit("lead_form", st.session_state.memory)  # queued, written in the background
+                # Always a new conversation: the email is unconfirmed, so only the signed link resumes
+                funnel.go(Step.STRUGGLE)
             else:
                 st.error("Please enter a valid name and email.")
 
 # Step 1: Struggle selection
-elif st.session_state.step == 1:
+elif step == Step.STRUGGLE:
     st.write(f"Welcome back, {st.session_state.memory['name']}! Ready to crush your goal: {st.session_state.memory['goal']}?")
-    struggle_options = ["⏳ Not enough time", "🥗 Struggle with diet", "💡 Lack of motivation", "🤷 Not sure what works for me"]
+    struggle_options = STRUGGLE_OPTIONS
     struggle = st.radio(
         "What do you feel is holding you back right now?", struggle_options,
         index=struggle_options.index(st.session_state.memory["struggle"]) if st.session_state.memory.get("struggle") in struggle_options else 0
     )
     if st.button("Next"):
         st.session_state.memory["struggle"] = struggle
-        st.session_state.step = 2
-        rerun_app()
+        funnel.go(Step.TIMELINE)
 
 # Step 2: Timeline selection
-elif st.session_state.step == 2:
-    timeline_options = ["✅ ASAP", "🗓️ Within a month", "📅 In 2–3 months"]
+elif step == Step.TIMELINE:
+    client.prepare()  # step 3 streams the summary
+
+    timeline_options = TIMELINE_OPTIONS
     timeline = st.radio(
         "When would you ideally want to start seeing results?", timeline_options,
         index=timeline_options.index(st.session_state.memory["timeline"]) if st.session_state.memory.get("timeline") in timeline_options else 0
     )
     if st.button("Next"):
         st.session_state.memory["timeline"] = timeline
-        st.session_state.step = 3
-        rerun_app()
+        funnel.go(Step.SUMMARY)
 
 # Step 3: Show personalized summary from OpenAI and ask for email to send strategy
-elif st.session_state.step == 3:
-    with st.spinner("Generating your personalized fitness summary..."):
-        summary = generate_summary({
-            "goal": st.session_state.memory["goal"],
-            "struggle": st.session_state.memory["struggle"],
-            "timeline": st.session_state.memory["timeline"]
-        })
+elif step == Step.SUMMARY:
     st.markdown("### Your Personalized Fitness Summary:")
-    st.info(summary)
-    
-    # Voice play button for summary
-    if st.button("🔊 Play Summary Audio"):
-        js_code = f"""
-        <script>
-        var msg = new SpeechSynthesisUtterance();
-        msg.text = {repr(summary)};
-        window.speechSynthesis.speak(msg);
-        </script>
-        """
-        components.html(js_code, height=0)
+    memory = dict(st.session_state.memory)
+    summary_key = tuple(memory.get(field) for field in ("name", "goal", "struggle", "timeline"))
+    summary_job = jobs.get("summary", summary_key) or jobs.submit("summary", lambda job: summarize(client, memory, render=job.render), summary_key)
+    # Start the default meal plan and Lex's chat opener while the user reads the summary
+    # (after it, so the summary is first in line)
+    st.session_state.prefetch.start(st.session_state.memory, SYSTEM_PROMPT)
+    if show_job(summary_job):
+        try:
+            summary = summary_job.result()
+        except Exception:  # logged by the job; the next run starts it again
+            jobs.pop("summary")
+            st.error("Lex couldn't write your summary just now. Please try again.")
+        else:
+            if summary is None:  # cancelled from another run: the rerun starts it again
+                jobs.pop("summary")
+                st.rerun()
+            st.info(summary)
+
+            # Voice play button for summary
+            if st.button("🔊 Play Summary Audio"):
+                speak_aloud(summary)
 
     email_input = st.text_input("Confirm your email to send your custom strategy + success stories", value=st.session_state.memory.get("email", ""))
     if st.button("Send & Continue"):
         if is_valid_email(email_input):
             st.session_state.memory["email"] = email_input
-            st.session_state.step = 4
-            rerun_app()
+            get_lead_sink().submit("email_confirmed", st.session_state.memory)
+            funnel.go(Step.MEAL_PLAN)
         else:
             st.error("Please enter a valid email.")
 
 # Step 4: Meal Planner + Voice Input + Chatbot
-elif st.session_state.step == 4:
+elif step == Step.MEAL_PLAN:
     st.success(f"Thanks for sharing your info, {st.session_state.memory['name']}! 🎉")
 
     st.markdown("""
@@ -189,35 +143,35 @@ elif st.session_state.step == 4:
     """)
 
     # Mic button for voice input
-    components.html(VOICE_HTML, height=60)
+    speech_input("meal_voice", "meal_input")
 
-    meal_input = st.text_input("Your dietary preferences or restrictions (try speaking!)", key="meal_input")
+    default_meal = default_meal_input(st.session_state.memory["goal"])
+    meal_input = st.text_input("Your dietary preferences or restrictions (try speaking!)", key="meal_input", placeholder=f"Leave blank for a {default_meal} plan")
     
-    if st.button("Generate Meal Plan") and meal_input.strip():
-        prompt = f"Create a simple 3-day meal plan for someone with these dietary preferences/restrictions: {meal_input}"
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful fitness meal planner."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=300
-        )
-        meal_plan = response.choices[0].message.content
+    if st.button("Generate Meal Plan"):
+        # Reuses the plan prefetched at step 3 when the restrictions match
+        meal_request = st.session_state.prefetch.meal_request(meal_input.strip() or default_meal)
+        jobs.submit("meal_plan", lambda job: generate_meal_plan(client, meal_request, render=job.render))
+
+    # Stays up on the runs that follow, so its audio button works
+    meal_plan_job = jobs.get("meal_plan")
+    if meal_plan_job is not None:
         st.markdown("### Your 3-Day Meal Plan:")
-        st.info(meal_plan)
-        
-        # Voice play button for meal plan
-        if st.button("🔊 Play Meal Plan Audio"):
-            js_code = f"""
-            <script>
-            var msg = new SpeechSynthesisUtterance();
-            msg.text = {repr(meal_plan)};
-            window.speechSynthesis.speak(msg);
-            </script>
-            """
-            components.html(js_code, height=0)
+        if show_job(meal_plan_job):
+            try:
+                meal_plan = meal_plan_job.result()
+            except Exception:  # logged by the job; Generate Meal Plan starts a new one
+                jobs.pop("meal_plan")
+                st.error("Lex couldn't write your meal plan just now. Please try again.")
+            else:
+                if meal_plan is None:  # cancelled from another run: Generate Meal Plan starts a new one
+                    jobs.pop("meal_plan")
+                    st.rerun()
+                st.info(meal_plan)
+
+                # Voice play button for meal plan
+                if st.button("🔊 Play Meal Plan Audio"):
+                    speak_aloud(meal_plan)
 
     st.markdown("---")
     st.markdown("""
@@ -226,34 +180,61 @@ elif st.session_state.step == 4:
     """)
 
     if st.button("💬 Continue chatting with Lex"):
-        st.session_state.step = 5
-        rerun_app()
+        funnel.go(Step.CHAT)
 
     if st.button("Start Over"):
-        st.session_state.step = 0
-        st.session_state.memory = {}
-        rerun_app()
+        jobs.cancel()
+        st.session_state.prefetch.cancel()
+        funnel.restart()
 
 # Step 5+: Freeform conversational chatbot interface
-if st.session_state.step >= 5:
+if step == Step.CHAT:
 
     st.markdown("---")
     st.header("💬 Chat with Lex, your AI Fitness Coach")
 
     # Initialize chat history if missing
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = [
-            {"role": "system", "content": "You are Lex, a friendly and helpful AI fitness coach. Provide encouragement, advice, and support about fitness, nutrition, and motivation."}
-        ]
+        st.session_state.chat_history = MessageStore([
+            {"role": "system", "content": SYSTEM_PROMPT}
+        ])
     if "chat_input" not in st.session_state:
         st.session_state.chat_input = ""
 
-    # Display chat history
-    for msg in st.session_state.chat_history:
-        if msg["role"] == "user":
-            st.markdown(f"**You:** {msg['content']}")
-        elif msg["role"] == "assistant":
-            st.markdown(f"**Lex:** {msg['content']}")
+    if "context_window" not in st.session_state:
+        st.session_state.context_window = ContextWindow()
+
+    if "transcript" not in st.session_state:
+        st.session_state.transcript = Transcript()
+
+    # Lex opens the conversation with the message prefetched at step 3
+    if len(st.session_state.chat_history) == 1 and "chat_opener" in st.session_state.prefetch.jobs:
+        opener_job = jobs.adopt("opener", st.session_state.prefetch.jobs["chat_opener"])
+        if show_job(opener_job, prefix="**Lex:** "):
+            jobs.pop("opener")
+            opener = st.session_state.prefetch.take("chat_opener")
+            if opener:
+                st.session_state.chat_history.append({"role": "assistant", "content": opener})
+                st.session_state.conversation.record("assistant", opener)
+
+    # Display chat history (older turns come from a cached block)
+    st.session_state.transcript.render(st.session_state.chat_history)
+
+    # Lex's reply to the message sent by submit_chat, written in the background
+    reply_job = jobs.get("reply")
+    if reply_job is not None and show_job(reply_job, prefix="**Lex:** "):
+        jobs.pop("reply")
+        try:
+            reply = reply_job.result()
+        except SHED_ERRORS:
+            st.warning(BUSY_MESSAGE)
+        except Exception:  # logged by the job
+            st.error("Lex couldn't reply just now. Please try again.")
+        else:
+            message = {"role": "assistant", "content": reply}
+            st.session_state.chat_history.append(message)
+            st.session_state.conversation.record("assistant", reply)
+            st.markdown(format_message(message))  # the transcript shows it from the next run on
 
     def submit_chat():
         user_message = st.session_state.chat_input.strip()
@@ -262,17 +243,14 @@ if st.session_state.step >= 5:
 
         # Append user message
         st.session_state.chat_history.append({"role": "user", "content": user_message})
+        st.session_state.conversation.record("user", user_message)
         st.session_state.chat_input = ""  # Clear input box
-
-        with st.spinner("Lex is typing..."):
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=st.session_state.chat_history,
-                temperature=0.7,
-                max_tokens=300,
-            )
-        assistant_msg = response.choices[0].message.content
-        st.session_state.chat_history.append({"role": "assistant", "content": assistant_msg})
+        # The new message supersedes the opener or reply still being written; the prefetch
+        # nobody will take now is cancelled with them
+        jobs.cancel("opener")
+        st.session_state.prefetch.cancel()
+        history, context_window, memory = st.session_state.chat_history, st.session_state.context_window, st.session_state.memory
+        jobs.submit("reply", lambda job: generate_reply(client, history, context_window, memory, render=job.render, **CHAT_PARAMS))
 
     # Chat input with on_change to submit on Enter
     st.text_input(
@@ -283,15 +261,22 @@ if st.session_state.step >= 5:
     )
 
     # Send button (optional, for clicking instead of Enter)
-    if st.button("Send"):
-        submit_chat()
+    st.button("Send", on_click=submit_chat)
 
     # Mic button for voice input in chat
-    components.html(CHAT_VOICE_HTML, height=60)
+    speech_input("chat_voice", "chat_input")
 
-    if st.button("Reset Chat"):
-        st.session_state.chat_history = [
-            {"role": "system", "content": "You are Lex, a friendly and helpful AI fitness coach. Provide encouragement, advice, and support about fitness, nutrition, and motivation."}
-        ]
+    def reset_chat():
+        st.session_state.chat_history = MessageStore([
+            {"role": "system", "content": SYSTEM_PROMPT}
+        ])
         st.session_state.chat_input = ""
-        rerun_app()
+        jobs.cancel("reply", "opener")
+        st.session_state.prefetch.cancel()
+        st.session_state.context_window = ContextWindow()  # a cancelled reply may still be folding the old one
+        st.session_state.conversation.reset()
+
+    # Runs as a callback so the cleared chat renders in this same run
+    st.button("Reset Chat", on_click=reset_chat)
+
+profiling.finish_run(step.name.lower())
@@ -1,69 +1,26 @@
+import profiling
+profiling.start_run()  # first: with FITX_PROFILE=1 the run includes the imports below
+
 import streamlit as st
-import re
 import os
-import sys
-from openai import OpenAI
-import streamlit.components.v1 as components  # for voice input/output
-
-# Voice input/output HTML+JS snippet (for meal planner input mic)
-VOICE_HTML = """
-<script>
-var recognition = new(window.SpeechRecognition || window.webkitSpeechRecognition)();
-recognition.lang = 'en-US';
-recognition.interimResults = false;
-recognition.maxAlternatives = 1;
-
-function startRecognition() {
-    recognition.start();
-}
-
-recognition.onresult = function(event) {
-    const transcript = event.results[0][0].transcript;
-    const inputBox = window.parent.document.querySelector('input#meal_input');
-    if(inputBox) {
-        inputBox.value = transcript;
-        inputBox.dispatchEvent(new Event('input', { bubbles: true }));
-    }
-}
-</script>
-<button onclick="startRecognition()">🎤 Speak</button>
-"""
-
-# Chat voice input HTML+JS snippet for chat input mic
-CHAT_VOICE_HTML = """
-<script>
-var recognition = new(window.SpeechRecognition || window.webkitSpeechRecognition)();
-recognition.lang = 'en-US';
-recognition.interimResults = false;
-recognition.maxAlternatives = 1;
-
-function startRecognition() {
-    recognition.start();
-}
-
-recognition.onresult = function(event) {
-    const transcript = event.results[0][0].transcript;
-    const inputBox = window.parent.document.querySelector('input#chat_input');
-    if(inputBox) {
-        inputBox.value = transcript;
-        inputBox.dispatchEvent(new Event('input', { bubbles: true }));
-    }
-}
-</script>
-<button onclick="startRecognition()">🎤 Speak</button>
-"""
-
-# Lex's personality system prompt (from fitness_chatbot.py)
-SYSTEM_PROMPT = """
-You are Lex, a friendly, energetic, and motivational fitness coach.
-You always speak in an upbeat, supportive tone. You use emojis sometimes to sound fun and engaging.
-You're casual and feel like a gym buddy. If the user feels down or unmotivated, cheer them up.
-
-Avoid sounding robotic or formal. Keep your replies short, helpful, and fun. Be proactive and helpful.
-"""
-
-# Initialize OpenAI client using environment variable
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from coach import GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS, default_meal_input, generate_meal_plan, is_valid_email
+from admission import BUSY_MESSAGE, SHED_ERRORS
+from context_window import ContextWindow
+from conversation_store import ConversationLog
+from engine import CHAT_PARAMS, generate_reply, summarize
+from funnel import Funnel, Step
+from jobs import JobBoard, show_job
+from lead_sink import get_lead_sink
+from llm_client import LazyClient
+from message_store import MessageStore
+from prefetch import Prefetcher
+from prompt_layout import LEX_SYSTEM_PROMPT as SYSTEM_PROMPT
+from transcript import Transcript, format_message
+from voice import speak_aloud, speech_input
+
+# Shared OpenAI client using environment variable (pooled connections reused across reruns);
+# the SDK loads in the background from step 2, before the first LLM call at step 3
+client = LazyClient()
 
 st.set_page_config(page_title="💪 FitxFearless AI Coach", page_icon="💪")
 
@@ -73,60 +30,49 @@ Welcome! I'm **Lex**, your assistant coach.
 Let’s get you started on your fitness journey. Ready? 👇
 """)
 
-# Helper functions and setup
-
-def is_valid_email(email):
-    pattern = r"^[\w\.-]+@[\w\.-]+\.\w+$"
-    return re.match(pattern, email)
-
-def generate_summary(answers):
-    prompt = f"""
-You are a friendly fitness coach assistant.
-Here are the user’s answers:
-Goal: {answers['goal']}
-Struggle: {answers['struggle']}
-Timeline: {answers['timeline']}
-
-Write a warm, encouraging summary of their fitness journey and next steps.
-"""
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=150
-    )
-    return response.choices[0].message.content
-
-def rerun_app():
-    sys.exit()
-
 # Initialize session state variables
 
-if "step" not in st.session_state:
-    st.session_state.step = 0
+funnel = Funnel(st.session_state)  # sets up step + memory
+
+# Returning users with a signed resume link go straight to the chat; turns and the
+# profile are persisted as they change
+if "conversation" not in st.session_state:
+    st.session_state.conversation = ConversationLog()
+    st.session_state.conversation.resume_from_link(st.session_state, SYSTEM_PROMPT)
+st.session_state.conversation.checkpoint(st.session_state)
 
-if "memory" not in st.session_state:
-    st.session_state.memory = {}
+step = funnel.step
 
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = [
+    st.session_state.chat_history = MessageStore([
         {"role": "system", "content": SYSTEM_PROMPT}
-    ]
+    ])
 
 if "chat_input" not in st.session_state:
     st.session_state.chat_input = ""
 
+if "context_window" not in st.session_state:
+    st.session_state.context_window = ContextWindow()
+
+if "transcript" not in st.session_state:
+    st.session_state.transcript = Transcript()
+
+if "prefetch" not in st.session_state:
+    st.session_state.prefetch = Prefetcher(client)
+
+# LLM calls run as background jobs; each run renders what they have so far
+if "jobs" not in st.session_state:
+    st.session_state.jobs = JobBoard()
+jobs = st.session_state.jobs
+
 # Multi-step flow
 
-if st.session_state.step == 0:
+if step == Step.LEAD:
     # Lead Capture Form
     with st.form("lead_form"):
         name = st.text_input("What's your name?", value=st.session_state.memory.get("name", ""))
         email = st.text_input("Your email?", value=st.session_state.memory.get("email", ""))
-        goal_options = ["🏋️‍♂️ Build muscle", "🔥 Lose fat", "🏃‍♀️ Improve endurance", "💪 Get in shape overall"]
+        goal_options = GOAL_OPTIONS
         goal = st.selectbox(
             "What is your primary fitness goal?", goal_options,
             index=goal_options.index(st.session_state.memory["goal"]) if st.session_state.memory.get("goal") in goal_options else 0
@@ -137,67 +83,71 @@ if st.session_state.step == 0:
                 st.session_state.memory["name"] = name
                 st.session_state.memory["email"] = email
                 st.session_state.memory["goal"] = goal
-                st.session_state.step = 1
-                rerun_app()
+                get_lead_sink().submit("lead_form", st.session_state.memory)  # queued, written in the background
+                # Always a new conversation: the email is unconfirmed, so only the signed link resumes
+                funnel.go(Step.STRUGGLE)
             else:
                 st.error("Please enter a valid name and email.")
 
-elif st.session_state.step == 1:
+elif step == Step.STRUGGLE:
     # Struggle selection
     st.write(f"Welcome back, {st.session_state.memory['name']}! Ready to crush your goal: {st.session_state.memory['goal']}?")
-    struggle_options = ["⏳ Not enough time", "🥗 Struggle with diet", "💡 Lack of motivation", "🤷 Not sure what works for me"]
+    struggle_options = STRUGGLE_OPTIONS
     struggle = st.radio(
         "What do you feel is holding you back right now?", struggle_options,
         index=struggle_options.index(st.session_state.memory["struggle"]) if st.session_state.memory.get("struggle") in struggle_options else 0
     )
     if st.button("Next"):
         st.session_state.memory["struggle"] = struggle
-        st.session_state.step = 2
-        rerun_app()
+        funnel.go(Step.TIMELINE)
+
+elif step == Step.TIMELINE:
+    client.prepare()  # step 3 streams the summary
 
-elif st.session_state.step == 2:
     # Timeline selection
-    timeline_options = ["✅ ASAP", "🗓️ Within a month", "📅 In 2–3 months"]
+    timeline_options = TIMELINE_OPTIONS
     timeline = st.radio(
         "When would you ideally want to start seeing results?", timeline_options,
         index=timeline_options.index(st.session_state.memory["timeline"]) if st.session_state.memory.get("timeline") in timeline_options else 0
     )
     if st.button("Next"):
         st.session_state.memory["timeline"] = timeline
-        st.session_state.step = 3
-        rerun_app()
+        funnel.go(Step.SUMMARY)
 
-elif st.session_state.step == 3:
+elif step == Step.SUMMARY:
     # Show personalized summary
-    with st.spinner("Generating your personalized fitness summary..."):
-        summary = generate_summary({
-            "goal": st.session_state.memory["goal"],
-            "struggle": st.session_state.memory["struggle"],
-            "timeline": st.session_state.memory["timeline"]
-        })
     st.markdown("### Your Personalized Fitness Summary:")
-    st.info(summary)
-    
-    if st.button("🔊 Play Summary Audio"):
-        js_code = f"""
-        <script>
-        var msg = new SpeechSynthesisUtterance();
-        msg.text = {repr(summary)};
-        window.speechSynthesis.speak(msg);
-        </script>
-        """
-        components.html(js_code, height=0)
+    memory = dict(st.session_state.memory)
+    summary_key = tuple(memory.get(field) for field in ("name", "goal", "struggle", "timeline"))
+    summary_job = jobs.get("summary", summary_key) or jobs.submit("summary", lambda job: summarize(client, memory, render=job.render), summary_key)
+    # Start the default meal plan and Lex's chat opener while the user reads the summary
+    # (after it, so the summary is first in line)
+    st.session_state.prefetch.start(st.session_state.memory, SYSTEM_PROMPT)
+    if show_job(summary_job):
+        try:
+            summary = summary_job.result()
+        except Exception:  # logged by the job; the next run starts it again
+            jobs.pop("summary")
+            st.error("Lex couldn't write your summary just now. Please try again.")
+        else:
+            if summary is None:  # cancelled from another run: the rerun starts it again
+                jobs.pop("summary")
+                st.rerun()
+            st.info(summary)
+
+            if st.button("🔊 Play Summary Audio"):
+                speak_aloud(summary)
 
     email_input = st.text_input("Confirm your email to send your custom strategy + success stories", value=st.session_state.memory.get("email", ""))
     if st.button("Send & Continue"):
         if is_valid_email(email_input):
             st.session_state.memory["email"] = email_input
-            st.session_state.step = 4
-            rerun_app()
+            get_lead_sink().submit("email_confirmed", st.session_state.memory)
+            funnel.go(Step.MEAL_PLAN)
         else:
             st.error("Please enter a valid email.")
 
-elif st.session_state.step == 4:
+elif step == Step.MEAL_PLAN:
     # Meal Planner + Voice Input + Prompt for next step
     st.success(f"Thanks for sharing your info, {st.session_state.memory['name']}! 🎉")
 
@@ -206,34 +156,34 @@ elif st.session_state.step == 4:
     Tell me your dietary preferences or restrictions (e.g., vegetarian, keto, allergies) and I’ll create a simple meal plan for you.
     """)
 
-    components.html(VOICE_HTML, height=60)
+    speech_input("meal_voice", "meal_input")
 
-    meal_input = st.text_input("Your dietary preferences or restrictions (try speaking!)", key="meal_input")
+    default_meal = default_meal_input(st.session_state.memory["goal"])
+    meal_input = st.text_input("Your dietary preferences or restrictions (try speaking!)", key="meal_input", placeholder=f"Leave blank for a {default_meal} plan")
     
-    if st.button("Generate Meal Plan") and meal_input.strip():
-        prompt = f"Create a simple 3-day meal plan for someone with these dietary preferences/restrictions: {meal_input}"
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful fitness meal planner."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=300
-        )
-        meal_plan = response.choices[0].message.content
+    if st.button("Generate Meal Plan"):
+        # Reuses the plan prefetched at step 3 when the restrictions match
+        meal_request = st.session_state.prefetch.meal_request(meal_input.strip() or default_meal)
+        jobs.submit("meal_plan", lambda job: generate_meal_plan(client, meal_request, render=job.render))
+
+    # Stays up on the runs that follow, so its audio button works
+    meal_plan_job = jobs.get("meal_plan")
+    if meal_plan_job is not None:
         st.markdown("### Your 3-Day Meal Plan:")
-        st.info(meal_plan)
-        
-        if st.button("🔊 Play Meal Plan Audio"):
-            js_code = f"""
-            <script>
-            var msg = new SpeechSynthesisUtterance();
-            msg.text = {repr(meal_plan)};
-            window.speechSynthesis.speak(msg);
-            </script>
-            """
-            components.html(js_code, height=0)
+        if show_job(meal_plan_job):
+            try:
+                meal_plan = meal_plan_job.result()
+            except Exception:  # logged by the job; Generate Meal Plan starts a new one
+                jobs.pop("meal_plan")
+                st.error("Lex couldn't write your meal plan just now. Please try again.")
+            else:
+                if meal_plan is None:  # cancelled from another run: Generate Meal Plan starts a new one
+                    jobs.pop("meal_plan")
+                    st.rerun()
+                st.info(meal_plan)
+
+                if st.button("🔊 Play Meal Plan Audio"):
+                    speak_aloud(meal_plan)
 
     st.markdown("---")
     st.markdown("""
@@ -242,26 +192,47 @@ elif st.session_state.step == 4:
     """)
 
     if st.button("💬 Continue chatting with Lex"):
-        st.session_state.step = 5
-        rerun_app()
+        funnel.go(Step.CHAT)
 
     if st.button("Start Over"):
-        st.session_state.step = 0
-        st.session_state.memory = {}
-        rerun_app()
+        jobs.cancel()
+        st.session_state.prefetch.cancel()
+        funnel.restart()
 
-elif st.session_state.step >= 5:
+elif step == Step.CHAT:
     # Freeform conversational chatbot interface (main chat with Lex)
 
     st.markdown("---")
     st.header("💬 Chat with Lex, your AI Fitness Coach")
 
-    # Display chat history with formatting
-    for msg in st.session_state.chat_history:
-        if msg["role"] == "user":
-            st.markdown(f"**You:** {msg['content']}")
-        elif msg["role"] == "assistant":
-            st.markdown(f"**Lex:** {msg['content']}")
+    # Lex opens the conversation with the message prefetched at step 3
+    if len(st.session_state.chat_history) == 1 and "chat_opener" in st.session_state.prefetch.jobs:
+        opener_job = jobs.adopt("opener", st.session_state.prefetch.jobs["chat_opener"])
+        if show_job(opener_job, prefix="**Lex:** "):
+            jobs.pop("opener")
+            opener = st.session_state.prefetch.take("chat_opener")
+            if opener:
+                st.session_state.chat_history.append({"role": "assistant", "content": opener})
+                st.session_state.conversation.record("assistant", opener)
+
+    # Display chat history with formatting (older turns come from a cached block)
+    st.session_state.transcript.render(st.session_state.chat_history)
+
+    # Lex's reply to the message sent by submit_chat, written in the background
+    reply_job = jobs.get("reply")
+    if reply_job is not None and show_job(reply_job, prefix="**Lex:** "):
+        jobs.pop("reply")
+        try:
+            reply = reply_job.result()
+        except SHED_ERRORS:
+            st.warning(BUSY_MESSAGE)
+        except Exception:  # logged by the job
+            st.error("Lex couldn't reply just now. Please try again.")
+        else:
+            message = {"role": "assistant", "content": reply}
+            st.session_state.chat_history.append(message)
+            st.session_state.conversation.record("assistant", reply)
+            st.markdown(format_message(message))  # the transcript shows it from the next run on
 
     def submit_chat():
         user_message = st.session_state.chat_input.strip()
@@ -269,17 +240,14 @@ elif st.session_state.step >= 5:
             return
 
         st.session_state.chat_history.append({"role": "user", "content": user_message})
+        st.session_state.conversation.record("user", user_message)
         st.session_state.chat_input = ""
-
-        with st.spinner("Lex is typing..."):
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=st.session_state.chat_history,
-                temperature=0.7,
-                max_tokens=300,
-            )
-        assistant_msg = response.choices[0].message.content
-        st.session_state.chat_history.append({"role": "assistant", "content": assistant_msg})
+        # The new message supersedes the opener or reply still being written; the prefetch
+        # nobody will take now is cancelled with them
+        jobs.cancel("opener")
+        st.session_state.prefetch.cancel()
+        history, context_window, memory = st.session_state.chat_history, st.session_state.context_window, st.session_state.memory
+        jobs.submit("reply", lambda job: generate_reply(client, history, context_window, memory, render=job.render, **CHAT_PARAMS))
 
     # Text input with Enter submission
     st.text_input(
@@ -290,15 +258,22 @@ elif st.session_state.step >= 5:
     )
 
     # Optional Send button
-    if st.button("Send"):
-        submit_chat()
+    st.button("Send", on_click=submit_chat)
 
     # Mic button for voice input in chat
-    components.html(CHAT_VOICE_HTML, height=60)
+    speech_input("chat_voice", "chat_input")
 
-    if st.button("Reset Chat"):
-        st.session_state.chat_history = [
+    def reset_chat():
+        st.session_state.chat_history = MessageStore([
             {"role": "system", "content": SYSTEM_PROMPT}
-        ]
+        ])
         st.session_state.chat_input = ""
-        rerun_app()
+        jobs.cancel("reply", "opener")
+        st.session_state.prefetch.cancel()
+        st.session_state.context_window = ContextWindow()  # a cancelled reply may still be folding the old one
+        st.session_state.conversation.reset()
+
+    # Runs as a callback so the cleared chat renders in this same run
+    st.button("Reset Chat", on_click=reset_chat)
+
+profiling.finish_run(step.name.lower())
@@ -0,0 +1,116 @@
+import logging
+import threading
+from enum import IntEnum
+
+import profiling
+
+# Onboarding step flow as an explicit state machine.
+# Moving to the next step updates session state and immediately reruns the script
+# (st.rerun), so the new step renders in the same interaction. The old sys.exit()
+# helper stopped the run and left the previous screen up until the user clicked again.
+# The state machine itself works on any dict (the headless engine keeps one per API
+# session), so Streamlit is only imported by the Streamlit-facing paths.
+
+logger = logging.getLogger("fitx.funnel")
+
+
+class Step(IntEnum):
+    LEAD = 0
+    STRUGGLE = 1
+    TIMELINE = 2
+    SUMMARY = 3
+    MEAL_PLAN = 4
+    CHAT = 5
+
+
+# memory fields a step needs before it can render
+REQUIRED_FIELDS = {
+    Step.LEAD: (),
+    Step.STRUGGLE: ("name", "email", "goal"),
+    Step.TIMELINE: ("name", "email", "goal", "struggle"),
+    Step.SUMMARY: ("name", "email", "goal", "struggle", "timeline"),
+    Step.MEAL_PLAN: ("name", "email", "goal", "struggle", "timeline"),
+    Step.CHAT: ("name", "email", "goal", "struggle", "timeline"),
+}
+
+TRANSITIONS = {
+    Step.LEAD: {Step.STRUGGLE},
+    Step.STRUGGLE: {Step.TIMELINE},
+    Step.TIMELINE: {Step.SUMMARY},
+    Step.SUMMARY: {Step.MEAL_PLAN},
+    Step.MEAL_PLAN: {Step.CHAT, Step.LEAD},
+    Step.CHAT: {Step.LEAD},
+}
+
+# Process-wide counters; each transition saves one extra user round trip over sys.exit()
+STATS = {"transitions": 0, "reruns_saved": 0, "funnels_completed": 0}
+_stats_lock = threading.Lock()
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def missing_fields(step, memory):
+    return [field for field in REQUIRED_FIELDS[step] if not memory.get(field)]
+
+
+class Funnel:
+    def __init__(self, state=None):
+        if state is None:
+            import streamlit as st
+
+            state = st.session_state
+        self.state = state
+        if "step" not in self.state:
+            self.state["step"] = int(Step.LEAD)  # start from 0 to capture lead first
+        if "memory" not in self.state:
+            self.state["memory"] = {}
+        if "funnel_reruns_saved" not in self.state:
+            self.state["funnel_reruns_saved"] = 0
+
+    @property
+    def memory(self):
+        return self.state["memory"]
+
+    @property
+    def step(self):
+        step = Step(min(self.state["step"], Step.CHAT))
+        # Never render a step whose inputs are missing (e.g. memory was cleared)
+        while step > Step.LEAD and missing_fields(step, self.memory):
+            step = Step(step - 1)
+        if step != self.state["step"]:
+            self.state["step"] = int(step)
+        return step
+
+    def go(self, target, rerun=True):
+        current = self.step
+        if target not in TRANSITIONS[current]:
+            raise InvalidTransition(f"cannot move from {current.name} to {Step(target).name}")
+        missing = missing_fields(target, self.memory)
+        if missing:
+            raise InvalidTransition(f"{Step(target).name} requires {', '.join(missing)}")
+
+        self._enter(target, rerun)
+
+    def restart(self, rerun=True):
+        self.state["memory"] = {}
+        self.state["funnel_reruns_saved"] = 0
+        self._enter(Step.LEAD, rerun)
+
+    def _enter(self, target, rerun):
+        if rerun:
+            profiling.finish_run(Step(self.state["step"]).name.lower())  # the run that ends here
+        self.state["step"] = int(target)
+        self.state["funnel_reruns_saved"] += 1
+        with _stats_lock:
+            STATS["transitions"] += 1
+            STATS["reruns_saved"] += 1
+            if target == Step.CHAT:
+                STATS["funnels_completed"] += 1
+        if target == Step.CHAT:
+            logger.info("onboarding funnel completed, %d reruns saved", self.state["funnel_reruns_saved"])
+        if rerun:
+            import streamlit as st
+
+            st.rerun()
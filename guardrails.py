@@ -0,0 +1,149 @@
+import logging
+import os
+import re
+import unicodedata
+
+from llm_metrics import get_metrics
+from llm_stream import stream_completion
+
+# Local completeness checks for capped completions (meal plan, summary).
+# Both run under a max_tokens cap, and a 3-day plan cut off in the middle of day 3 failed
+# validation and was regenerated in full on the large model (and often again by the user
+# clicking "Generate Meal Plan"). After each completion, CPU-only checks decide whether
+# the reply was cut off: only a reply with finish_reason == "length", or one that visibly
+# stops mid-line (a dangling comma, dash or "and"), is checked for what is missing (days
+# or meal sections after the last one written). A plan whose sections are labelled some
+# other way (a table, "Morning"/"Evening") is continued without naming parts, and a
+# finished reply is never continued just because no section was recognized.
+# A cut-off reply is completed with a continuation request: the partial reply goes back
+# as the assistant turn (so the prompt prefix stays cacheable) and the model is asked for
+# only the missing tail, with a token budget sized to what is missing. Each continuation
+# that completes a reply is counted as a regeneration saved.
+
+logger = logging.getLogger("fitx.guardrails")
+
+MAX_CONTINUATIONS = int(os.getenv("FITX_MAX_CONTINUATIONS", "2"))
+DAYS = (1, 2, 3)
+MEALS = ("breakfast", "lunch", "dinner")
+TOKENS_PER_MEAL = 40
+MIN_CONTINUATION_TOKENS = 60
+SUMMARY_CONTINUATION_TOKENS = 80
+
+CONTINUE_PROMPT = (
+    "Your reply was cut off. Continue exactly where it stopped, without repeating anything "
+    "already written and without any preamble."
+)
+
+
+def meal_plan_gaps(text):
+    # Parts of the 3-day plan not written yet, in plan order: "Day 2 dinner", "Day 3", ...
+    sections = re.split(r"(?im)^\W*day\s*([1-3])\b", text)
+    days = {}
+    for day, body in zip(sections[1::2], sections[2::2]):
+        days[int(day)] = days.get(int(day), "") + body
+    gaps = []
+    for day in DAYS:
+        if day not in days:
+            gaps.append(f"Day {day}")
+            continue
+        gaps += [f"Day {day} {meal}" for meal in MEALS if not re.search(rf"\b{meal}\b", days[day], re.IGNORECASE)]
+    return gaps
+
+
+def _tail_gaps(gaps):
+    # A cut-off plan is missing a tail: every part after the first gap is missing too. Not
+    # when every part is missing, which means the plan labels its sections some other way.
+    parts = [f"Day {day} {meal}" for day in DAYS for meal in MEALS]
+    missing = set()
+    for gap in gaps:
+        missing.update(part for part in parts if part == gap or part.startswith(gap + " "))
+    first = next((i for i, part in enumerate(parts) if part in missing), None)
+    return 0 < len(missing) < len(parts) and all(part in missing for part in parts[first:])
+
+
+MID_LINE = r"(?:[,;:(\-–—/&+]|\b(?:and|or|with|the|a|an|of|to|for|in|on|at|your|but|plus))\s*$"
+
+
+def stops_mid_line(text):
+    # A line left hanging: a finished sentence, bullet item, heading or hashtag is not
+    return re.search(MID_LINE, text.rstrip(), re.IGNORECASE) is not None
+
+
+def ends_sentence(text):
+    text = text.rstrip()
+    if not text:
+        return False
+    last = text[-1]
+    return last in ".!?…)\"'”’\u200d\ufe0e\ufe0f" or unicodedata.category(last) in ("So", "Sk")
+
+
+def summary_gaps(text):
+    return [] if ends_sentence(text) else ["the end of the last sentence"]
+
+
+GAPS = {
+    "meal_plan": meal_plan_gaps,
+    "summary": summary_gaps,
+}
+
+
+def truncated(task, text, finish_reason):
+    # The missing parts when the reply was cut off, else None
+    find_gaps = GAPS.get(task)
+    if find_gaps is None or not text.strip():  # nothing to continue from: left to validation
+        return None
+    if finish_reason != "length" and not stops_mid_line(text):
+        return None
+    gaps = find_gaps(text)
+    if task == "meal_plan" and not _tail_gaps(gaps):
+        return []  # cut off, but not in a way the plan's sections show: continue without naming parts
+    return gaps
+
+
+def continuation_budget(task, gaps, max_tokens=None):
+    if task == "meal_plan":
+        meals = sum(len(MEALS) if re.fullmatch(r"Day \d", gap) else 1 for gap in gaps)
+        budget = max(MIN_CONTINUATION_TOKENS, meals * TOKENS_PER_MEAL)
+    else:
+        budget = SUMMARY_CONTINUATION_TOKENS
+    return min(budget, max_tokens) if max_tokens else budget
+
+
+def continuation_messages(messages, partial, gaps):
+    ask = CONTINUE_PROMPT
+    if gaps:
+        ask += f" Still missing: {', '.join(gaps)}."
+    return list(messages) + [{"role": "assistant", "content": partial}, {"role": "user", "content": ask}]
+
+
+def _joined(partial, tail):
+    # A generator rather than itertools.chain: render callbacks close what they are given,
+    # which has to reach the tail's upstream request
+    yield partial
+    yield from tail
+
+
+def complete(client, task, model, messages, stream, render=None, site=None, **params):
+    # Continues a finished, cut-off completion in place: stream.text ends up as the whole
+    # reply (re-rendered through `render` as it grows). Returns the number of continuations.
+    site = site or task
+    continuations = 0
+    while continuations < MAX_CONTINUATIONS:
+        gaps = truncated(task, stream.text, stream.finish_reason)
+        if gaps is None:
+            break
+        continuations += 1
+        logger.info("%s reply cut off (%s), continuing: %s", task, stream.finish_reason, ", ".join(gaps) or "tail")
+        tail_params = dict(params, max_tokens=continuation_budget(task, gaps, params.get("max_tokens")))
+        tail = stream_completion(client, site, model=model, messages=continuation_messages(messages, stream.text, gaps), **tail_params)
+        partial = stream.text
+        if render is not None:
+            render(_joined(partial, tail))
+        tail.read()
+        # The caller keeps using `stream`; it now carries the joined reply
+        stream.text = partial + tail.text
+        stream.finish_reason = tail.finish_reason
+    if continuations:
+        result = "incomplete" if truncated(task, stream.text, stream.finish_reason) is not None else "completed"
+        get_metrics().observe_continuation(site, result)
+    return continuations
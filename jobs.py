@@ -0,0 +1,236 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import SHED_ERRORS, Cancelled, cancel_scope, current_session_id, session_scope
+from llm_metrics import get_metrics
+
+# Background jobs for LLM calls.
+# A completion made inline holds the Streamlit script thread for the whole reply, and the
+# user's next click waits behind it. The apps submit each call (summary, meal plan, chat
+# reply, chat opener) as a Job to a process-wide bounded pool instead, and the script run
+# ends at once: show_job renders the text so far from a fragment that polls the job, then
+# reruns the app once it is done. The call gets job.render as its `render` callback, so it
+# streams into the job exactly as it would into st.write_stream; the job keeps the deltas
+# (poll, stream) and stops the stream once it is cancelled, which closes the upstream
+# request; a cancelled job's calls that have not gone upstream yet never do, rendered or
+# not (admission.cancel_scope). Each session keeps its jobs on a JobBoard, one per slot ("summary",
+# "meal_plan", "reply"): a new job in a slot cancels the one it supersedes, so a new
+# message or Reset Chat stops paying for a reply nobody will read.
+
+logger = logging.getLogger("fitx.jobs")
+
+MAX_WORKERS = int(os.getenv("FITX_JOB_WORKERS", "32"))
+POLL_SECONDS = float(os.getenv("FITX_JOB_POLL_SECONDS", "0.25"))
+FAST_PATH_SECONDS = 0.05  # cache and catalog hits finish within this and render in the same run
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class Job:
+    def __init__(self, kind, fn, session_id=None, key=None):
+        self.kind = kind
+        self.fn = fn  # fn(job) -> result; pass job.render as the call's render callback
+        self.session_id = session_id  # admission's per-session cap, as if called from the script
+        self.key = key  # what the job was started for (see JobBoard.get)
+        self.status = QUEUED
+        self.value = None
+        self.error = None
+        self.end_reason = None
+        self.submitted = time.monotonic()
+        self.future = None
+        self._parts = []
+        self._version = 0  # bumped each time the reply is rendered from the start
+        self._changed = threading.Condition()
+        self._finished = threading.Event()
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    @property
+    def text(self):
+        with self._changed:
+            return "".join(self._parts)
+
+    def render(self, stream):
+        # A continued or regenerated reply is rendered again from its start
+        with self._changed:
+            self._parts = []
+            self._version += 1
+            self._changed.notify_all()
+        iterator = iter(stream)
+        try:
+            for delta in iterator:
+                if self.status == CANCELLED:
+                    raise Cancelled(self.kind)
+                with self._changed:
+                    self._parts.append(delta)
+                    self._changed.notify_all()
+        finally:
+            iterator.close()
+
+    def _run(self):
+        try:
+            with self._changed:
+                if self.status == CANCELLED:  # cancelled before a worker picked it up
+                    return
+                self.status = RUNNING
+            get_metrics().observe_job_queue(self.kind, time.monotonic() - self.submitted)
+            with session_scope(self.session_id), cancel_scope(self.cancelled):
+                value = self.fn(self)
+            with self._changed:
+                if self.status != CANCELLED:
+                    self.value = value
+                    self.status = DONE
+        except Cancelled:
+            pass
+        except Exception as exc:
+            with self._changed:
+                if self.status == CANCELLED:
+                    return
+                self.error = exc
+                self.status = FAILED
+            if not isinstance(exc, SHED_ERRORS):
+                logger.exception("%s job failed", self.kind)
+        finally:
+            self._finish()
+
+    def _finish(self):
+        with self._changed:
+            if self.finished:
+                return
+            self._finished.set()
+            self._changed.notify_all()
+        get_metrics().observe_job(self.kind, self.end_reason or self.status)
+
+    def cancelled(self):
+        return self.status == CANCELLED
+
+    def poll(self):
+        with self._changed:
+            return self.status, "".join(self._parts)
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def result(self, timeout=None):
+        # The call's return value (None when cancelled); its exception is re-raised
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"{self.kind} job still running")
+        if self.error is not None:
+            raise self.error
+        return self.value if self.status == DONE else None
+
+    def stream(self):
+        # The reply's deltas as they arrive, until the job finishes. Stops early when the
+        # reply is rendered again from the start; result() then has the final text.
+        version, sent = None, 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.finished or self._version != version or len(self._parts) > sent)
+                if self._version != version:
+                    if sent:
+                        return
+                    version = self._version
+                parts = self._parts[sent:]
+                sent = len(self._parts)
+                finished = self.finished
+            yield from parts
+            if finished and not parts:
+                return
+
+    def cancel(self, reason=CANCELLED):
+        # The running call stops before its next upstream call or streamed delta; a queued
+        # one never starts
+        with self._changed:
+            if self.finished or self.status == CANCELLED:
+                return False
+            self.end_reason = reason
+            self.status = CANCELLED
+        if self.future is not None and self.future.cancel():
+            self._finish()
+        return True
+
+
+class JobPool:
+    def __init__(self, max_workers=MAX_WORKERS, name="fitx-job"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def submit(self, job):
+        job.future = self._executor.submit(job._run)
+        return job
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Shared by every session, so concurrent calls stay bounded process-wide
+def get_job_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = JobPool()
+        return _pool
+
+
+class JobBoard:
+    # One per session (kept in st.session_state): the latest job in each slot
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.jobs = {}
+
+    def submit(self, slot, fn, key=None):
+        self.cancel(slot, reason="superseded")
+        job = Job(slot, fn, current_session_id(), key)  # on the script thread, so the session is known
+        (self.pool or get_job_pool()).submit(job)
+        self.jobs[slot] = job
+        return job
+
+    def adopt(self, slot, job):
+        # Shows a job started elsewhere (a prefetch) in a slot
+        self.jobs[slot] = job
+        return job
+
+    def get(self, slot, key=None):
+        # The slot's job, unless it was started for another key
+        job = self.jobs.get(slot)
+        if job is None or (key is not None and job.key != key):
+            return None
+        return job
+
+    def pop(self, slot):
+        return self.jobs.pop(slot, None)
+
+    def cancel(self, *slots, reason=CANCELLED):
+        # The given slots' jobs, or all of them
+        for slot in slots or list(self.jobs):
+            job = self.jobs.pop(slot, None)
+            if job is not None:
+                job.cancel(reason)
+
+    def busy(self):
+        return any(not job.finished for job in self.jobs.values())
+
+
+def show_job(job, prefix=""):
+    # True once the job is finished: the caller renders job.result(). Until then the text
+    # so far is shown by a fragment that polls the job every POLL_SECONDS and reruns the
+    # app when it finishes. A job that was just submitted gets FAST_PATH_SECONDS to
+    # finish first, so cache hits render in the run that asked for them.
+    import streamlit as st
+
+    if job.wait(max(0.0, FAST_PATH_SECONDS - (time.monotonic() - job.submitted))):
+        return True
+
+    def progress():
+        if job.finished:
+            st.rerun()
+        text = job.text
+        st.markdown(f"{prefix}{text.rstrip()} ▌" if text else f"{prefix}…")
+
+    st.fragment(progress, run_every=POLL_SECONDS)()
+    return False
@@ -0,0 +1,199 @@
+import argparse
+import atexit
+import contextlib
+import csv
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from coach import is_valid_email
+
+# Durable lead capture.
+# The app only enqueues leads (never touching disk); a background writer thread drains
+# the bounded queue and commits them to SQLite in batches. The database runs in WAL
+# mode with synchronous=FULL, so every batch commit is fsynced before it is acknowledged.
+# A batch that fails to commit is rolled back and retried with backoff.
+
+logger = logging.getLogger("fitx.leads")
+
+CACHE_DIR = os.getenv("FITX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+DEFAULT_DB_PATH = os.getenv("FITX_LEADS_DB", os.path.join(CACHE_DIR, "leads.sqlite3"))
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds a partial batch may wait before it is written
+DEFAULT_MAX_QUEUE = 10000
+WRITE_ATTEMPTS = 3  # a failed batch (locked database, full disk) is retried before it is given up
+WRITE_BACKOFF = 0.5  # seconds before the first retry, doubled for each one after
+LEAD_FIELDS = ("name", "email", "goal", "struggle", "timeline")
+
+
+def _connect(path):
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=FULL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS leads ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " event TEXT NOT NULL,"
+        " email TEXT,"
+        " name TEXT,"
+        " goal TEXT,"
+        " struggle TEXT,"
+        " timeline TEXT,"
+        " captured_at REAL NOT NULL)"
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS leads_email ON leads (email)")
+    db.commit()
+    return db
+
+
+class LeadSink:
+    def __init__(self, path=DEFAULT_DB_PATH, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, max_queue=DEFAULT_MAX_QUEUE):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0, "retries": 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._db = _connect(path)
+        self._thread = threading.Thread(target=self._run, name="lead-sink", daemon=True)
+        self._thread.start()
+
+    def submit(self, event, memory):
+        lead = {field: memory.get(field) for field in LEAD_FIELDS}
+        lead["event"] = event
+        lead["captured_at"] = time.time()
+        try:
+            self._queue.put_nowait(lead)
+        except queue.Full:
+            # Never block the form on a backed-up writer
+            self.stats["dropped"] += 1
+            logger.warning("lead queue full, dropped %s lead", event)
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            leads = [lead for lead in batch if lead is not None]
+            if leads:
+                self._write(leads)
+            for _ in batch:
+                self._queue.task_done()
+            if len(leads) < len(batch):  # close() sentinel
+                return
+
+    def _write(self, leads):
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                self._db.executemany(
+                    "INSERT INTO leads (event, email, name, goal, struggle, timeline, captured_at)"
+                    " VALUES (:event, :email, :name, :goal, :struggle, :timeline, :captured_at)",
+                    leads
+                )
+                self._db.commit()
+                break
+            except sqlite3.Error:
+                with contextlib.suppress(sqlite3.Error):
+                    self._db.rollback()  # nothing of the batch is half-written
+                if attempt == WRITE_ATTEMPTS - 1:
+                    self.stats["failed"] += len(leads)
+                    logger.exception("failed to write %d leads after %d attempts", len(leads), WRITE_ATTEMPTS)
+                    return
+                delay = WRITE_BACKOFF * 2 ** attempt
+                logger.warning("failed to write %d leads, retrying in %.1fs", len(leads), delay, exc_info=True)
+                self.stats["retries"] += 1
+                time.sleep(delay)
+        self.stats["written"] += len(leads)
+        self.stats["batches"] += 1
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+# Process-wide sink shared by all sessions; pending leads are flushed on interpreter exit
+def get_lead_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = LeadSink()
+            atexit.register(_sink.close)
+        return _sink
+
+
+def dedupe_leads(rows):
+    # Merge every event for the same (validated, case-insensitive) email into one lead
+    leads = {}
+    for row in sorted(rows, key=lambda r: r["captured_at"]):
+        email = (row["email"] or "").strip().lower()
+        if not is_valid_email(email):
+            continue
+        lead = leads.setdefault(email, {"email": email, "first_seen": row["captured_at"], "events": 0})
+        for field in ("name", "goal", "struggle", "timeline"):
+            if row[field]:
+                lead[field] = row[field]
+        lead["last_seen"] = row["captured_at"]
+        lead["events"] += 1
+    return list(leads.values())
+
+
+def export_leads(path, out, fmt="csv"):
+    db = _connect(path)
+    db.row_factory = sqlite3.Row
+    leads = dedupe_leads(db.execute("SELECT * FROM leads ORDER BY captured_at").fetchall())
+    db.close()
+
+    columns = ["email", "name", "goal", "struggle", "timeline", "first_seen", "last_seen", "events"]
+    for lead in leads:
+        for col in ("first_seen", "last_seen"):
+            lead[col] = datetime.fromtimestamp(lead[col], timezone.utc).isoformat(timespec="seconds")
+    if fmt == "jsonl":
+        for lead in leads:
+            out.write(json.dumps({col: lead.get(col) for col in columns}, ensure_ascii=False) + "\n")
+    else:
+        writer = csv.DictWriter(out, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(leads)
+    return len(leads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export captured FitxFearless leads, deduplicated by email")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--out", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.out:
+        with open(args.out, "w", newline="", encoding="utf-8") as out:
+            count = export_leads(args.db, out, args.format)
+    else:
+        count = export_leads(args.db, sys.stdout, args.format)
+    print(f"Exported {count} unique leads", file=sys.stderr)
@@ -0,0 +1,94 @@
+import importlib.util
+import logging
+import os
+import threading
+
+from admission import observe_response
+from llm_metrics import count_attempt
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None  # enables HTTP/2 in httpx
+
+# One OpenAI client per process (per API key), shared by every Streamlit session and rerun.
+# Streamlit re-executes the app scripts on every interaction, but imported modules stay
+# loaded, so the pooled connections (and their TLS sessions) survive across reruns.
+# The SDK is the slowest import on the cold-start path (~0.4s), so the apps hold a
+# LazyClient: openai and httpx load on the first LLM call (step 3), or in the background
+# once prepare() is called a step earlier, never before the first screen renders.
+
+logger = logging.getLogger("fitx.client")
+
+TIMEOUT = float(os.getenv("FITX_OPENAI_TIMEOUT", "60"))
+CONNECT_TIMEOUT = float(os.getenv("FITX_OPENAI_CONNECT_TIMEOUT", "5"))
+MAX_RETRIES = int(os.getenv("FITX_OPENAI_MAX_RETRIES", "0"))  # admission retries with backoff and a shared budget
+MAX_CONNECTIONS = int(os.getenv("FITX_OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("FITX_OPENAI_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("FITX_OPENAI_KEEPALIVE_EXPIRY", "120"))
+
+_clients = {}
+_preparing = set()
+_lock = threading.Lock()
+
+
+def build_http_client():
+    import httpx
+    from openai import DefaultHttpxClient
+
+    return DefaultHttpxClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        event_hooks={
+            "request": [count_attempt],  # retries show up as extra attempts
+            "response": [observe_response],  # x-ratelimit-* headers size the admission buckets
+        },
+    )
+
+
+def get_client(api_key=None):
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+
+            client = OpenAI(
+                api_key=api_key,
+                http_client=build_http_client(),
+                timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+                max_retries=MAX_RETRIES,
+            )
+            _clients[api_key] = client
+        return client
+
+
+class LazyClient:
+    # Stands in for get_client(api_key) and builds it on first attribute access
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+
+    def __getattr__(self, name):
+        return getattr(get_client(self.api_key), name)
+
+    def prepare(self):
+        # Loads the SDK and builds the client off the script thread, ahead of the first call
+        api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+        with _lock:
+            if api_key in _clients or api_key in _preparing:
+                return
+            _preparing.add(api_key)
+
+        def build():
+            try:
+                get_client(api_key)
+            except Exception:  # the first call builds it again and raises
+                logger.warning("OpenAI client warm-up failed", exc_info=True)
+            finally:  # a failed build is retried by the next prepare() or the first call
+                with _lock:
+                    _preparing.discard(api_key)
+
+        threading.Thread(target=build, name="openai-prepare", daemon=True).start()
@@ -0,0 +1,304 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Per-call LLM metrics.
+# Every completion goes through llm_stream.CompletionStream, which reports each finished
+# call here: site, model, tokens, latency, time to first token, retries and error class.
+# Cache lookups in front of the model (summaries, meal plans) report hit or miss.
+# Calls are aggregated into in-process counters and histograms and exported as
+#   FITX_METRICS_PORT=9464   Prometheus text on http://0.0.0.0:9464/metrics
+#   FITX_METRICS_JSONL=path  one JSON line per call, flushed every FITX_METRICS_FLUSH_INTERVAL seconds
+# Recording is a few dict updates and a bisect per call, well under 1% of a request.
+
+logger = logging.getLogger("fitx.metrics")
+
+METRICS_PORT = os.getenv("FITX_METRICS_PORT")
+METRICS_JSONL = os.getenv("FITX_METRICS_JSONL")
+FLUSH_INTERVAL = float(os.getenv("FITX_METRICS_FLUSH_INTERVAL", "10"))
+MAX_PENDING = 10000  # call records kept for the next JSONL flush
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 60)
+SCRIPT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# USD per 1K tokens (prompt, completion); unknown models are reported at zero cost
+PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+_attempts = threading.local()
+
+
+def count_attempt(request):
+    # httpx request hook (see llm_client): counts HTTP attempts made by the current thread
+    _attempts.count = getattr(_attempts, "count", 0) + 1
+
+
+def reset_attempts():
+    _attempts.count = 0
+
+
+def attempts():
+    return getattr(_attempts, "count", 0)
+
+
+def call_cost(model, usage):
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class LLMMetrics:
+    COUNTERS = {
+        "fitx_llm_calls_total": (("site", "model", "outcome"), "Completion calls by outcome (ok, error, cancelled)"),
+        "fitx_llm_errors_total": (("site", "model", "error"), "Failed completion calls by error class"),
+        "fitx_llm_retries_total": (("site", "model"), "HTTP retries made by the OpenAI client"),
+        "fitx_llm_coalesced_total": (("site", "model"), "Calls served by an identical in-flight request"),
+        "fitx_llm_tokens_total": (("site", "model", "kind"), "Tokens reported by the API (prompt, cached, completion)"),
+        "fitx_llm_cache_total": (("site", "result"), "Response cache lookups in front of the model"),
+        "fitx_llm_cost_usd_total": (("site", "model"), "Estimated spend from token usage and PRICES"),
+        "fitx_llm_prefetch_total": (("kind", "result"), "Speculative prefetches started, used (hit), unused (miss) or cancelled"),
+        "fitx_llm_shed_total": (("site", "reason"), "Calls refused by admission control (rate_limit, session_cap, low_priority)"),
+        "fitx_llm_route_total": (("site", "model", "result"), "Routed calls whose output passed validation (ok) or fell back to the large model"),
+        "fitx_llm_continuations_total": (("site", "result"), "Cut-off replies continued instead of regenerated, by whether they ended complete"),
+        "fitx_meal_plans_total": (("source",), "Meal plans built by the local planner (planner, planner_unphrased) or written by the model (prose)"),
+        "fitx_jobs_total": (("kind", "result"), "Background jobs by how they ended (done, failed, cancelled, superseded)"),
+    }
+    HISTOGRAMS = {
+        "fitx_llm_latency_seconds": (("site", "model"), LATENCY_BUCKETS, "Total call latency"),
+        "fitx_llm_ttft_seconds": (("site", "model"), LATENCY_BUCKETS, "Time to first streamed token"),
+        "fitx_llm_prompt_tokens": (("site", "model"), TOKEN_BUCKETS, "Prompt tokens per call"),
+        "fitx_llm_completion_tokens": (("site", "model"), TOKEN_BUCKETS, "Completion tokens per call"),
+        "fitx_llm_admission_wait_seconds": (("site",), LATENCY_BUCKETS, "Time calls queued for rate-limit budget"),
+        "fitx_script_run_seconds": (("step",), SCRIPT_BUCKETS, "Streamlit script run time per funnel step (FITX_PROFILE=1)"),
+        "fitx_job_queue_seconds": (("kind",), LATENCY_BUCKETS, "Time background jobs waited for a worker"),
+    }
+
+    def __init__(self, max_pending=MAX_PENDING):
+        self.counters = {name: {} for name in self.COUNTERS}
+        self.histograms = {name: {} for name in self.HISTOGRAMS}
+        self.pending = []  # call records waiting for the JSONL flush
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+
+    def _inc(self, name, labels, value=1):
+        series = self.counters[name]
+        series[labels] = series.get(labels, 0) + value
+
+    def _observe(self, name, labels, value):
+        series = self.histograms[name]
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(self.HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+    def observe_call(self, site, model, latency, ttft=None, usage=None, retries=0, error=None, cancelled=False, coalesced=False):
+        key = (site, model)
+        outcome = "error" if error else "cancelled" if cancelled else "ok"
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        with self._lock:
+            self._inc("fitx_llm_calls_total", key + (outcome,))
+            if error:
+                self._inc("fitx_llm_errors_total", key + (error,))
+            if retries:
+                self._inc("fitx_llm_retries_total", key, retries)
+            if coalesced:
+                self._inc("fitx_llm_coalesced_total", key)
+            self._observe("fitx_llm_latency_seconds", key, latency)
+            if ttft is not None:
+                self._observe("fitx_llm_ttft_seconds", key, ttft)
+            if prompt_tokens is not None:
+                self._inc("fitx_llm_tokens_total", key + ("prompt",), prompt_tokens)
+                self._inc("fitx_llm_tokens_total", key + ("cached",), cached_tokens)
+                self._observe("fitx_llm_prompt_tokens", key, prompt_tokens)
+            if completion_tokens is not None:
+                self._inc("fitx_llm_tokens_total", key + ("completion",), completion_tokens)
+                self._observe("fitx_llm_completion_tokens", key, completion_tokens)
+            if usage is not None:
+                self._inc("fitx_llm_cost_usd_total", key, call_cost(model, usage))
+            if len(self.pending) < self.max_pending:
+                self.pending.append({
+                    "at": time.time(), "site": site, "model": model, "outcome": outcome,
+                    "latency": latency, "ttft": ttft, "prompt_tokens": prompt_tokens,
+                    "cached_tokens": cached_tokens, "completion_tokens": completion_tokens,
+                    "retries": retries, "error": error, "coalesced": coalesced,
+                })
+
+    def observe_route(self, site, model, result):
+        with self._lock:
+            self._inc("fitx_llm_route_total", (site, model, result))
+
+    def observe_continuation(self, site, result):
+        with self._lock:
+            self._inc("fitx_llm_continuations_total", (site, result))
+
+    def regenerations_saved(self):
+        # Cut-off replies completed by a continuation instead of a full regeneration
+        with self._lock:
+            return {site: count for (site, result), count in self.counters["fitx_llm_continuations_total"].items() if result == "completed"}
+
+    def observe_meal_plan(self, source):
+        with self._lock:
+            self._inc("fitx_meal_plans_total", (source,))
+
+    def meal_plan_sources(self):
+        with self._lock:
+            return {source: count for (source,), count in self.counters["fitx_meal_plans_total"].items()}
+
+    def observe_job(self, kind, result):
+        with self._lock:
+            self._inc("fitx_jobs_total", (kind, result))
+
+    def observe_job_queue(self, kind, seconds):
+        with self._lock:
+            self._observe("fitx_job_queue_seconds", (kind,), seconds)
+
+    def observe_shed(self, site, reason):
+        with self._lock:
+            self._inc("fitx_llm_shed_total", (site, reason))
+
+    def observe_admission_wait(self, site, seconds):
+        with self._lock:
+            self._observe("fitx_llm_admission_wait_seconds", (site,), seconds)
+
+    def observe_script_run(self, step, seconds):
+        with self._lock:
+            self._observe("fitx_script_run_seconds", (step,), seconds)
+
+    def observe_prefetch(self, kind, result):
+        with self._lock:
+            self._inc("fitx_llm_prefetch_total", (kind, result))
+
+    def hit_rate(self, kind):
+        # Share of started prefetches of this kind that were used
+        with self._lock:
+            started = self.counters["fitx_llm_prefetch_total"].get((kind, "started"), 0)
+            hits = self.counters["fitx_llm_prefetch_total"].get((kind, "hit"), 0)
+        return hits / started if started else 0.0
+
+    def observe_cache(self, site, hit):
+        with self._lock:
+            self._inc("fitx_llm_cache_total", (site, "hit" if hit else "miss"))
+            if len(self.pending) < self.max_pending:
+                self.pending.append({"at": time.time(), "site": site, "cache": "hit" if hit else "miss"})
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, (label_names, help_text) in self.COUNTERS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for labels, value in sorted(self.counters[name].items()):
+                    lines.append(f"{name}{{{_labels(label_names, labels)}}} {value}")
+            for name, (label_names, buckets, help_text) in self.HISTOGRAMS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    base = _labels(label_names, labels)
+                    cumulative = 0
+                    for bound, count in zip(buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{base}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{base}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def flush_jsonl(self, path):
+        with self._lock:
+            records, self.pending = self.pending, []
+        if not records:
+            return 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return len(records)
+
+
+def serve_prometheus(metrics, port, host="0.0.0.0"):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            data = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("serving Prometheus metrics on %s:%d/metrics", host, port)
+    return server
+
+
+def _flush_periodically(metrics, path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            metrics.flush_jsonl(path)
+        except OSError:
+            logger.exception("metrics flush to %s failed", path)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+# Process-wide metrics shared by every Streamlit session; exporters start with the first call
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = LLMMetrics(max_pending=MAX_PENDING if METRICS_JSONL else 0)
+            if METRICS_PORT:
+                try:
+                    serve_prometheus(_metrics, int(METRICS_PORT))
+                except OSError:  # another app process already serves this port
+                    logger.warning("metrics port %s unavailable", METRICS_PORT)
+            if METRICS_JSONL:
+                threading.Thread(target=_flush_periodically, args=(_metrics, METRICS_JSONL, FLUSH_INTERVAL), name="metrics-flush", daemon=True).start()
+                atexit.register(_metrics.flush_jsonl, METRICS_JSONL)
+        return _metrics
+
+
+def record_cache(site, hit):
+    get_metrics().observe_cache(site, hit)
@@ -0,0 +1,161 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import deque
+
+from admission import Cancelled, Unavailable, cancellation_check, current_session_id, estimate_request_tokens, get_admission, is_low_priority, retryable_errors
+from llm_metrics import attempts, call_cost, get_metrics, reset_attempts
+from prompt_layout import prompt_cache_usage
+from single_flight import get_single_flight, payload_key
+
+# Shared streaming layer for every chat completion call.
+# A CompletionStream is an iterator of text deltas, so it can be handed straight
+# to st.write_stream; once exhausted it holds the assembled text plus timings.
+# Identical concurrent requests are coalesced into one upstream call (single_flight).
+# Every finished call is reported to llm_metrics (histograms, Prometheus/JSONL export).
+# Upstream requests are admitted, retried and shed by admission. A call made inside
+# admission.cancel_scope (a background job) stops before going upstream and at each
+# delta once its job is cancelled.
+
+logger = logging.getLogger("fitx.llm")
+
+# Most recent calls, newest last: site, model, ttft, latency, retries, error and token counts
+TIMINGS = deque(maxlen=1000)
+_timings_lock = threading.Lock()
+
+
+def record_timing(site, model, ttft, latency, usage=None, coalesced=False, retries=0, error=None, cancelled=False):
+    entry = {"site": site, "model": model, "ttft": ttft, "latency": latency, "coalesced": coalesced, "retries": retries, "error": error, "at": time.time()}
+    tokens = prompt_cache_usage(usage)
+    if tokens:
+        entry.update(tokens)
+        entry["completion_tokens"] = usage.completion_tokens
+        entry["cost"] = call_cost(model, usage)
+    with _timings_lock:
+        TIMINGS.append(entry)
+    get_metrics().observe_call(site, model, latency, ttft, usage, retries, error, cancelled, coalesced)
+    ttft_ms = f"{ttft * 1000:.0f}ms" if ttft is not None else "n/a"
+    cache_info = f" prompt={tokens['prompt_tokens']} cached={tokens['cached_tokens']}" if tokens else ""
+    status = f" error={error}" if error else " (cancelled)" if cancelled else " (coalesced)" if coalesced else ""
+    logger.info("%s %s ttft=%s total=%.0fms%s%s", site, model, ttft_ms, latency * 1000, cache_info, status)
+
+
+def recent_timings():
+    with _timings_lock:
+        return list(TIMINGS)
+
+
+class CompletionStream:
+    def __init__(self, client, site, **params):
+        self.client = client
+        self.site = site
+        self.params = params
+        self.text = ""
+        self.finish_reason = None
+        self.usage = None
+        self.ttft = None
+        self.latency = None
+        self.coalesced = False
+        self.retries = 0
+        self.error = None
+        self.session = current_session_id()  # captured on the calling (script) thread
+        self.low_priority = is_low_priority()
+        self.is_cancelled = cancellation_check()
+        self._consumed = False
+
+    def __iter__(self):
+        if self._consumed:
+            # Already streamed once: replay the assembled text
+            if self.text:
+                yield self.text
+            return
+        self._consumed = True
+
+        start = time.perf_counter()
+        parts = []
+        flight, leader = None, False
+        completed = False
+        try:
+            self._check_cancelled()
+            with get_admission().session_slot(self.site, self.session, self.low_priority):
+                self._check_cancelled()  # the slot may have been a long wait
+                flight, leader = get_single_flight().run(payload_key(self.params), self._produce)
+                self.coalesced = not leader
+                with contextlib.closing(flight.subscribe()) as deltas:
+                    for delta in deltas:
+                        self._check_cancelled()
+                        if self.ttft is None:
+                            self.ttft = time.perf_counter() - start
+                        parts.append(delta)
+                        yield delta
+            completed = True
+        except Cancelled:
+            raise
+        except Exception as exc:
+            self.error = type(exc.__cause__ if isinstance(exc, Unavailable) else exc).__name__
+            raise
+        finally:
+            self.text = "".join(parts)
+            self.latency = time.perf_counter() - start
+            meta = flight.meta if flight else {}
+            self.finish_reason = meta.get("finish_reason")
+            if leader:  # followers did not spend any tokens or retries
+                self.usage = meta.get("usage")
+                self.retries = meta.get("retries", 0)
+            record_timing(
+                self.site, self.params.get("model"), self.ttft, self.latency, self.usage, self.coalesced,
+                retries=self.retries, error=self.error, cancelled=not completed and self.error is None,
+            )
+
+    def _check_cancelled(self):
+        if self.is_cancelled is not None and self.is_cancelled():
+            raise Cancelled(self.site)
+
+    def _produce(self, flight):
+        # Runs in the single-flight producer thread, once per distinct in-flight payload
+        reset_attempts()
+
+        def create():
+            # Every subscriber may have left while this call waited for admission
+            if flight.cancelled:
+                raise Cancelled(self.site)
+            return self.client.chat.completions.create(
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.params
+            )
+
+        if flight.cancelled:
+            raise Cancelled(self.site)
+        try:
+            response = get_admission().call(self.site, estimate_request_tokens(self.params), create, self.low_priority)
+        finally:
+            flight.meta["retries"] = max(0, attempts() - 1)
+        try:
+            for chunk in response:
+                if flight.cancelled:
+                    break
+                if chunk.usage is not None:
+                    flight.meta["usage"] = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    flight.meta["finish_reason"] = choice.finish_reason
+                if choice.delta.content:
+                    flight.publish(choice.delta.content)
+        except retryable_errors() as exc:  # the stream broke off mid-reply
+            raise Unavailable(type(exc).__name__) from exc
+        finally:
+            response.close()
+
+    def read(self):
+        # Consume without rendering and return the full message
+        for _ in self:
+            pass
+        return self.text
+
+
+def stream_completion(client, site, **params):
+    return CompletionStream(client, site, **params)
@@ -0,0 +1,235 @@
+import hashlib
+import importlib.util
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# NumPy powers the optional similarity layer; it is imported on first use, off the
+# cold-start path
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+
+        np = numpy
+    return np
+
+# Two-layer cache for generated meal plans.
+# 1. Exact: the free-text preferences are canonicalized into a sorted set of restriction
+#    tags, so "Keto, no nuts" and "no nuts keto" share an entry.
+# 2. Similar (optional, needs NumPy): hashed character n-gram vectors of the canonical
+#    form; the closest cached entry is served when its cosine similarity clears a threshold
+#    and it honours every restriction in the request (a plain "keto" plan is never
+#    served for "keto, nut allergy", while the reverse is fine). A request with a
+#    restriction word the rules could not parse only takes exact hits.
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 7 * 24 * 3600  # 7 days
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+VECTOR_DIM = 1024
+NGRAMS = (2, 3)
+
+# Phrases that mean the same restriction, mapped to one canonical tag
+SYNONYMS = [
+    (r"\b(no|without|free of|avoid(ing)?) (tree ?)?nuts?\b|\b(tree ?)?nut[- ]?(free|allerg(y|ies|ic))\b", "nut-free"),
+    (r"\b(no|without|free of|avoid(ing)?) peanuts?\b|\bpeanut[- ]?(free|allerg(y|ies|ic))\b", "peanut-free"),
+    (r"\b(no|without|free of|avoid(ing)?) (dairy|milk|lactose)\b|\b(dairy|milk|lactose)[- ]?(free|intoleran(t|ce)|allerg(y|ies|ic))\b", "dairy-free"),
+    (r"\b(no|without|free of|avoid(ing)?) gluten\b|\bgluten[- ]?(free|intoleran(t|ce)|allerg(y|ies|ic))\b|\bcoeliac\b|\bceliac\b", "gluten-free"),
+    (r"\b(no|without|free of|avoid(ing)?) eggs?\b|\begg[- ]?(free|allerg(y|ies|ic))\b", "egg-free"),
+    (r"\b(no|without|free of|avoid(ing)?) (shellfish|seafood)\b|\b(shellfish|seafood)[- ]?(free|allerg(y|ies|ic))\b", "shellfish-free"),
+    (r"\b(no|without|free of|avoid(ing)?) soy\b|\bsoy[- ]?(free|allerg(y|ies|ic))\b", "soy-free"),
+    (r"\bketo(genic)?\b", "keto"),
+    (r"\blow[- ]?carb(s|ohydrate)?\b", "low-carb"),
+    (r"\bhigh[- ]?protein\b", "high-protein"),
+    (r"\bveggie\b|\bvegetarian\b", "vegetarian"),
+    (r"\bplant[- ]?based\b|\bvegan\b", "vegan"),
+    (r"\bpescatarian\b|\bpescetarian\b", "pescatarian"),
+]
+# Foods named by more than one word are joined into one token ("red meat" -> "red-meat") before
+# anything else, so "no red meat" becomes "red-meat-free" rather than "red-free" plus "meat"
+COMPOUND_FOODS = (
+    r"\b(?:red|white|processed|cured|deli|lunch|organ) meats?\b"
+    r"|\b(?:added|refined|cane) sugars?\b"
+    r"|\b(?:fried|fast|processed|junk|spicy) foods?\b"
+    r"|\b(?:raw|white|oily) fish\b"
+    r"|\b(?:white|brown) (?:rice|bread)\b"
+    r"|\b(?:soft|fizzy|energy) drinks?\b"
+)
+# "allergic to X", "intolerant to X and Y", "can't eat X, Y or Z" are rewritten to "no X no Y"
+# first, so the rules above and below see one restriction per item
+ALLERGY_ITEM = r"(?:any |all )?[a-z]+(?:-[a-z]+)*"
+ALLERGY = (
+    r"\b(?:allergic|allergy|allergies|intoleran(?:t|ce)|sensitive|sensitivity) (?:to|of)"
+    r"|\b(?:can'?t|cannot|can not|don'?t|do not|shouldn'?t|should not) (?:eat|have)"
+)
+ALLERGY_LIST = rf"(?:{ALLERGY}) ({ALLERGY_ITEM}(?:(?:\s*,\s*{ALLERGY_ITEM})*\s*,?\s+(?:and|or)\s+{ALLERGY_ITEM})?)"
+# Any other "no X" / "X-free" / "X allergy" becomes an "x-free" tag so the negation is kept
+NEGATION = r"\b(?:no|without|free of|avoid(?:ing)?) ([a-z]+(?:-[a-z]+)*)\b|\b([a-z]+(?:-[a-z]+)*?)[- ]?(?:free|allerg(?:y|ies|ic))\b"
+# Restriction words left over after canonicalizing mean a restriction was not understood
+LOOSE_RESTRICTION = r"\b(?:no|not|without|avoid\w*|allerg\w*|intoleran\w*|sensitiv\w*|can'?t|cannot|don'?t|shouldn'?t|except|free)\b"
+KNOWN_TAGS = {tag for _, tag in SYNONYMS}
+DIET_TAGS = {tag for tag in KNOWN_TAGS if not tag.endswith("-free")}
+STOPWORDS = {"a", "an", "and", "or", "i", "im", "i'm", "am", "have", "has", "my", "me", "with", "for", "of", "the", "diet", "please", "food", "foods", "meals", "plan", "prefer", "like", "eat", "is", "are"}
+# Words NEGATION may catch in front of "allergy" that are not what the user avoids
+NOT_FOODS = STOPWORDS | {"severe", "mild", "bad", "some", "any", "many", "multiple", "serious", "several", "few"}
+
+
+def _is_diet(item):
+    return any(re.search(pattern, item) for pattern, tag in SYNONYMS if tag in DIET_TAGS)
+
+
+def _allergy_list(match):
+    items = re.split(r"\s*,\s*(?:(?:and|or)\s+)?|\s+(?:and|or)\s+", match.group(1))
+    items = [re.sub(r"^(?:any|all) ", "", item) for item in items]
+    # "allergic to nuts, vegan and keto": a diet in the list is still a diet
+    return " ".join(item if _is_diet(item) else f"no {item}" for item in items)
+
+
+def _canonical(text):
+    # (tags, the text no rule consumed)
+    text = " ".join(str(text).lower().replace("&", " and ").replace("\u2019", "'").split())
+    text = re.sub(COMPOUND_FOODS, lambda match: match.group(0).replace(" ", "-"), text)
+    text = re.sub(ALLERGY_LIST, _allergy_list, text)
+    tags = set()
+    for pattern, tag in SYNONYMS:
+        if re.search(pattern, text):
+            tags.add(tag)
+            text = re.sub(pattern, " ", text)
+
+    def negation(match):
+        word = match.group(1) or match.group(2)
+        if word in NOT_FOODS:  # "severe allergies": left for loose_restriction to find
+            return match.group(0)
+        tags.add(f"{word}-free")
+        return " "
+
+    text = re.sub(NEGATION, negation, text)
+    words = re.findall(r"[a-z][a-z'-]*", text)
+    tags.update(word for word in words if word not in STOPWORDS)
+    return tuple(sorted(tags)), text
+
+
+def canonicalize(text):
+    return _canonical(text)[0]
+
+
+def loose_restriction(text):
+    # True when the request says "no", "allergic", "can't" about something canonicalize
+    # could not turn into an "x-free" tag; such requests never take a merely similar plan
+    return re.search(LOOSE_RESTRICTION, _canonical(text)[1]) is not None
+
+
+def restrictions(canonical):
+    return {tag for tag in canonical if tag in KNOWN_TAGS or tag.endswith("-free")}
+
+
+def vectorize(canonical):
+    # Hashed character n-grams of the canonical form, L2-normalized
+    np = _numpy()
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for tag in canonical:
+        padded = f" {tag} "
+        for n in NGRAMS:
+            for i in range(len(padded) - n + 1):
+                digest = hashlib.blake2b(padded[i:i + n].encode("utf-8"), digest_size=4).digest()
+                vector[int.from_bytes(digest, "little") % VECTOR_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class MealPlanCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD, use_similarity=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.use_similarity = use_similarity and NUMPY_AVAILABLE
+        self._entries = OrderedDict()  # key -> (expires_at, plan)
+        self._vectors = {}  # key -> n-gram vector (same namespace only)
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(canonical, namespace):
+        return (namespace, canonical)
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._vectors.pop(key, None)
+
+    def _most_similar(self, canonical, namespace, now):
+        required = restrictions(canonical)
+        keys = [
+            key for key in self._vectors
+            if key[0] == namespace and self._entries[key][0] > now and required.issubset(key[1])
+        ]
+        if not keys:
+            return None
+        np = _numpy()
+        matrix = np.stack([self._vectors[key] for key in keys])
+        scores = matrix @ vectorize(canonical)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    def get(self, text, namespace=""):
+        canonical = canonicalize(text)
+        if not canonical:
+            return None
+        key = self._key(canonical, namespace)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry[1]
+            if entry:
+                self._drop(key)
+
+            if self.use_similarity and not loose_restriction(text):
+                similar = self._most_similar(canonical, namespace, now)
+                if similar is not None:
+                    self._entries.move_to_end(similar)
+                    self.stats["similar_hits"] += 1
+                    return self._entries[similar][1]
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, text, plan, namespace=""):
+        canonical = canonicalize(text)
+        if not canonical or not plan:
+            return
+        key = self._key(canonical, namespace)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, plan)
+            self._entries.move_to_end(key)
+            if self.use_similarity:
+                self._vectors[key] = vectorize(canonical)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def hit_rate(self):
+        hits = self.stats["exact_hits"] + self.stats["similar_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Process-wide cache shared by every Streamlit session and rerun
+def get_meal_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MealPlanCache()
+        return _cache
@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+
+from meal_cache import canonicalize, loose_restriction
+
+# Local meal planner.
+# Almost every meal plan request is a diet, a few allergies and maybe a macro preference,
+# which the bundled recipe dataset (recipes.json) answers without a model: when it is
+# loaded, every recipe is indexed by meal, diet (vegan recipes also count as vegetarian
+# and pescatarian), macro tags derived from its numbers (keto, low-carb), allergens and
+# main ingredients, as one bitset per tag. A plan is then a few integer ANDs per meal,
+# ranked by the macro preference and picked with a seed derived from the request, so the
+# same preferences always get the same plan. The plan text (with kcal and macros from the
+# dataset, never from the model) is rendered here; coach.py only asks the model to phrase
+# it in Lex's voice. Requests the dataset cannot honour (an unknown ingredient, a cuisine,
+# a calorie target) get None and keep the free-prose prompt.
+#   python meal_planner.py "vegan, no nuts"
+
+logger = logging.getLogger("fitx.planner")
+
+FORMAT_VERSION = 1
+DEFAULT_PATH = os.getenv("FITX_RECIPES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipes.json"))
+ENABLED = os.getenv("FITX_MEAL_PLANNER", "1") != "0"
+DAYS = 3
+MEALS = ("breakfast", "lunch", "dinner")
+KETO_MAX_CARBS = 12  # grams per meal
+LOW_CARB_MAX_CARBS = 25
+
+# Diets a recipe also satisfies, by the diet it is tagged with
+DIETS = {
+    "vegan": ("vegan", "vegetarian", "pescatarian"),
+    "vegetarian": ("vegetarian", "pescatarian"),
+    "pescatarian": ("pescatarian",),
+    "omnivore": (),
+}
+# meal_cache tags that are hard filters on the recipe tags of the same name
+REQUIRED_TAGS = {"vegan", "vegetarian", "pescatarian", "keto", "low-carb"}
+# "x-free" tags (see meal_cache.canonicalize) -> allergen in the dataset
+ALLERGENS = {
+    "nut": "nuts", "nuts": "nuts", "peanut": "peanuts", "peanuts": "peanuts",
+    "dairy": "dairy", "gluten": "gluten", "wheat": "gluten", "egg": "egg", "eggs": "egg",
+    "shellfish": "shellfish", "fish": "fish", "soy": "soy", "sesame": "sesame",
+}
+# "x-free" tags for groups of main ingredients
+INGREDIENT_GROUPS = {
+    "pork": ("pork", "bacon", "ham"),
+    "beef": ("beef", "steak"),
+    "red-meat": ("beef", "steak", "pork", "bacon", "ham", "lamb"),
+    "poultry": ("chicken", "turkey"),
+}
+# Words that ask for a macro preference, and words that change nothing
+PREFERENCES = {"protein": "protein", "carb": "carbs", "carbs": "carbs", "carb-rich": "carbs", "high-carb": "carbs"}
+FILLER = {"balanced", "healthy", "simple", "easy", "quick", "clean", "normal", "regular", "high", "anything", "everything", "none", "nothing", "restrictions", "allergies", "preferences"}
+
+
+def _singular(word):
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _words(text):
+    return {_singular(word) for word in re.findall(r"[a-z]+", text.lower())}
+
+
+def kcal(recipe):
+    return int(round((4 * recipe["protein"] + 4 * recipe["carbs"] + 9 * recipe["fat"]) / 10.0) * 10)
+
+
+def recipe_tags(recipe):
+    tags = {f"meal:{recipe['meal']}", *DIETS[recipe["diet"]]}
+    if recipe["carbs"] <= KETO_MAX_CARBS:
+        tags.add("keto")
+    if recipe["carbs"] <= LOW_CARB_MAX_CARBS:
+        tags.add("low-carb")
+    tags.update(f"allergen:{allergen}" for allergen in recipe["allergens"])
+    for ingredient in recipe["ingredients"]:
+        tags.update(f"ingredient:{word}" for word in _words(ingredient))
+    return tags
+
+
+class RecipeBook:
+    def __init__(self, recipes, fingerprint):
+        self.recipes = recipes
+        self.fingerprint = fingerprint
+        self.index = {}  # tag -> bitset of recipe positions
+        for position, recipe in enumerate(recipes):
+            for tag in recipe_tags(recipe):
+                self.index[tag] = self.index.get(tag, 0) | 1 << position
+        self.everything = (1 << len(recipes)) - 1
+
+    def knows(self, tag):
+        return tag in self.index
+
+    def select(self, require=(), avoid=()):
+        # Recipes carrying every `require` tag and no `avoid` tag, in dataset order
+        mask = self.everything
+        for tag in require:
+            mask &= self.index.get(tag, 0)
+        for tag in avoid:
+            mask &= ~self.index.get(tag, 0)
+        return [recipe for position, recipe in enumerate(self.recipes) if mask >> position & 1]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        payload = json.loads(raw)
+        if payload.get("format") != FORMAT_VERSION:
+            raise ValueError(f"unsupported recipe format {payload.get('format')!r}")
+        recipes = payload["recipes"]
+        for recipe in recipes:
+            if recipe["meal"] not in MEALS or recipe["diet"] not in DIETS:
+                raise ValueError(f"recipe {recipe['name']!r} has an unknown meal or diet")
+        return cls(recipes, hashlib.sha256(raw).hexdigest()[:12])
+
+
+def parse_request(book, meal_input):
+    # Filters and preferences for a free-text request, or None when the dataset cannot
+    # honour all of it
+    if loose_restriction(meal_input):  # "I have allergies": the prose prompt asks the model to be careful
+        return None
+    tags = canonicalize(meal_input)
+    require, avoid, prefer = set(), set(), set()
+    for tag in tags:
+        if tag in REQUIRED_TAGS:
+            require.add(tag)
+        elif tag == "high-protein":
+            prefer.add("protein")
+        elif tag.endswith("-free"):
+            item = tag[:-len("-free")]
+            if item in ALLERGENS:
+                avoid.add(f"allergen:{ALLERGENS[item]}")
+            elif item in ("meat", "meats"):
+                require.add("vegetarian")
+            elif item in INGREDIENT_GROUPS:
+                avoid.update(f"ingredient:{word}" for word in INGREDIENT_GROUPS[item])
+            elif item in FILLER:  # "no restrictions"
+                continue
+            elif book.knows(f"ingredient:{_singular(item)}"):
+                avoid.add(f"ingredient:{_singular(item)}")
+            else:
+                return None
+        elif tag in PREFERENCES:
+            prefer.add(PREFERENCES[tag])
+        elif tag not in FILLER:
+            return None
+    if "shellfish-free" in tags and re.search(r"\bseafood\b", str(meal_input).lower()):
+        avoid.add("allergen:fish")  # canonicalize folds "no seafood" into shellfish-free
+    return {"key": "|".join(tags), "require": require, "avoid": avoid, "prefer": prefer}
+
+
+def _score(recipe, prefer):
+    calories = 4 * recipe["protein"] + 4 * recipe["carbs"] + 9 * recipe["fat"]
+    return sum(4 * recipe[macro] / calories for macro in prefer)
+
+
+def assemble(book, request):
+    # A 3-day plan for a parsed request, or None when some meal has no matching recipe
+    rng = random.Random(zlib.crc32(request["key"].encode("utf-8")))
+    picks = {}
+    for meal in MEALS:
+        candidates = book.select({f"meal:{meal}", *request["require"]}, request["avoid"])
+        if not candidates:
+            return None
+        candidates.sort(key=lambda recipe: -_score(recipe, request["prefer"]))
+        # The best-scoring half, so a preference shows without serving the same three meals to everyone
+        pool = candidates[:max(DAYS, len(candidates) // 2)]
+        rng.shuffle(pool)
+        picks[meal] = [pool[day % len(pool)] for day in range(DAYS)]
+    days = []
+    for day in range(DAYS):
+        meals = [dict(picks[meal][day], kcal=kcal(picks[meal][day])) for meal in MEALS]
+        totals = {field: sum(recipe[field] for recipe in meals) for field in ("kcal", "protein", "carbs", "fat")}
+        days.append({"day": day + 1, "meals": meals, "totals": totals})
+    return {"days": days}
+
+
+def plan_meals(meal_input, book=None):
+    # The local plan for a request, or None (planner disabled, no dataset, unsupported request)
+    if not ENABLED:
+        return None
+    book = book or get_recipe_book()
+    if book is None:
+        return None
+    request = parse_request(book, meal_input)
+    if request is None:
+        logger.info("meal planner cannot honour %r, using the free-prose prompt", meal_input)
+        return None
+    return assemble(book, request)
+
+
+def plan_outline(plan):
+    # What the model gets to phrase: the meals only, without the numbers
+    return [{"day": day["day"], **{meal["meal"]: meal["name"] for meal in day["meals"]}} for day in plan["days"]]
+
+
+def _line(value):
+    return " ".join(value.split()) if isinstance(value, str) else ""
+
+
+def parse_voice(text):
+    # {"intro", "days": [...], "outro"} from the model's JSON reply, or None
+    text = re.sub(r"^\s*```(?:json)?|```\s*$", "", text)
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    days = data.get("days")
+    voice = {
+        "intro": _line(data.get("intro")),
+        "days": [_line(note) for note in days[:DAYS]] if isinstance(days, list) else [],
+        "outro": _line(data.get("outro")),
+    }
+    if not (voice["intro"] or any(voice["days"]) or voice["outro"]):
+        return None
+    return voice
+
+
+def render_plan(plan, voice=None):
+    voice = voice or {}
+    notes = voice.get("days", [])
+    parts = [voice["intro"]] if voice.get("intro") else []
+    for i, day in enumerate(plan["days"]):
+        lines = [f"Day {day['day']}:"]
+        lines += [f"- {meal['meal'].capitalize()}: {meal['name']} ({meal['kcal']} kcal, {meal['protein']} g protein)" for meal in day["meals"]]
+        totals = day["totals"]
+        lines += ["", f"Total: {totals['kcal']:,} kcal · {totals['protein']} g protein · {totals['carbs']} g carbs · {totals['fat']} g fat"]
+        if i < len(notes) and notes[i]:
+            lines += ["", f"💡 {notes[i]}"]
+        parts.append("\n".join(lines))
+    if voice.get("outro"):
+        parts.append(voice["outro"])
+    return "\n\n".join(parts)
+
+
+_book = None
+_book_loaded = False
+_book_lock = threading.Lock()
+
+
+# Loaded once per process; None when the dataset is missing or unreadable
+def get_recipe_book(path=DEFAULT_PATH):
+    global _book, _book_loaded
+    with _book_lock:
+        if not _book_loaded:
+            try:
+                _book = RecipeBook.load(path)
+            except FileNotFoundError:
+                logger.info("no recipe dataset at %s, meal plans use the free-prose prompt", path)
+            except (OSError, ValueError, KeyError) as exc:
+                logger.warning("ignoring unreadable recipe dataset %s: %s", path, exc)
+            _book_loaded = True
+        return _book
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble a meal plan from the local recipe dataset")
+    parser.add_argument("preferences", nargs="?", default="balanced")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    book = RecipeBook.load(args.path)
+    started = time.perf_counter()
+    plan = plan_meals(args.preferences, book)
+    elapsed = (time.perf_counter() - started) * 1000
+    if plan is None:
+        print(f"{args.preferences!r} is outside the dataset; the app uses the free-prose prompt")
+    else:
+        print(render_plan(plan))
+    print(f"\n{len(book.recipes)} recipes, {len(book.index)} tags, planned in {elapsed:.2f} ms")
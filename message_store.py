@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from array import array
+
+# Compact chat history for session state.
+# A list of {"role", "content"} dicts costs a dict (plus its hash table) per message; with
+# thousands of sessions on one server that overhead is a sizeable share of resident memory.
+# MessageStore keeps roles as one byte each in an array and contents in a flat list of the
+# original strings. Reading it (iteration, indexing, messages()) builds short-lived dicts
+# that share those strings, so the OpenAI request never copies message text, and the
+# existing list-of-dicts code (context_window, transcript, prompt_layout) works unchanged.
+# Stores idle for FITX_SPILL_IDLE_SECONDS are spilled to disk by a background sweeper and
+# read back on the next access; len() and role counts never touch the disk.
+
+logger = logging.getLogger("fitx.messages")
+
+ROLES = ("system", "user", "assistant")
+ROLE_IDS = {role: i for i, role in enumerate(ROLES)}
+
+CACHE_DIR = os.getenv("FITX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+SPILL_DIR = os.getenv("FITX_SPILL_DIR", os.path.join(CACHE_DIR, "sessions"))
+SPILL_IDLE_SECONDS = float(os.getenv("FITX_SPILL_IDLE_SECONDS", "600"))  # 0 disables spilling
+SWEEP_INTERVAL = 60.0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class MessageStore:
+    __slots__ = ("_roles", "_contents", "_path", "_lock", "touched", "__weakref__")
+
+    def __init__(self, messages=(), spool=True):
+        self._roles = array("B")
+        self._contents = []  # None while spilled
+        self._path = None
+        self._lock = threading.Lock()
+        self.touched = time.monotonic()
+        self.extend(messages)
+        if spool and SPILL_IDLE_SECONDS > 0:
+            get_message_spool().register(self)
+
+    def _load(self):
+        # Caller holds the lock
+        self.touched = time.monotonic()
+        if self._contents is None:
+            with open(self._path, encoding="utf-8") as f:
+                self._contents = json.load(f)
+            _remove(self._path)
+        return self._contents
+
+    def append(self, message):
+        with self._lock:
+            contents = self._load()
+            self._roles.append(ROLE_IDS[message["role"]])
+            contents.append(message["content"])
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def clear(self):
+        with self._lock:
+            self._roles = array("B")
+            self._contents = []
+            if self._path:
+                _remove(self._path)
+
+    def __len__(self):
+        return len(self._roles)
+
+    def count_role(self, role):
+        return self._roles.count(ROLE_IDS[role])
+
+    def messages(self, start=0, stop=None):
+        # API view: fresh dicts around the stored strings
+        with self._lock:
+            contents = self._load()
+            return [{"role": ROLES[role], "content": content} for role, content in zip(self._roles[start:stop], contents[start:stop])]
+
+    def __iter__(self):
+        return iter(self.messages())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.messages()[index]
+        with self._lock:
+            contents = self._load()
+            return {"role": ROLES[self._roles[index]], "content": contents[index]}
+
+    @property
+    def spilled(self):
+        return self._contents is None
+
+    def spill(self, directory=SPILL_DIR):
+        with self._lock:
+            if self._contents is None or not self._contents:
+                return False
+            if self._path is None:
+                os.makedirs(directory, exist_ok=True)
+                self._path = os.path.join(directory, f"{uuid.uuid4().hex}.json")
+                weakref.finalize(self, _remove, self._path)  # an expired session leaves no file behind
+            tmp = f"{self._path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._contents, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self._path)
+            self._contents = None
+            return True
+
+
+class MessageSpool:
+    # Tracks every live store (weakly) and spills the ones left idle
+    def __init__(self, idle_seconds=SPILL_IDLE_SECONDS, directory=SPILL_DIR):
+        self.idle_seconds = idle_seconds
+        self.directory = directory
+        self.stats = {"spilled": 0, "failed": 0}
+        self._stores = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def register(self, store):
+        with self._lock:
+            self._stores.add(store)
+
+    def sweep(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            stores = list(self._stores)
+        for store in stores:
+            if store.spilled or now - store.touched < self.idle_seconds:
+                continue
+            try:
+                if store.spill(self.directory):
+                    self.stats["spilled"] += 1
+            except OSError:
+                self.stats["failed"] += 1
+                logger.exception("failed to spill an idle session to %s", self.directory)
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            self.sweep()
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_message_spool():
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = MessageSpool()
+            threading.Thread(target=_spool._run, args=(SWEEP_INTERVAL,), name="message-spool", daemon=True).start()
+        return _spool
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import re
+import statistics
+import threading
+
+from guardrails import complete
+from llm_metrics import get_metrics
+from llm_stream import recent_timings, stream_completion
+
+# Tiered model routing.
+# Each task (summary, meal plan, chat, context summary) is sent to the cheapest model the
+# routing rules allow; rules match on task, prompt size and conversation depth, first match
+# wins. When the output fails the task's validator (e.g. a meal plan without three days),
+# the same request is retried once on the large model (except NO_FALLBACK tasks). Replies cut off by max_tokens are
+# first continued (guardrails), so only replies that are wrong, not short, are regenerated.
+# Rules can be replaced with a JSON list in FITX_ROUTING_RULES (path), tiers with
+# FITX_SMALL_MODEL / FITX_LARGE_MODEL.
+
+logger = logging.getLogger("fitx.router")
+
+TIERS = {
+    "small": os.getenv("FITX_SMALL_MODEL", "gpt-4o-mini"),
+    "large": os.getenv("FITX_LARGE_MODEL", "gpt-4"),
+}
+
+DEFAULT_RULES = [
+    {"task": "summary", "model": "small"},
+    {"task": "context_summary", "model": "small"},
+    {"task": "meal_plan", "model": "small"},
+    {"task": "meal_plan_voice", "model": "small"},
+    {"task": "chat", "max_prompt_tokens": 1500, "max_depth": 8, "model": "small"},
+    {"task": "*", "model": "large"},
+]
+
+# Tasks whose invalid output is handled by the caller instead of a large-model retry:
+# meal_plan_voice asks for JSON mode, which the large tier (gpt-4) rejects with a 400
+NO_FALLBACK = {"meal_plan_voice"}
+
+MIN_SUMMARY_WORDS = 20
+
+
+def estimate_tokens(messages):
+    # Rough size for routing decisions only (budgeting uses context_window's tokenizer)
+    return sum(len(msg["content"]) for msg in messages) // 4
+
+
+def valid_summary(text):
+    return len(text.split()) >= MIN_SUMMARY_WORDS
+
+
+def valid_meal_plan(text):
+    days = {int(day) for day in re.findall(r"\bday\s*([1-3])\b", text, re.IGNORECASE)}
+    return days == {1, 2, 3}
+
+
+def valid_reply(text):
+    return bool(text.strip())
+
+
+def valid_json_object(text):
+    try:
+        return isinstance(json.loads(text), dict)
+    except ValueError:
+        return False
+
+
+VALIDATORS = {
+    "summary": valid_summary,
+    "meal_plan": valid_meal_plan,
+    "meal_plan_voice": valid_json_object,
+    "chat": valid_reply,
+    "context_summary": valid_reply,
+}
+
+
+class Router:
+    def __init__(self, rules=None, tiers=None):
+        self.rules = rules or DEFAULT_RULES
+        self.tiers = tiers or TIERS
+
+    def _model(self, name):
+        return self.tiers.get(name, name)  # a rule may also name a model directly
+
+    def pick(self, task, messages, depth=None):
+        prompt_tokens = estimate_tokens(messages)
+        if depth is None:
+            depth = sum(msg["role"] == "user" for msg in messages)
+        for rule in self.rules:
+            if rule.get("task", "*") not in ("*", task):
+                continue
+            if prompt_tokens > rule.get("max_prompt_tokens", float("inf")):
+                continue
+            if depth > rule.get("max_depth", float("inf")):
+                continue
+            return self._model(rule["model"])
+        return self.tiers["large"]
+
+    def fallback(self, task, model):
+        large = self.tiers["large"]
+        return large if model != large and task not in NO_FALLBACK else None
+
+
+def load_rules(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    global _router
+    with _router_lock:
+        if _router is None:
+            path = os.getenv("FITX_ROUTING_RULES")
+            _router = Router(load_rules(path) if path else None)
+        return _router
+
+
+def routed_completion(client, task, messages, render=None, depth=None, router=None, **params):
+    # Streams the routed model's reply through `render` and returns the finished CompletionStream;
+    # a reply that fails validation is regenerated (and re-rendered) once on the large model
+    router = router or get_router()
+    model = router.pick(task, messages, depth)
+    stream = stream_completion(client, task, model=model, messages=messages, **params)
+    if render is not None:
+        render(stream)
+    stream.read()
+    complete(client, task, model, messages, stream, render, **params)
+
+    validator = VALIDATORS.get(task)
+    fallback = router.fallback(task, model)
+    if validator is None or fallback is None or validator(stream.text):
+        get_metrics().observe_route(task, model, "ok")
+        return stream
+
+    logger.info("%s reply from %s failed validation, retrying on %s", task, model, fallback)
+    get_metrics().observe_route(task, model, "fallback")
+    stream = stream_completion(client, task, model=fallback, messages=messages, **params)
+    if render is not None:
+        render(stream)
+    stream.read()
+    complete(client, task, fallback, messages, stream, render, **params)
+    return stream
+
+
+def route_report(timings=None):
+    # Latency percentiles and cost per route (site, model) from the recent calls in llm_stream
+    if timings is None:
+        timings = recent_timings()
+    routes = {}
+    for entry in timings:
+        routes.setdefault((entry["site"], entry["model"]), []).append(entry)
+    report = []
+    for (site, model), entries in sorted(routes.items()):
+        latencies = sorted(entry["latency"] for entry in entries)
+        report.append({
+            "site": site,
+            "model": model,
+            "calls": len(entries),
+            "p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+            "completion_tokens": sum(entry.get("completion_tokens", 0) for entry in entries),
+            "cost_usd": round(sum(entry.get("cost", 0.0) for entry in entries), 6),
+        })
+    return report
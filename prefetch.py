@@ -0,0 +1,115 @@
+import logging
+import threading
+
+from admission import SHED_ERRORS, current_session_id, low_priority
+from coach import default_meal_input, generate_meal_plan
+from jobs import Job, JobPool
+from llm_metrics import get_metrics
+from meal_cache import canonicalize
+from model_router import routed_completion
+from prompt_layout import chat_messages
+
+# Speculative prefetch while the user reads the step 3 summary.
+# Almost everyone goes on to generate a meal plan and then chat with Lex, so both are
+# started in the background as soon as step 3 renders: the default meal plan for the
+# user's goal (it lands in the shared meal-plan cache) and a personalised chat opener.
+# When step 4 asks for a meal plan with the same restrictions, it re-issues the exact
+# prefetched request: a finished job is a cache hit and a running one is joined through
+# single_flight, streaming from the first token. Step 5 shows the opener as it streams.
+# Jobs are cancelled when the user starts over or asks for something else; a cancelled
+# job stops its stream, which closes the upstream request.
+
+logger = logging.getLogger("fitx.prefetch")
+
+MAX_WORKERS = 8
+OPENER_REQUEST = (
+    "(The user just opened the chat. Greet them by name in one or two short sentences "
+    "and ask one question about what is holding them back.)"
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_prefetch_pool():
+    # Apart from the jobs pool (jobs.py) and shared by every session, so speculative work
+    # stays bounded process-wide and never delays a job the user is waiting for
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = JobPool(MAX_WORKERS, "prefetch")
+        return _pool
+
+
+class PrefetchJob(Job):
+    def __init__(self, kind, fn, key, request=None, session_id=None):
+        super().__init__(kind, fn, session_id, key)  # key: what was speculated on, compared with the real request
+        self.request = request
+
+    def result(self, timeout=None):
+        # None when cancelled, shed or failed: the caller then does the work itself
+        try:
+            return super().result(timeout)
+        except SHED_ERRORS as exc:
+            logger.info("%s prefetch shed: %s", self.kind, exc)
+            return None
+        except Exception:
+            logger.exception("%s prefetch failed", self.kind)
+            return None
+
+
+class Prefetcher:
+    # One per session (kept in st.session_state)
+    def __init__(self, client):
+        self.client = client
+        self.jobs = {}
+
+    def _start(self, kind, key, fn, request=None):
+        if kind in self.jobs:
+            return
+
+        def run(job):
+            with low_priority():  # speculative work is shed before user-facing calls
+                return fn(job)
+
+        # On the script thread, so the prefetch counts against the session's prefetch cap
+        job = get_prefetch_pool().submit(PrefetchJob(kind, run, key, request, current_session_id()))
+        self.jobs[kind] = job
+        get_metrics().observe_prefetch(kind, "started")
+
+    def start(self, memory, system_prompt):
+        # Idempotent, so it can be called on every step 3 rerun
+        meal_input = default_meal_input(memory.get("goal"))
+        self._start("meal_plan", canonicalize(meal_input), lambda job: generate_meal_plan(self.client, meal_input, render=job.render), meal_input)
+        self._start("chat_opener", memory.get("name"), lambda job: self._opener(job, memory, system_prompt))
+
+    def _opener(self, job, memory, system_prompt):
+        messages = chat_messages([system_prompt], memory, "", [{"role": "user", "content": OPENER_REQUEST}])
+        return routed_completion(self.client, "chat", messages, render=job.render, temperature=0.7, max_tokens=120).text
+
+    def take(self, kind):
+        # Result of the job (waiting for it if still running), or None if there is none
+        job = self.jobs.pop(kind, None)
+        if job is None:
+            return None
+        result = job.result()
+        get_metrics().observe_prefetch(kind, "hit" if result else "miss")
+        return result
+
+    def meal_request(self, meal_input):
+        # The prefetched request text when it asks for the same restrictions, else meal_input
+        job = self.jobs.pop("meal_plan", None)
+        if job is None:
+            return meal_input
+        if job.key != canonicalize(meal_input):
+            job.cancel()
+            get_metrics().observe_prefetch("meal_plan", "miss")
+            return meal_input
+        get_metrics().observe_prefetch("meal_plan", "hit")
+        return job.request
+
+    def cancel(self):
+        for job in self.jobs.values():
+            job.cancel()
+            get_metrics().observe_prefetch(job.kind, "cancelled")
+        self.jobs = {}
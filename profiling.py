@@ -0,0 +1,147 @@
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+
+# Startup and rerun profiling, enabled with FITX_PROFILE=1.
+# - Imports: a meta path hook times every module import (cumulative and self time), so
+#   the cold-start cost shows up per module, including imports made lazily in later steps.
+# - Script runs: each app marks the start of a run (start_run, first thing in the script)
+#   and its end (finish_run at the bottom, and Funnel just before st.rerun), so every run
+#   is attributed to the step it rendered, with the imports it triggered.
+# Runs are logged, exported as the fitx_script_run_seconds histogram, and summarized by
+# report() (benchmarks/run.py --profile). Disabled, both calls are no-ops.
+
+logger = logging.getLogger("fitx.profile")
+
+ENABLED = os.getenv("FITX_PROFILE") == "1"
+MAX_RUNS = 10000  # per-step samples kept for report()
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    def __init__(self):
+        self.records = []  # (name, cumulative seconds, self seconds, nested)
+        self._stack = threading.local()
+        self._lock = threading.Lock()
+
+    def find_spec(self, name, path, target=None):
+        # Defers to the rest of sys.meta_path, then wraps the loader to time module execution
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if loader is None or not hasattr(loader, "exec_module") or getattr(loader, "_fitx_timed", False):
+            return spec
+        spec.loader = _TimedLoader(loader, self)
+        return spec
+
+    def _enter(self):
+        stack = getattr(self._stack, "frames", None)
+        if stack is None:
+            stack = self._stack.frames = []
+        stack.append(0.0)  # time spent in nested imports
+        return stack
+
+    def _exit(self, name, elapsed, stack):
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with self._lock:
+            self.records.append((name, elapsed, elapsed - children, bool(stack)))
+
+    def total(self):
+        with self._lock:
+            return sum(elapsed for _, elapsed, _, nested in self.records if not nested)
+
+    def top(self, count=10):
+        # Direct imports (cumulative) and the heaviest modules by self time
+        with self._lock:
+            records = list(self.records)
+        direct = sorted((r for r in records if not r[3]), key=lambda r: -r[1])[:count]
+        heaviest = sorted(records, key=lambda r: -r[2])[:count]
+        return (
+            [{"module": name, "ms": round(elapsed * 1000, 1)} for name, elapsed, _, _ in direct],
+            [{"module": name, "self_ms": round(own * 1000, 1)} for name, _, own, _ in heaviest],
+        )
+
+
+class _TimedLoader(importlib.abc.Loader):
+    _fitx_timed = True
+
+    def __init__(self, loader, timer):
+        self.loader = loader
+        self.timer = timer
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self.timer._enter()
+        started = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.timer._exit(module.__name__, time.perf_counter() - started, stack)
+
+    def __getattr__(self, name):
+        # get_resource_reader, is_package, ... of the wrapped loader
+        return getattr(self.loader, name)
+
+
+_imports = None
+_runs = {}  # step -> [seconds, ...]
+_runs_lock = threading.Lock()
+_current = threading.local()  # the run executing on this script thread
+
+if ENABLED:
+    _imports = ImportTimer()
+    sys.meta_path.insert(0, _imports)
+
+
+def start_run():
+    if not ENABLED:
+        return
+    _current.run = (time.perf_counter(), _imports.total())
+
+
+def finish_run(step):
+    # Ends the current run on this thread (idempotent: only the first call counts)
+    run = getattr(_current, "run", None) if ENABLED else None
+    if run is None:
+        return
+    _current.run = None
+    started, imported = run
+    elapsed = time.perf_counter() - started
+    import_ms = (_imports.total() - imported) * 1000
+    with _runs_lock:
+        samples = _runs.setdefault(step, [])
+        if len(samples) < MAX_RUNS:
+            samples.append(elapsed)
+    from llm_metrics import get_metrics  # not at the top: this module loads before anything it times
+
+    get_metrics().observe_script_run(step, elapsed)
+    logger.info("script run step=%s %.1fms (imports %.1fms)", step, elapsed * 1000, import_ms)
+
+
+def report():
+    if not ENABLED:
+        return None
+    steps = {}
+    with _runs_lock:
+        for step, samples in _runs.items():
+            ordered = sorted(samples)
+            steps[step] = {
+                "runs": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+    direct, heaviest = _imports.top()
+    return {"import_ms": round(_imports.total() * 1000, 1), "imports": direct, "heaviest_imports": heaviest, "steps": steps}
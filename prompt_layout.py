@@ -0,0 +1,72 @@
+# Cache-friendly message assembly.
+# Provider-side prompt caching only applies to an identical leading run of tokens, so
+# every prompt is laid out as: one static system message (persona + guidelines), the
+# user's profile (fixed per user), then the content that changes (rolling summary,
+# conversation turns, the request itself). Static parts are rendered deterministically
+# so the same inputs always produce the same bytes.
+
+# Lex's chat persona, shared by the apps
+LEX_SYSTEM_PROMPT = """
+You are Lex, a friendly, energetic, and motivational fitness coach.
+You always speak in an upbeat, supportive tone. You use emojis sometimes to sound fun and engaging.
+You're casual and feel like a gym buddy. If the user feels down or unmotivated, cheer them up.
+
+Avoid sounding robotic or formal. Keep your replies short, helpful, and fun. Be proactive and helpful.
+"""
+
+COACHING_GUIDELINES = """
+Coaching guidelines:
+- Stay within fitness, nutrition, sleep, recovery and motivation.
+- Tailor advice to the user's goal, main struggle and timeline when you know them.
+- Prefer one or two concrete next steps over long lists.
+- Never give medical diagnoses; suggest seeing a professional for injuries, pain or medical conditions.
+- Respect dietary restrictions and allergies exactly as stated.
+"""
+
+PROFILE_FIELDS = [("name", "Name"), ("goal", "Goal"), ("struggle", "Struggle"), ("timeline", "Timeline")]
+
+
+def _clean(text):
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+
+def static_prefix(*system_prompts, guidelines=True):
+    parts = [_clean(prompt) for prompt in system_prompts if prompt and prompt.strip()]
+    if guidelines:
+        parts.append(_clean(COACHING_GUIDELINES))
+    return {"role": "system", "content": "\n\n".join(parts)}
+
+
+def profile_message(memory):
+    lines = [f"{label}: {_clean(str(memory[field]))}" for field, label in PROFILE_FIELDS if memory.get(field)]
+    if not lines:
+        return None
+    return {"role": "system", "content": "What you know about this user:\n" + "\n".join(lines)}
+
+
+def chat_messages(system_prompts, memory=None, summary="", turns=()):
+    messages = [static_prefix(*system_prompts)]
+    profile = profile_message(memory or {})
+    if profile:
+        messages.append(profile)
+    if summary:
+        messages.append({"role": "system", "content": "Summary of the earlier conversation:\n" + _clean(summary)})
+    messages.extend({"role": msg["role"], "content": msg["content"]} for msg in turns)
+    return messages
+
+
+def task_messages(instructions, request):
+    # Single-shot tasks: fixed instructions first, only the variable request in the user turn
+    return [
+        {"role": "system", "content": _clean(instructions)},
+        {"role": "user", "content": _clean(request)}
+    ]
+
+
+def prompt_cache_usage(usage):
+    if usage is None:
+        return None
+    prompt_tokens = usage.prompt_tokens or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    return {"prompt_tokens": prompt_tokens, "cached_tokens": cached, "uncached_tokens": prompt_tokens - cached}
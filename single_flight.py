@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import threading
+
+# Process-wide request coalescing ("single flight").
+# Concurrent calls with an identical canonical payload share one upstream request: the
+# first caller starts a producer thread that publishes chunks to a Flight, and every
+# caller, first or not, streams the same chunks from it. The upstream call is cancelled
+# only when every subscriber has gone away.
+
+logger = logging.getLogger("fitx.singleflight")
+
+STATS = {"leaders": 0, "coalesced": 0}
+_stats_lock = threading.Lock()
+
+
+def payload_key(params):
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.meta = {}
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.subscribers = 0
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def subscribe(self):
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self.chunks) and not self.done:
+                        self._cond.wait()
+                    pending = self.chunks[index:]
+                    index = len(self.chunks)
+                    finished = self.done
+                yield from pending
+                if finished and index >= len(self.chunks):
+                    break
+            if self.error is not None:
+                raise self.error
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+                if self.subscribers <= 0 and not self.done:
+                    self.cancelled = True
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, producer):
+        # Returns (flight, is_leader); producer(flight) runs once per flight in its own thread
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                with flight._cond:
+                    joined = not flight.cancelled
+                    if joined:
+                        flight.subscribers += 1
+                if joined:
+                    with _stats_lock:
+                        STATS["coalesced"] += 1
+                    logger.debug("coalesced request %s", key[:12])
+                    return flight, False
+
+            flight = Flight(key)
+            flight.subscribers = 1
+            self._flights[key] = flight
+            with _stats_lock:
+                STATS["leaders"] += 1
+
+        threading.Thread(target=self._produce, args=(key, flight, producer), name="single-flight", daemon=True).start()
+        return flight, True
+
+    def _produce(self, key, flight, producer):
+        error = None
+        try:
+            producer(flight)
+        except Exception as exc:
+            error = exc
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.finish(error)
+
+
+_group = SingleFlight()
+
+
+def get_single_flight():
+    return _group
@@ -0,0 +1,154 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Two-tier cache for the step 3 summary: an in-process LRU in front of a SQLite file.
+# The summary only depends on (goal, struggle, timeline), so the same answers always
+# map to the same entry no matter which session or rerun asks for it.
+
+CACHE_DIR = os.getenv("FITX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+DEFAULT_DB_PATH = os.path.join(CACHE_DIR, "summaries.sqlite3")
+DEFAULT_TTL = 30 * 24 * 3600  # 30 days
+DEFAULT_MEMORY_SIZE = 128
+DEFAULT_MAX_ROWS = 2000
+
+
+def normalize_answer(value):
+    # "🏋️‍♂️ Build muscle " -> "build muscle"
+    return " ".join(re.findall(r"[^\W_]+", str(value).lower()))
+
+
+def summary_key(answers, model, prompt_version):
+    parts = [normalize_answer(answers[field]) for field in ("goal", "struggle", "timeline")]
+    raw = json.dumps(parts + [model, prompt_version], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, path=DEFAULT_DB_PATH, memory_size=DEFAULT_MEMORY_SIZE, max_rows=DEFAULT_MAX_ROWS, ttl=DEFAULT_TTL):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (expires_at, summary)
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " key TEXT PRIMARY KEY,"
+            " summary TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _remember(self, key, expires_at, summary):
+        self._memory[key] = (expires_at, summary)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+            row = self._db.execute(
+                "SELECT summary, expires_at FROM summaries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, row[1], row[0])
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+    def set(self, key, summary):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, summary)
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, created_at, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, summary, now, expires_at, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM summaries WHERE expires_at <= ?", (now,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()
+        if count > self.max_rows:
+            # Drop the least recently used rows beyond the size limit
+            self._db.execute(
+                "DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_rows,)
+            )
+
+    def get_or_create(self, answers, model, prompt_version, generate):
+        key = summary_key(answers, model, prompt_version)
+        summary = self.get(key)
+        if summary is None:
+            summary = generate()
+            self.set(key, summary)
+        return summary
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Process-wide cache shared by every Streamlit session and rerun
+def get_summary_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SummaryCache()
+        return _cache
+
+
+def prewarm(client, cache=None):
+    import coach
+
+    cache = cache or get_summary_cache()
+    combos = list(itertools.product(coach.GOAL_OPTIONS, coach.STRUGGLE_OPTIONS, coach.TIMELINE_OPTIONS))
+    for goal, struggle, timeline in combos:
+        coach.generate_summary(client, {"goal": goal, "struggle": struggle, "timeline": timeline}, cache=cache)
+    return len(combos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the FitxFearless summary cache")
+    parser.add_argument("command", choices=["prewarm", "stats"])
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    args = parser.parse_args()
+
+    cache = SummaryCache(path=args.db)
+    if args.command == "prewarm":
+        from llm_client import get_client
+
+        count = prewarm(get_client(), cache=cache)
+        print(f"Pre-warmed {count} summaries ({cache.stats['misses']} generated)")
+    else:
+        (rows,) = cache._db.execute("SELECT COUNT(*) FROM summaries WHERE expires_at > ?", (time.time(),)).fetchone()
+        print(f"{rows} live summaries in {args.db}")
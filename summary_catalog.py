@@ -0,0 +1,175 @@
+import argparse
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from guardrails import complete
+from llm_stream import stream_completion
+from model_router import TIERS, valid_summary
+from summary_cache import normalize_answer
+
+# Precomputed step 3 summaries.
+# The summary only depends on goal, struggle and timeline, all picked from fixed option
+# lists, so an offline batch job generates every combination (optionally several variants)
+# into a small gzipped JSON artifact. The app serves from it with no network call and
+# personalises the text locally with the user's name. The artifact records a fingerprint
+# of the option lists and prompt version; when those change it is ignored and summaries
+# are generated live until the catalog is rebuilt.
+#   python summary_catalog.py build --variants 3 --workers 8
+#   python summary_catalog.py info
+
+logger = logging.getLogger("fitx.catalog")
+
+FORMAT_VERSION = 1
+DEFAULT_PATH = os.getenv("FITX_SUMMARY_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "summary_catalog.json.gz"))
+DEFAULT_WORKERS = 8
+MAX_ATTEMPTS = 3  # per variant, when the output fails validation
+NAME_PLACEHOLDER = "{name}"
+NAME_INSTRUCTION = f"Greet the user once at the start using the exact placeholder {NAME_PLACEHOLDER} in place of their name."
+
+
+def fingerprint(goal_options, struggle_options, timeline_options, prompt_version):
+    raw = json.dumps([goal_options, struggle_options, timeline_options, prompt_version], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def catalog_key(answers):
+    return "|".join(normalize_answer(answers[field]) for field in ("goal", "struggle", "timeline"))
+
+
+def personalize(text, name):
+    name = (name or "").strip()
+    if NAME_PLACEHOLDER in text:
+        return text.replace(NAME_PLACEHOLDER, name or "there")
+    return f"Hey {name}! {text}" if name else text
+
+
+class SummaryCatalog:
+    def __init__(self, entries, fingerprint, model=None, created_at=None):
+        self.entries = entries  # catalog_key -> [variant, ...]
+        self.fingerprint = fingerprint
+        self.model = model
+        self.created_at = created_at
+
+    def lookup(self, answers, name=None):
+        variants = self.entries.get(catalog_key(answers))
+        if not variants:
+            return None
+        # Stable per user, so reruns keep showing the same variant
+        variant = variants[zlib.crc32((name or "").encode("utf-8")) % len(variants)]
+        return personalize(variant, name)
+
+    def save(self, path):
+        payload = {
+            "format": FORMAT_VERSION,
+            "fingerprint": self.fingerprint,
+            "model": self.model,
+            "created_at": self.created_at,
+            "entries": self.entries,
+        }
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)  # readers never see a half-written catalog
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("format") != FORMAT_VERSION:
+            raise ValueError(f"unsupported catalog format {payload.get('format')!r}")
+        return cls(payload["entries"], payload["fingerprint"], payload.get("model"), payload.get("created_at"))
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+# Loaded once per process; None when the artifact is missing or built for other options
+def get_summary_catalog(expected_fingerprint, path=DEFAULT_PATH):
+    with _catalogs_lock:
+        if (path, expected_fingerprint) not in _catalogs:
+            catalog = None
+            try:
+                catalog = SummaryCatalog.load(path)
+            except FileNotFoundError:
+                logger.info("no summary catalog at %s, generating summaries live", path)
+            except (OSError, ValueError, KeyError) as exc:
+                logger.warning("ignoring unreadable summary catalog %s: %s", path, exc)
+            if catalog is not None and catalog.fingerprint != expected_fingerprint:
+                logger.warning("summary catalog %s is stale (options or prompt changed), generating live", path)
+                catalog = None
+            _catalogs[path, expected_fingerprint] = catalog
+        return _catalogs[path, expected_fingerprint]
+
+
+def _generate_variant(client, answers, model, variant):
+    import coach
+
+    messages = coach.summary_messages(answers)
+    messages[0] = {"role": "system", "content": f"{messages[0]['content']}\n\n{NAME_INSTRUCTION}"}
+    text = ""
+    for attempt in range(MAX_ATTEMPTS):
+        params = {
+            "temperature": 0.9,  # variants of the same combination should differ
+            "max_tokens": 150,
+            "seed": variant * MAX_ATTEMPTS + attempt,  # distinct payloads, never coalesced together
+        }
+        stream = stream_completion(client, "summary_catalog", model=model, messages=messages, **params)
+        stream.read()
+        complete(client, "summary", model, messages, stream, site="summary_catalog", **params)  # cut off: continued, not redrawn
+        text = stream.text.strip()
+        if valid_summary(text):
+            break
+    return text
+
+
+def build(client, variants=1, workers=DEFAULT_WORKERS, model=None):
+    import coach
+
+    model = model or TIERS["large"]  # offline, so quality over latency
+    combos = [
+        {"goal": goal, "struggle": struggle, "timeline": timeline}
+        for goal, struggle, timeline in itertools.product(coach.GOAL_OPTIONS, coach.STRUGGLE_OPTIONS, coach.TIMELINE_OPTIONS)
+    ]
+    jobs = [(answers, variant) for answers in combos for variant in range(variants)]
+    entries = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (answers, _), text in zip(jobs, pool.map(lambda job: _generate_variant(client, job[0], model, job[1]), jobs)):
+            if text:
+                entries.setdefault(catalog_key(answers), []).append(text)
+    return SummaryCatalog(entries, coach.summary_fingerprint(), model, time.time())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect the precomputed summary catalog")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--variants", type=int, default=1, help="summaries per answer combination")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent requests")
+    parser.add_argument("--model", help=f"defaults to the large tier ({TIERS['large']})")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from llm_client import get_client
+
+        started = time.perf_counter()
+        catalog = build(get_client(), args.variants, args.workers, args.model)
+        catalog.save(args.path)
+        count = sum(len(variants) for variants in catalog.entries.values())
+        print(f"Wrote {count} summaries for {len(catalog.entries)} combinations to {args.path} in {time.perf_counter() - started:.1f}s")
+    else:
+        import coach
+
+        catalog = SummaryCatalog.load(args.path)
+        count = sum(len(variants) for variants in catalog.entries.values())
+        current = "current" if catalog.fingerprint == coach.summary_fingerprint() else "stale"
+        built = time.strftime("%Y-%m-%d %H:%M", time.localtime(catalog.created_at)) if catalog.created_at else "unknown"
+        print(f"{count} summaries for {len(catalog.entries)} combinations, model {catalog.model}, built {built}, {current}")
@@ -0,0 +1,62 @@
+import functools
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeResponse:
+    # A streamed chat completion: one chunk per delta
+    def __init__(self, deltas):
+        self._chunks = iter(
+            SimpleNamespace(usage=None, choices=[SimpleNamespace(finish_reason=None, delta=SimpleNamespace(content=delta))])
+            for delta in deltas
+        )
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    # Stands in for the OpenAI client; records the requests that reached "upstream"
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    @property
+    def calls(self):
+        return len(self.requests)
+
+    def _create(self, **params):
+        self.requests.append(params)
+        return FakeResponse(self.deltas)
+
+
+@pytest.fixture
+def fake_client():
+    return lambda *deltas: FakeClient(deltas or ("Hi", " there"))
+
+
+class NoLeads:
+    def submit(self, event, memory):
+        return True
+
+
+@pytest.fixture
+def coach_engine(fake_client, monkeypatch):
+    # A CoachEngine on an in-memory store, signing resume tokens with a test secret
+    import conversation_store
+    import engine
+
+    monkeypatch.setattr(engine, "get_lead_sink", NoLeads)
+    monkeypatch.setattr(engine, "resume_token", functools.partial(conversation_store.resume_token, secret="test"))
+    monkeypatch.setattr(engine, "verify_token", functools.partial(conversation_store.verify_token, secret="test"))
+    return engine.CoachEngine(fake_client("Let's ", "do this!"), conversation_store.ConversationStore(":memory:"))
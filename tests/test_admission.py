@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from admission import AdmissionController, Overloaded, parse_duration
+
+
+def test_parse_duration_reads_rate_limit_reset_headers():
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("0.5") == 0.5
+    assert parse_duration("") is None
+    assert parse_duration("soon") is None
+
+
+def test_session_cap_sheds_the_extra_call():
+    admission = AdmissionController(max_wait=0.1, session_concurrency=2)
+    with admission.session_slot("chat", "alice"), admission.session_slot("chat", "alice"):
+        with pytest.raises(Overloaded, match="session_cap"):
+            with admission.session_slot("chat", "alice"):
+                pass
+        with admission.session_slot("chat", "bob"):  # other sessions are not held back
+            pass
+        with admission.session_slot("chat", None):  # calls outside a session are not capped
+            pass
+    assert admission.sessions == {}
+
+
+def test_session_slot_waits_for_a_free_slot():
+    admission = AdmissionController(max_wait=5, session_concurrency=1)
+    admitted = threading.Event()
+
+    def second_call():
+        with admission.session_slot("chat", "alice"):
+            admitted.set()
+
+    with admission.session_slot("chat", "alice"):
+        waiter = threading.Thread(target=second_call)
+        waiter.start()
+        assert not admitted.wait(0.1)
+    assert admitted.wait(5)
+    waiter.join(5)
+
+
+def test_call_that_would_wait_too_long_is_shed():
+    admission = AdmissionController(rpm=1, tpm=100000, max_wait=0.1)
+    admission.acquire("chat", 10)
+    with pytest.raises(Overloaded, match="rate_limit"):
+        admission.acquire("chat", 10)
+
+
+def test_low_priority_call_is_shed_before_the_reserve():
+    admission = AdmissionController(rpm=100, tpm=1000, max_wait=0.1)
+    with pytest.raises(Overloaded, match="low_priority"):
+        admission.acquire("chat", 900, low_priority=True)
+    admission.acquire("chat", 900)  # the same call for a waiting user still goes through
+
+
+def test_server_headers_resize_the_buckets():
+    admission = AdmissionController(rpm=500, tpm=300000)
+    admission.observe_headers({
+        "x-ratelimit-limit-requests": "60",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "1s",
+    })
+    requests = admission.buckets["requests"]
+    assert requests.capacity == 60
+    assert requests.level == 0
+    assert requests.wait_time(1) == pytest.approx(1 / 60)
+
+
+def test_prefetches_never_hold_the_slots_of_a_waiting_user():
+    admission = AdmissionController(max_wait=0.1, session_concurrency=2, prefetch_concurrency=2)
+    with admission.session_slot("meal_plan_voice", "alice", low_priority=True), admission.session_slot("chat", "alice", low_priority=True):
+        with pytest.raises(Overloaded, match="session_cap"):  # a third prefetch waits its turn
+            with admission.session_slot("chat", "alice", low_priority=True):
+                pass
+        with admission.session_slot("summary", "alice"):
+            assert admission.sessions == {("alice", True): 2, ("alice", False): 1}
+    assert admission.sessions == {}
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")  # TestClient
+
+from fastapi.testclient import TestClient
+
+import api
+from coach import GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS
+
+
+@pytest.fixture
+def client(coach_engine, monkeypatch):
+    monkeypatch.setattr(api, "get_engine", lambda: coach_engine)
+    return TestClient(api.app)
+
+
+def _onboard(client):
+    session_id = client.post("/v1/sessions").json()["session_id"]
+    client.post(f"/v1/sessions/{session_id}/answers", json={"name": "Alice", "email": "alice@example.com", "goal": GOAL_OPTIONS[0]})
+    client.post(f"/v1/sessions/{session_id}/answers", json={"struggle": STRUGGLE_OPTIONS[0]})
+    view = client.post(f"/v1/sessions/{session_id}/answers", json={"timeline": TIMELINE_OPTIONS[0]}).json()
+    return session_id, view
+
+
+def test_errors_map_to_status_codes(client):
+    session_id = client.post("/v1/sessions").json()["session_id"]
+    assert client.get("/v1/sessions/nope").status_code == 404
+    assert client.post(f"/v1/sessions/{session_id}/answers", json={"timeline": TIMELINE_OPTIONS[0]}).status_code == 422
+    assert client.post(f"/v1/sessions/{session_id}/chat", json={"message": "hi"}).status_code == 409
+
+
+def test_chat_streams_server_sent_events(client):
+    session_id, _ = _onboard(client)
+    response = client.post(f"/v1/sessions/{session_id}/chat?stream=true", json={"message": "hi"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert 'event: delta\ndata: {"text": "Let\'s "}' in response.text
+    assert response.text.rstrip().endswith('event: done\ndata: {"text": "Let\'s do this!"}')
+
+
+def test_resume_token_continues_the_conversation(client):
+    session_id, view = _onboard(client)
+    client.post(f"/v1/sessions/{session_id}/chat", json={"message": "hi"})
+    resumed = client.post("/v1/sessions", json={"resume": view["resume_token"]}).json()
+    assert resumed["step"] == "chat"
+    assert len(client.get(f"/v1/sessions/{resumed['session_id']}/messages").json()["turns"]) == 2
@@ -0,0 +1,93 @@
+import threading
+
+from context_window import ContextWindow
+
+SYSTEM = {"role": "system", "content": "You are Lex."}
+
+
+def _history(exchanges):
+    turns = [SYSTEM]
+    for n in range(exchanges):
+        turns.append({"role": "user", "content": f"question {n}"})
+        turns.append({"role": "assistant", "content": f"answer {n}"})
+    return turns
+
+
+def _window():
+    return ContextWindow(keep_turns=2, fold_every=2, summary_model="test")
+
+
+def test_short_history_is_sent_verbatim(fake_client):
+    client = fake_client("unused")
+    messages = _window().build(client, _history(3))
+    assert client.calls == 0
+    assert [msg["content"] for msg in messages[1:]] == [
+        "question 0", "answer 0", "question 1", "answer 1", "question 2", "answer 2"
+    ]
+
+
+def test_older_turns_are_folded_into_the_summary(fake_client):
+    client = fake_client("Sam wants to run 5k.")
+    window = _window()
+    messages = window.build(client, _history(4))
+    assert client.calls == 1
+    assert window.summary == "Sam wants to run 5k."
+    assert window.folded == 4
+    assert "Summary of the earlier conversation:\nSam wants to run 5k." in [msg["content"] for msg in messages]
+    assert [msg["content"] for msg in messages[-4:]] == ["question 2", "answer 2", "question 3", "answer 3"]
+
+
+def test_folds_come_in_batches_and_send_only_new_turns(fake_client):
+    client = fake_client("summary")
+    window = _window()
+    window.build(client, _history(4))
+    window.build(client, _history(5))  # one exchange past the window: not worth a fold yet
+    assert client.calls == 1
+    window.build(client, _history(6))
+    assert client.calls == 2
+    folded = client.requests[-1]["messages"][-1]["content"]
+    assert "question 2" in folded and "question 1" not in folded
+    assert "Existing summary:\nsummary" in folded
+
+
+def test_reset_history_starts_a_new_summary(fake_client):
+    client = fake_client("summary")
+    window = _window()
+    window.build(client, _history(4))
+    messages = window.build(client, _history(1))
+    assert window.summary == "" and window.folded == 0
+    assert not any("Summary of the earlier conversation" in msg["content"] for msg in messages)
+
+
+def test_turns_over_the_token_budget_are_folded(fake_client):
+    client = fake_client("summary")
+    window = ContextWindow(keep_turns=50, fold_every=50, max_prompt_tokens=120, summary_model="test")
+    history = _history(2) + [{"role": "user", "content": "word " * 60}, {"role": "assistant", "content": "ok"}, {"role": "user", "content": "latest"}]
+    messages = window.build(client, history)
+    assert messages[-1]["content"] == "latest"
+    assert not any(msg["content"].startswith("word") for msg in messages)
+    assert client.calls == 1
+
+
+def test_concurrent_builds_fold_once(fake_client):
+    # A superseded reply may still be folding when the next reply builds its prompt
+    client = fake_client("summary")
+    create, entered, gate = client.chat.completions.create, threading.Event(), threading.Event()
+
+    def slow_create(**params):
+        entered.set()
+        gate.wait(5)
+        return create(**params)
+
+    client.chat.completions.create = slow_create
+    window = _window()
+    first = threading.Thread(target=window.build, args=(client, _history(4)))
+    first.start()
+    assert entered.wait(5)
+    second = threading.Thread(target=window.build, args=(client, _history(5)))  # one exchange later
+    second.start()
+    gate.set()
+    first.join(5)
+    second.join(5)
+    assert client.calls == 1
+    assert window.folded == 4
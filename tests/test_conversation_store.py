@@ -0,0 +1,64 @@
+from context_window import ContextWindow
+from conversation_store import ConversationLog, ConversationStore, new_conversation_key, resume_token, verify_token
+from message_store import MessageStore
+
+PROFILE = {"name": "Alice", "email": "alice@example.com", "goal": "Build muscle", "struggle": "Time", "timeline": "3 months"}
+
+
+def _state(memory, turns=()):
+    history = MessageStore([{"role": "system", "content": "You are Lex."}] + list(turns), spool=False)
+    return {"memory": dict(memory), "chat_history": history, "context_window": ContextWindow()}
+
+
+def test_only_our_signature_resumes():
+    key = new_conversation_key()
+    token = resume_token(key, "secret")
+    assert verify_token(token, "secret") == key
+    assert verify_token(token, "other secret") is None
+    assert verify_token(f"{new_conversation_key()}.{token.split('.')[1]}", "secret") is None
+    assert verify_token(key, "secret") is None
+    assert resume_token(key, "") is None and verify_token(token, "") is None
+
+
+def test_resume_reads_the_snapshot_and_the_tail_after_it():
+    store, key = ConversationStore(":memory:"), new_conversation_key()
+    for n in range(4):
+        store.append_turn(key, "user", f"question {n}")
+        store.append_turn(key, "assistant", f"answer {n}")
+    store.save_snapshot(key, PROFILE, "Alice trains twice a week.", unsummarized=2)
+    conversation = store.load(key)
+    assert conversation.profile == PROFILE
+    assert conversation.summary == "Alice trains twice a week."
+    assert [turn["content"] for turn in conversation.turns] == ["question 3", "answer 3"]
+    assert store.load(new_conversation_key()) is None
+
+
+def test_same_email_never_shares_a_conversation():
+    store = ConversationStore(":memory:")
+    alice, mallory = ConversationLog(store), ConversationLog(store)
+    alice.checkpoint(_state(PROFILE))
+    alice.record("user", "my knee hurts")
+    mallory.checkpoint(_state(dict(PROFILE, name="Mallory")))
+    assert alice.key != mallory.key
+    assert store.load(mallory.key).turns == []
+    assert store.load(alice.key).profile["name"] == "Alice"
+
+
+def test_nothing_is_logged_before_the_lead_form():
+    store = ConversationStore(":memory:")
+    log = ConversationLog(store)
+    log.checkpoint(_state({"name": "Alice"}))
+    log.record("user", "hello")
+    assert log.key is None
+
+
+def test_restore_rebuilds_the_chat_step():
+    store, key = ConversationStore(":memory:"), new_conversation_key()
+    store.append_turn(key, "user", "hello")
+    store.save_snapshot(key, PROFILE, "summary", unsummarized=1)
+    state, log = {}, ConversationLog(store)
+    log.restore(state, store.load(key), "You are Lex.")
+    assert state["memory"] == PROFILE
+    assert list(state["chat_history"]) == [{"role": "system", "content": "You are Lex."}, {"role": "user", "content": "hello"}]
+    assert state["context_window"].summary == "summary"
+    assert log.key == key
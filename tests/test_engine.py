@@ -0,0 +1,54 @@
+import pytest
+
+from coach import GOAL_OPTIONS, STRUGGLE_OPTIONS, TIMELINE_OPTIONS
+from engine import InvalidAnswer, UnknownSession
+from funnel import InvalidTransition, Step
+
+
+def _onboard(coach_engine, name="Alice", email="alice@example.com"):
+    session_id = coach_engine.start()["session_id"]
+    coach_engine.answer(session_id, {"name": name, "email": email, "goal": GOAL_OPTIONS[0]})
+    coach_engine.answer(session_id, {"struggle": STRUGGLE_OPTIONS[0]})
+    return session_id, coach_engine.answer(session_id, {"timeline": TIMELINE_OPTIONS[0]})
+
+
+def test_onboarding_walks_the_funnel(coach_engine):
+    session_id, view = _onboard(coach_engine)
+    assert view["step"] == "summary"
+    assert view["profile"]["name"] == "Alice"
+    assert coach_engine.session(session_id)["step"] == "summary"
+
+
+def test_answers_are_validated(coach_engine):
+    session_id = coach_engine.start()["session_id"]
+    with pytest.raises(InvalidAnswer):
+        coach_engine.answer(session_id, {"name": "Alice", "email": "not-an-email", "goal": GOAL_OPTIONS[0]})
+    with pytest.raises(InvalidAnswer):
+        coach_engine.answer(session_id, {"name": "Alice", "email": "alice@example.com", "goal": "Fly"})
+    with pytest.raises(InvalidAnswer):
+        coach_engine.answer(session_id, {"struggle": STRUGGLE_OPTIONS[0]})
+    with pytest.raises(InvalidTransition):
+        coach_engine.require(session_id, Step.CHAT)
+    with pytest.raises(UnknownSession):
+        coach_engine.session("nope")
+
+
+def test_chat_turns_are_stored_with_the_session(coach_engine):
+    session_id, _ = _onboard(coach_engine)
+    assert coach_engine.chat(session_id, "hi") == "Let's do this!"
+    assert coach_engine.messages(session_id)["turns"] == [
+        {"role": "user", "content": "hi"}, {"role": "assistant", "content": "Let's do this!"}
+    ]
+    assert coach_engine.session(session_id)["step"] == "chat"
+
+
+def test_only_the_resume_token_continues_a_conversation(coach_engine):
+    alice, view = _onboard(coach_engine)
+    coach_engine.chat(alice, "my knee hurts")
+    mallory, _ = _onboard(coach_engine, "Mallory", "ALICE@example.com")
+    assert coach_engine.messages(mallory)["turns"] == []
+    resumed = coach_engine.start(view["resume_token"])
+    assert resumed["step"] == "chat"
+    assert resumed["profile"]["name"] == "Alice"
+    assert len(coach_engine.messages(resumed["session_id"])["turns"]) == 2
+    assert coach_engine.start(view["resume_token"][:-1] + "x")["step"] == "lead"
@@ -0,0 +1,52 @@
+from guardrails import continuation_budget, meal_plan_gaps, stops_mid_line, truncated
+
+FULL_PLAN = "\n".join(
+    f"Day {day}:\n- Breakfast: oats\n- Lunch: salad\n- Dinner: tofu" for day in (1, 2, 3)
+)
+TABLE_PLAN = (
+    "| Day | Morning | Midday | Evening |\n"
+    "|---|---|---|---|\n"
+    "| 1 | Oats | Salad | Tofu |\n"
+    "| 2 | Eggs | Wrap | Fish |\n"
+    "| 3 | Yogurt | Soup | Chicken |"
+)
+LABELLED_PLAN = "\n".join(
+    f"Day {day}\nMorning: oats\nMidday: salad\nEvening: tofu" for day in (1, 2, 3)
+)
+SUMMARY = "You've got this, Sam! Three short sessions a week will move the needle."
+
+
+def test_complete_plans_are_never_continued():
+    for plan in (FULL_PLAN, TABLE_PLAN, LABELLED_PLAN, "Enjoy your week of easy meals!"):
+        assert truncated("meal_plan", plan, "stop") is None
+
+
+def test_summaries_ending_in_a_hashtag_or_bullet_are_complete():
+    assert truncated("summary", SUMMARY + "\n#FitxFearless", "stop") is None
+    assert truncated("summary", SUMMARY + "\n- Drink more water", "stop") is None
+    assert truncated("summary", SUMMARY + " 💪", "stop") is None
+
+
+def test_summary_stopping_mid_line_is_continued():
+    assert truncated("summary", "Start with three sessions a week, and", "stop") == ["the end of the last sentence"]
+    assert truncated("summary", "Start with three sessions a week and", "length") == ["the end of the last sentence"]
+
+
+def test_plan_cut_off_by_the_token_cap_names_the_missing_tail():
+    partial = FULL_PLAN.rsplit("- Lunch", 1)[0]
+    assert truncated("meal_plan", partial, "length") == ["Day 3 lunch", "Day 3 dinner"]
+    assert truncated("meal_plan", "Day 1:\n- Breakfast: oats\n- Lunch: chicken,", "stop") == [
+        "Day 1 dinner", "Day 2", "Day 3"
+    ]
+
+
+def test_cut_off_plan_with_unrecognized_sections_continues_without_naming_parts():
+    assert truncated("meal_plan", TABLE_PLAN.rsplit("\n", 1)[0], "length") == []
+    assert truncated("meal_plan", LABELLED_PLAN + " with", "stop") == []
+
+
+def test_helpers():
+    assert stops_mid_line("Lunch: chicken, rice and")
+    assert not stops_mid_line("Lunch: chicken and rice\n")
+    assert meal_plan_gaps(FULL_PLAN) == []
+    assert continuation_budget("meal_plan", ["Day 3"], max_tokens=100) == 100
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from jobs import CANCELLED, DONE, FAILED, Job, JobBoard, JobPool
+from llm_stream import stream_completion
+
+
+def _messages(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_job_cancelled_while_queued_never_runs():
+    pool = JobPool(1, "test-queued")
+    gate = threading.Event()
+    ran = []
+    blocker = pool.submit(Job("blocker", lambda job: gate.wait(5)))
+    queued = pool.submit(Job("queued", lambda job: ran.append(job)))
+    assert queued.cancel()
+    gate.set()
+    assert blocker.result(5)
+    assert queued.result(5) is None
+    assert queued.status == CANCELLED
+    assert ran == []
+
+
+def test_cancel_racing_the_worker_always_wins():
+    # Whenever cancel() reports success, the job ends cancelled, never done
+    pool = JobPool(4, "test-race")
+    cancelled = []
+    for _ in range(300):
+        job = pool.submit(Job("race", lambda job: "done"))
+        if job.cancel():
+            cancelled.append(job)
+    for job in cancelled:
+        assert job.wait(5)
+        assert job.status == CANCELLED
+        assert job.result() is None
+
+
+def test_cancelled_job_makes_no_further_upstream_calls_without_rendering(fake_client):
+    # Calls read without a render callback (the context-window fold, the meal plan
+    # phrasing) stop before going upstream once their job is cancelled
+    client = fake_client()
+    started, gate = threading.Event(), threading.Event()
+
+    def fold_then_reply(job):
+        started.set()
+        gate.wait(5)
+        return stream_completion(client, "context_fold", model="test", messages=_messages("fold")).read()
+
+    job = JobPool(1, "test-upstream").submit(Job("reply", fold_then_reply))
+    assert started.wait(5)
+    assert job.cancel()
+    gate.set()
+    assert job.result(5) is None
+    assert job.status == CANCELLED
+    assert client.calls == 0
+
+
+def test_uncancelled_job_reads_its_call(fake_client):
+    client = fake_client()
+    job = JobPool(1, "test-read").submit(
+        Job("reply", lambda job: stream_completion(client, "chat", model="test", messages=_messages("read")).read())
+    )
+    assert job.result(5) == "Hi there"
+    assert job.status == DONE
+    assert client.calls == 1
+
+
+def test_new_job_supersedes_the_one_in_its_slot():
+    board = JobBoard(JobPool(2, "test-board"))
+    release = threading.Event()
+
+    def slow_stream():
+        yield "first"
+        release.wait(5)
+        yield " never shown"
+
+    first = board.submit("reply", lambda job: job.render(slow_stream()))
+    second = board.submit("reply", lambda job: "second")
+    release.set()
+    assert first.wait(5)
+    assert first.status == CANCELLED
+    assert first.end_reason == "superseded"
+    assert " never shown" not in first.text
+    assert board.get("reply") is second
+    assert second.result(5) == "second"
+
+
+def test_failed_job_reraises_its_error():
+    job = JobPool(1, "test-failed").submit(Job("summary", lambda job: 1 / 0))
+    assert job.wait(5)
+    assert job.status == FAILED
+    with pytest.raises(ZeroDivisionError):
+        job.result()
@@ -0,0 +1,75 @@
+import sqlite3
+
+import lead_sink
+from lead_sink import LeadSink
+
+LEAD = {"name": "Sam", "email": "sam@example.com", "goal": "Lose fat", "struggle": "time", "timeline": "3 months"}
+
+
+class FlakyDb:
+    # The sink's connection, failing the first `failures` writes as a locked database would
+    def __init__(self, db, failures):
+        self.db = db
+        self.failures = failures
+
+    def executemany(self, sql, rows):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.db.executemany(sql, rows)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+def _count(sink):
+    return sink._db.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+
+def test_leads_are_written_in_batches():
+    sink = LeadSink(":memory:", flush_interval=0.01)
+    for _ in range(3):
+        sink.submit("lead_form", LEAD)
+    sink.flush()
+    assert _count(sink) == 3
+    assert sink.stats["written"] == 3
+    sink.close()
+
+
+def test_failed_batch_is_retried(monkeypatch):
+    monkeypatch.setattr(lead_sink, "WRITE_BACKOFF", 0)
+    sink = LeadSink(":memory:", flush_interval=0.01)
+    sink._db = FlakyDb(sink._db, failures=lead_sink.WRITE_ATTEMPTS - 1)
+    sink.submit("lead_form", LEAD)
+    sink.flush()
+    assert _count(sink) == 1
+    assert sink.stats["retries"] == lead_sink.WRITE_ATTEMPTS - 1
+    assert sink.stats["failed"] == 0
+    sink.close()
+
+
+def test_batch_is_given_up_after_the_last_attempt(monkeypatch):
+    monkeypatch.setattr(lead_sink, "WRITE_BACKOFF", 0)
+    sink = LeadSink(":memory:", flush_interval=0.01)
+    sink._db = FlakyDb(sink._db, failures=lead_sink.WRITE_ATTEMPTS)
+    sink.submit("lead_form", LEAD)
+    sink.flush()
+    assert _count(sink) == 0
+    assert sink.stats["failed"] == 1
+    sink.submit("email_confirmed", LEAD)  # the writer keeps going
+    sink.flush()
+    assert _count(sink) == 1
+    sink.close()
+
+
+def test_dedupe_merges_events_by_email():
+    rows = [
+        dict(LEAD, email="Sam@Example.com", captured_at=1.0, timeline=None),
+        dict(LEAD, captured_at=2.0, goal="Build muscle"),
+        dict(LEAD, email="not-an-email", captured_at=3.0),
+    ]
+    leads = lead_sink.dedupe_leads(rows)
+    assert len(leads) == 1
+    assert leads[0]["goal"] == "Build muscle"
+    assert leads[0]["timeline"] == "3 months"
+    assert (leads[0]["first_seen"], leads[0]["last_seen"], leads[0]["events"]) == (1.0, 2.0, 2)
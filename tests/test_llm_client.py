@@ -0,0 +1,27 @@
+import threading
+import time
+
+import llm_client
+from llm_client import LazyClient
+
+
+def test_failed_warm_up_is_retried(monkeypatch):
+    attempts, called = [], threading.Event()
+
+    def get_client(api_key=None):
+        attempts.append(api_key)
+        called.set()
+        if len(attempts) == 1:
+            raise OSError("SDK failed to load")
+
+    monkeypatch.setattr(llm_client, "get_client", get_client)
+    client = LazyClient(api_key="sk-test-warm-up")
+    client.prepare()
+    assert called.wait(5)
+    deadline = time.monotonic() + 5
+    while "sk-test-warm-up" in llm_client._preparing and time.monotonic() < deadline:
+        time.sleep(0.01)  # released once the failed build has finished
+    called.clear()
+    client.prepare()
+    assert called.wait(5)
+    assert attempts == ["sk-test-warm-up", "sk-test-warm-up"]
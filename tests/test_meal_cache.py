@@ -0,0 +1,60 @@
+import pytest
+
+import meal_cache
+from meal_cache import MealPlanCache, canonicalize, loose_restriction
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I am allergic to peanuts", ("peanut-free",)),
+    ("I’m allergic to shellfish", ("shellfish-free",)),
+    ("vegetarian, allergic to peanuts and eggs", ("egg-free", "peanut-free", "vegetarian")),
+    ("I can't eat nuts, eggs or soy", ("egg-free", "nut-free", "soy-free")),
+    ("intolerant to dairy", ("dairy-free",)),
+    ("lactose intolerant", ("dairy-free",)),
+    ("allergic to nuts, vegan and keto", ("keto", "nut-free", "vegan")),
+    ("Keto, no nuts", ("keto", "nut-free")),
+    ("no nuts keto", ("keto", "nut-free")),
+    ("no pork please", ("pork-free",)),
+    ("no red meat", ("red-meat-free",)),
+    ("no meat", ("meat-free",)),
+    ("allergic to red meat and eggs", ("egg-free", "red-meat-free")),
+    ("keto, refined sugar free", ("keto", "refined-sugar-free")),
+])
+def test_canonicalize_restrictions(text, expected):
+    assert canonicalize(text) == expected
+    assert not loose_restriction(text)
+
+
+@pytest.mark.parametrize("text", ["I have allergies", "I have severe allergies", "not spicy", "anything except chicken"])
+def test_unparsed_restriction_is_loose(text):
+    assert loose_restriction(text)
+    assert not any(tag in ("am-free", "have-free", "severe-free") for tag in canonicalize(text))
+
+
+def test_positive_mentions_are_not_restrictions():
+    assert canonicalize("vegetarian with peanuts and eggs") == ("eggs", "peanuts", "vegetarian")
+
+
+@pytest.mark.skipif(not meal_cache.NUMPY_AVAILABLE, reason="similarity layer needs numpy")
+def test_similar_plan_never_served_across_an_allergy():
+    cache = MealPlanCache()
+    cache.set("vegetarian with peanuts and eggs", "plan with peanuts")
+    assert cache.get("vegetarian, allergic to peanuts and eggs") is None
+    assert cache.get("I have severe allergies, vegetarian with peanuts and eggs") is None
+    assert cache.get("vegetarian with peanut and eggs") == "plan with peanuts"
+
+
+@pytest.mark.skipif(not meal_cache.NUMPY_AVAILABLE, reason="similarity layer needs numpy")
+def test_multi_word_restriction_is_not_a_neighbour_of_its_last_word():
+    cache = MealPlanCache()
+    cache.set("no red meat", "plan with chicken")
+    assert cache.get("no meat") is None
+    cache.set("no meat", "plan with tofu")
+    assert cache.get("no red meat") == "plan with chicken"
+
+
+def test_exact_hit_ignores_order_and_case():
+    cache = MealPlanCache(use_similarity=False)
+    cache.set("Keto, no nuts", "plan")
+    assert cache.get("no nuts keto") == "plan"
+    assert cache.get("keto") is None
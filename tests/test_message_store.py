@@ -0,0 +1,63 @@
+import gc
+import os
+
+from message_store import MessageSpool, MessageStore
+
+HISTORY = [
+    {"role": "system", "content": "You are Lex."},
+    {"role": "user", "content": "I want to get stronger 💪"},
+    {"role": "assistant", "content": "Let's start with three sessions a week."},
+]
+
+
+def test_reads_back_as_list_of_dicts():
+    store = MessageStore(HISTORY, spool=False)
+    assert list(store) == HISTORY
+    assert store[1] == HISTORY[1]
+    assert store[-1] == HISTORY[-1]
+    assert store[1:] == HISTORY[1:]
+    assert store.messages(0, 1) == HISTORY[:1]
+    assert len(store) == 3
+    assert store.count_role("assistant") == 1
+
+
+def test_contents_are_shared_not_copied():
+    store = MessageStore(HISTORY, spool=False)
+    assert store[1]["content"] is HISTORY[1]["content"]
+
+
+def test_spilled_store_reads_back_from_disk(tmp_path):
+    store = MessageStore(HISTORY, spool=False)
+    assert store.spill(str(tmp_path))
+    assert store.spilled
+    assert len(store) == 3 and store.count_role("user") == 1  # without touching the disk
+    assert os.listdir(tmp_path)
+    store.append({"role": "user", "content": "and lose fat"})
+    assert not store.spilled
+    assert list(store) == HISTORY + [{"role": "user", "content": "and lose fat"}]
+    assert not os.listdir(tmp_path)
+
+
+def test_sweep_spills_only_idle_stores(tmp_path):
+    spool = MessageSpool(idle_seconds=60, directory=str(tmp_path))
+    idle, busy = MessageStore(HISTORY, spool=False), MessageStore(HISTORY, spool=False)
+    spool.register(idle)
+    spool.register(busy)
+    idle.touched -= 120
+    spool.sweep()
+    assert idle.spilled and not busy.spilled
+    assert spool.stats["spilled"] == 1
+
+
+def test_expired_session_leaves_no_file(tmp_path):
+    store = MessageStore(HISTORY, spool=False)
+    store.spill(str(tmp_path))
+    del store
+    gc.collect()
+    assert not os.listdir(tmp_path)
+
+
+def test_clear_empties_the_store():
+    store = MessageStore(HISTORY, spool=False)
+    store.clear()
+    assert len(store) == 0 and list(store) == []
@@ -0,0 +1,14 @@
+from model_router import Router, valid_json_object
+
+
+def test_json_mode_task_never_falls_back_to_the_large_model():
+    router = Router(tiers={"small": "small-model", "large": "large-model"})
+    assert router.fallback("meal_plan_voice", "small-model") is None
+    assert router.fallback("meal_plan", "small-model") == "large-model"
+    assert router.fallback("meal_plan", "large-model") is None
+
+
+def test_valid_json_object():
+    assert valid_json_object('{"intro": "hi"}')
+    assert not valid_json_object("Day 1: oats")
+    assert not valid_json_object("[1, 2]")
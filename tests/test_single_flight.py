@@ -0,0 +1,112 @@
+import threading
+
+import pytest
+
+from admission import AdmissionController, Cancelled
+from llm_stream import stream_completion
+from single_flight import Flight, SingleFlight, payload_key
+
+
+def _gated_producer(gate, calls, chunks=("a", "b")):
+    def produce(flight):
+        calls.append(flight.key)
+        gate.wait(5)
+        for chunk in chunks:
+            flight.publish(chunk)
+    return produce
+
+
+def test_payload_key_ignores_argument_order():
+    assert payload_key({"model": "m", "messages": [1]}) == payload_key({"messages": [1], "model": "m"})
+    assert payload_key({"model": "m"}) != payload_key({"model": "n"})
+
+
+def test_identical_concurrent_requests_share_one_producer():
+    group, gate, calls = SingleFlight(), threading.Event(), []
+    first, leader = group.run("key", _gated_producer(gate, calls))
+    second, follower = group.run("key", _gated_producer(gate, calls))
+    assert (leader, follower) == (True, False)
+    assert second is first
+    gate.set()
+    assert list(first.subscribe()) == ["a", "b"]
+    assert list(second.subscribe()) == ["a", "b"]
+    assert calls == ["key"]
+
+
+def test_different_requests_are_not_coalesced():
+    group, gate, calls = SingleFlight(), threading.Event(), []
+    gate.set()
+    first, _ = group.run("one", _gated_producer(gate, calls))
+    second, leader = group.run("two", _gated_producer(gate, calls))
+    assert leader and second is not first
+    list(first.subscribe())
+    list(second.subscribe())
+    assert sorted(calls) == ["one", "two"]
+
+
+def test_finished_flight_is_not_joined():
+    group, gate, calls = SingleFlight(), threading.Event(), []
+    gate.set()
+    flight, _ = group.run("key", _gated_producer(gate, calls))
+    list(flight.subscribe())
+    _, leader = group.run("key", _gated_producer(gate, calls))
+    assert leader
+    assert len(calls) == 2
+
+
+def test_flight_is_cancelled_only_when_every_subscriber_leaves():
+    group, gate = SingleFlight(), threading.Event()
+
+    def produce(flight):
+        flight.publish("a")
+        gate.wait(5)
+        flight.publish("b")
+
+    flight, _ = group.run("key", produce)
+    group.run("key", produce)
+    first, second = flight.subscribe(), flight.subscribe()
+    assert next(first) == "a" and next(second) == "a"
+    first.close()
+    assert not flight.cancelled
+    second.close()
+    assert flight.cancelled
+    gate.set()
+
+
+def test_producer_error_reaches_every_subscriber():
+    group, gate = SingleFlight(), threading.Event()
+
+    def fail(flight):
+        gate.wait(5)
+        raise RuntimeError("upstream down")
+
+    flight, _ = group.run("key", fail)
+    group.run("key", fail)
+    gate.set()
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            list(flight.subscribe())
+
+
+def test_abandoned_flight_never_goes_upstream(fake_client):
+    client = fake_client()
+    flight = Flight("key")
+    flight.cancelled = True  # every subscriber left before the producer started
+    with pytest.raises(Cancelled):
+        stream_completion(client, "chat", model="test", messages=[])._produce(flight)
+    assert client.calls == 0
+
+
+def test_flight_abandoned_during_admission_never_goes_upstream(fake_client, monkeypatch):
+    client = fake_client()
+    flight = Flight("key")
+    acquire = AdmissionController.acquire
+
+    def slow_acquire(self, *args, **kwargs):
+        flight.cancelled = True  # the subscribers left while the call queued
+        return acquire(self, *args, **kwargs)
+
+    monkeypatch.setattr(AdmissionController, "acquire", slow_acquire)
+    with pytest.raises(Cancelled):
+        stream_completion(client, "chat", model="test", messages=[])._produce(flight)
+    assert client.calls == 0
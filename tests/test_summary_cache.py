@@ -0,0 +1,49 @@
+from summary_cache import SummaryCache, normalize_answer, summary_key
+
+ANSWERS = {"name": "Sam", "goal": "🏋️‍♂️ Build muscle", "struggle": "Time", "timeline": "3 months"}
+
+
+def test_key_ignores_emoji_case_and_the_name():
+    same = dict(ANSWERS, name="Alex", goal="build MUSCLE ", struggle="time")
+    assert normalize_answer("🏋️‍♂️ Build muscle ") == "build muscle"
+    assert summary_key(ANSWERS, "gpt-4", "v1") == summary_key(same, "gpt-4", "v1")
+    assert summary_key(ANSWERS, "gpt-4", "v1") != summary_key(ANSWERS, "gpt-4", "v2")
+    assert summary_key(ANSWERS, "gpt-4", "v1") != summary_key(dict(ANSWERS, timeline="1 year"), "gpt-4", "v1")
+
+
+def test_summary_is_generated_once():
+    cache = SummaryCache(":memory:")
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "You've got this!"
+
+    for _ in range(3):
+        assert cache.get_or_create(ANSWERS, "gpt-4", "v1", generate) == "You've got this!"
+    assert len(calls) == 1
+    assert cache.stats["memory_hits"] == 2
+
+
+def test_disk_tier_survives_the_memory_tier(tmp_path):
+    path = str(tmp_path / "summaries.sqlite3")
+    SummaryCache(path).set("key", "summary")
+    cache = SummaryCache(path)  # a fresh process
+    assert cache.get("key") == "summary"
+    assert cache.stats["disk_hits"] == 1
+    assert cache.get("key") == "summary"
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = SummaryCache(":memory:", ttl=-1)
+    cache.set("key", "summary")
+    assert cache.get("key") is None
+
+
+def test_rows_beyond_the_limit_are_evicted_least_recent_first():
+    cache = SummaryCache(":memory:", memory_size=0, max_rows=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+    assert cache.get("a") is None
+    assert cache.get("b") == "b" and cache.get("c") == "c"
@@ -0,0 +1,48 @@
+import coach
+from summary_catalog import SummaryCatalog, build, catalog_key, get_summary_catalog, personalize
+
+ANSWERS = {"goal": coach.GOAL_OPTIONS[0], "struggle": coach.STRUGGLE_OPTIONS[0], "timeline": coach.TIMELINE_OPTIONS[0]}
+SUMMARY = (
+    "Hey {name}! Three short sessions a week will get you there. Start small, keep it simple "
+    "and stack one win on top of the next until the habit runs itself. You have got this, one day at a time."
+)
+
+
+def test_personalize_fills_the_name_placeholder():
+    assert personalize(SUMMARY, "Sam").startswith("Hey Sam!")
+    assert personalize(SUMMARY, "").startswith("Hey there!")
+    assert personalize("Keep going!", "Sam") == "Hey Sam! Keep going!"
+
+
+def test_lookup_is_stable_per_user():
+    catalog = SummaryCatalog({catalog_key(ANSWERS): ["A {name}", "B {name}", "C {name}"]}, "fp")
+    first = catalog.lookup(ANSWERS, "Sam")
+    assert all(catalog.lookup(ANSWERS, "Sam") == first for _ in range(5))
+    assert first.endswith("Sam")
+    assert catalog.lookup(dict(ANSWERS, timeline="someday"), "Sam") is None
+
+
+def test_saved_catalog_loads_back(tmp_path):
+    path = str(tmp_path / "catalog.json.gz")
+    SummaryCatalog({catalog_key(ANSWERS): [SUMMARY]}, "fp", "gpt-4", 1.0).save(path)
+    catalog = SummaryCatalog.load(path)
+    assert (catalog.fingerprint, catalog.model, catalog.created_at) == ("fp", "gpt-4", 1.0)
+    assert catalog.lookup(ANSWERS, "Sam") == personalize(SUMMARY, "Sam")
+
+
+def test_missing_or_stale_catalog_is_ignored(tmp_path):
+    path = str(tmp_path / "catalog.json.gz")
+    assert get_summary_catalog("fp", path) is None
+    SummaryCatalog({}, "old").save(str(tmp_path / "stale.json.gz"))
+    assert get_summary_catalog("new", str(tmp_path / "stale.json.gz")) is None
+    assert get_summary_catalog("old", str(tmp_path / "stale.json.gz")) is not None
+
+
+def test_build_covers_every_combination_once(fake_client):
+    client = fake_client(SUMMARY)
+    catalog = build(client, variants=1, workers=4, model="test")
+    combinations = len(coach.GOAL_OPTIONS) * len(coach.STRUGGLE_OPTIONS) * len(coach.TIMELINE_OPTIONS)
+    assert len(catalog.entries) == combinations
+    assert client.calls == combinations  # valid summaries are not redrawn
+    assert catalog.fingerprint == coach.summary_fingerprint()
+    assert catalog.lookup(ANSWERS, "Sam") == personalize(SUMMARY, "Sam")
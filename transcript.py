@@ -0,0 +1,63 @@
+import streamlit as st
+
+# Incremental chat transcript.
+# Every rerun used to emit one element per message. Here older messages are formatted
+# once (appended incrementally as the history grows) and shown as a single cached
+# markdown block, only the newest messages are rendered individually, and very long
+# histories are windowed behind a "Show earlier messages" button.
+
+DEFAULT_LIVE_MESSAGES = 4
+DEFAULT_PAGE_SIZE = 50
+LABELS = {"user": "You", "assistant": "Lex"}
+
+
+def format_message(msg):
+    return f"**{LABELS[msg['role']]}:** {msg['content']}"
+
+
+class Transcript:
+    def __init__(self, live_messages=DEFAULT_LIVE_MESSAGES, page_size=DEFAULT_PAGE_SIZE):
+        self.live_messages = live_messages
+        self.page_size = page_size
+        self.pages = 1
+        self._formatted = []  # pre-rendered markdown, one entry per message
+        self._first = None
+        self._block_range = None
+        self._block = ""
+
+    def _sync(self, messages):
+        # History was reset or replaced: start over, otherwise format only the new messages
+        first = messages[0] if messages else None
+        if len(messages) < len(self._formatted) or first != self._first:
+            self._formatted = []
+            self._block_range = None
+            self.pages = 1
+            self._first = first
+        for msg in messages[len(self._formatted):]:
+            self._formatted.append(format_message(msg))
+
+    def _older_block(self, start, end):
+        if self._block_range != (start, end):
+            self._block = "\n\n".join(self._formatted[start:end])
+            self._block_range = (start, end)
+        return self._block
+
+    def show_more(self):
+        self.pages += 1
+
+    def render(self, history, chat_bubbles=False):
+        messages = [msg for msg in history if msg["role"] in LABELS]
+        self._sync(messages)
+
+        live_start = max(0, len(messages) - self.live_messages)
+        window_start = max(0, live_start - self.pages * self.page_size)
+        if window_start > 0:
+            st.button(f"Show earlier messages ({window_start} hidden)", on_click=self.show_more)
+        if live_start > window_start:
+            st.markdown(self._older_block(window_start, live_start))
+
+        for msg in messages[live_start:]:
+            if chat_bubbles:
+                st.chat_message(msg["role"]).markdown(msg["content"])
+            else:
+                st.markdown(format_message(msg))
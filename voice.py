@@ -0,0 +1,341 @@
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import unicodedata
+import wave
+from collections import OrderedDict
+from string import Template
+
+import streamlit as st
+
+from llm_metrics import record_cache
+
+# Server-side voice: speech-to-text for the mic buttons and text-to-speech for the
+# "Play" buttons, both on local CPU engines, so they work in every browser.
+# - STT: faster-whisper (CTranslate2 int8 on CPU) or Vosk, picked by FITX_STT_ENGINE
+#   ("auto" takes the first one installed). Audio comes from st.audio_input as 16 kHz WAV.
+#   Both are optional and imported on first use, so they cost nothing at startup.
+# - TTS: the piper or espeak-ng command line, picked by FITX_TTS_ENGINE.
+# Rendered speech is cached on disk under a hash of (engine, voice, text) with LRU
+# eviction beyond FITX_AUDIO_CACHE_MB, so playing the same summary again synthesizes
+# nothing; st.audio serves the file with HTTP range requests, so playback streams in
+# chunks. Without any engine installed the apps keep the browser Web Speech snippets.
+# speech_input() and speak_aloud() pick between the two for the apps.
+
+logger = logging.getLogger("fitx.voice")
+
+CACHE_DIR = os.getenv("FITX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+AUDIO_CACHE_DIR = os.getenv("FITX_AUDIO_CACHE_DIR", os.path.join(CACHE_DIR, "audio"))
+AUDIO_CACHE_MAX_BYTES = int(float(os.getenv("FITX_AUDIO_CACHE_MB", "200")) * 2**20)
+STT_ENGINE = os.getenv("FITX_STT_ENGINE", "auto")  # faster-whisper | vosk | none | auto
+TTS_ENGINE = os.getenv("FITX_TTS_ENGINE", "auto")  # piper | espeak | none | auto
+WHISPER_MODEL = os.getenv("FITX_WHISPER_MODEL", "base.en")
+VOSK_MODEL = os.getenv("FITX_VOSK_MODEL", "")  # path to an unpacked Vosk model
+PIPER_VOICE = os.getenv("FITX_PIPER_VOICE", "")  # path to a piper .onnx voice
+ESPEAK_VOICE = os.getenv("FITX_ESPEAK_VOICE", "en-us")
+SAMPLE_RATE = 16000
+CHUNK_SIZE = 64 * 1024
+TTS_TIMEOUT = 60
+
+# Browser fallbacks (Web Speech API), rendered in a components iframe
+BROWSER_MIC_HTML = Template("""
+<script>
+var recognition = new(window.SpeechRecognition || window.webkitSpeechRecognition)();
+recognition.lang = 'en-US';
+recognition.interimResults = false;
+recognition.maxAlternatives = 1;
+
+function startRecognition() {
+    recognition.start();
+}
+
+recognition.onresult = function(event) {
+    const transcript = event.results[0][0].transcript;
+    const inputBox = window.parent.document.querySelector('input#$input_id');
+    if(inputBox) {
+        inputBox.value = transcript;
+        inputBox.dispatchEvent(new Event('input', { bubbles: true }));
+    }
+}
+</script>
+<button onclick="startRecognition()">🎤 Speak</button>
+""")
+
+BROWSER_SPEECH_HTML = Template("""
+<script>
+var msg = new SpeechSynthesisUtterance();
+msg.text = $text;
+window.speechSynthesis.speak(msg);
+</script>
+""")
+
+
+def speech_text(text):
+    # What is read aloud: no markdown markers or emoji
+    text = re.sub(r"[*_#>`|]+", "", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) not in ("So", "Sk", "Cs", "Co") and ch not in "\u200d\ufe0e\ufe0f")
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+
+class AudioCache:
+    # Content-addressed WAV files on disk, evicted least recently used beyond max_bytes
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        self._entries = OrderedDict()  # key -> size, oldest first
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        files = [entry for entry in os.scandir(directory) if entry.name.endswith(".wav")]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            size = entry.stat().st_size
+            self._entries[entry.name[:-4]] = size
+            self._size += size
+        self._evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        path = self.path(key)
+        try:
+            os.utime(path)  # recency survives restarts
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key, data):
+        path = self.path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.stats["evicted"] += 1
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def stream(self, key, chunk_size=CHUNK_SIZE):
+        # For callers that serve audio themselves
+        path = self.get(key)
+        if path is None:
+            return
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+
+def read_pcm(audio):
+    # 16-bit mono PCM frames and sample rate from WAV bytes
+    with wave.open(io.BytesIO(audio)) as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError("expected 16-bit mono WAV audio")
+        return wav.readframes(wav.getnframes()), wav.getframerate()
+
+
+class WhisperSTT:
+    name = "faster-whisper"
+
+    def __init__(self, whisper_model, model=WHISPER_MODEL):
+        self.model = whisper_model(model, device="cpu", compute_type="int8")
+
+    def transcribe(self, audio):
+        segments, _ = self.model.transcribe(io.BytesIO(audio), language="en", beam_size=1, vad_filter=True)
+        return " ".join(segment.text.strip() for segment in segments)
+
+
+class VoskSTT:
+    name = "vosk"
+
+    def __init__(self, vosk, model=VOSK_MODEL):
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model)
+
+    def transcribe(self, audio):
+        frames, rate = read_pcm(audio)
+        recognizer = self.vosk.KaldiRecognizer(self.model, rate)  # one per call, models are shared
+        recognizer.AcceptWaveform(frames)
+        return json.loads(recognizer.FinalResult()).get("text", "")
+
+
+class CommandTTS:
+    # A TTS command line that reads text on stdin and writes a WAV file to {out}
+    def __init__(self, name, command, voice):
+        self.name = name
+        self.command = command
+        self.voice = voice  # part of the cache key
+
+    def synthesize(self, text):
+        with tempfile.TemporaryDirectory(prefix="fitx-tts-") as tmp:
+            out = os.path.join(tmp, "speech.wav")
+            subprocess.run(
+                [arg.replace("{out}", out) for arg in self.command],
+                input=text.encode("utf-8"), check=True, capture_output=True, timeout=TTS_TIMEOUT,
+            )
+            with open(out, "rb") as f:
+                return f.read()
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def _stt_engine(name):
+    # Imported here, when the first recording arrives: faster_whisper alone pulls in
+    # CTranslate2 and onnxruntime
+    if name in ("faster-whisper", "auto") and _installed("faster_whisper"):
+        from faster_whisper import WhisperModel
+
+        return WhisperSTT(WhisperModel)
+    if name in ("vosk", "auto") and _installed("vosk") and VOSK_MODEL:
+        import vosk
+
+        return VoskSTT(vosk)
+    if name not in ("auto", "none"):
+        logger.warning("speech-to-text engine %s is not installed", name)
+    return None
+
+
+def _tts_engine(name):
+    if name in ("piper", "auto") and shutil.which("piper") and PIPER_VOICE:
+        return CommandTTS("piper", ["piper", "--model", PIPER_VOICE, "--output_file", "{out}"], PIPER_VOICE)
+    if name in ("espeak", "auto") and shutil.which("espeak-ng"):
+        return CommandTTS("espeak", ["espeak-ng", "-v", ESPEAK_VOICE, "--stdin", "-w", "{out}"], ESPEAK_VOICE)
+    if name not in ("auto", "none"):
+        logger.warning("text-to-speech engine %s is not installed", name)
+    return None
+
+
+class Voice:
+    def __init__(self, stt_engine=STT_ENGINE, tts_engine=TTS_ENGINE, cache=None):
+        self.tts = _tts_engine(tts_engine)
+        self.cache = cache or (AudioCache() if self.tts else None)
+        self._stt_name = stt_engine
+        self._stt = None  # models load on first use, they take seconds
+        self._stt_lock = threading.Lock()
+        self._rendering = {}  # key -> lock, so concurrent plays of one text synthesize once
+        self._rendering_lock = threading.Lock()
+
+    @property
+    def can_listen(self):
+        # Installed, without importing the engine or loading the model yet
+        whisper = self._stt_name in ("faster-whisper", "auto") and _installed("faster_whisper")
+        kaldi = self._stt_name in ("vosk", "auto") and bool(VOSK_MODEL) and _installed("vosk")
+        return whisper or kaldi
+
+    @property
+    def can_speak(self):
+        return self.tts is not None
+
+    def transcribe(self, audio):
+        with self._stt_lock:
+            if self._stt is None:
+                self._stt = _stt_engine(self._stt_name)
+            if self._stt is None:
+                raise RuntimeError("no speech-to-text engine available")
+        return self._stt.transcribe(audio).strip()
+
+    def speech_key(self, text):
+        raw = json.dumps([self.tts.name, self.tts.voice, text], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def speak(self, text):
+        # Path to a WAV file of `text` read aloud, rendered at most once per text;
+        # None without an engine or when synthesis fails
+        if self.tts is None:
+            return None
+        text = speech_text(text)
+        key = self.speech_key(text)
+        path = self.cache.get(key)
+        record_cache("tts", hit=path is not None)
+        if path is None:
+            with self._rendering_lock:
+                lock = self._rendering.setdefault(key, threading.Lock())
+            try:
+                with lock:
+                    path = self.cache.get(key) or self.cache.put(key, self.tts.synthesize(text))
+            except (OSError, subprocess.SubprocessError):
+                logger.exception("%s failed to synthesize speech", self.tts.name)
+            finally:
+                with self._rendering_lock:
+                    self._rendering.pop(key, None)
+        return path
+
+
+_voice = None
+_voice_lock = threading.Lock()
+
+
+def get_voice():
+    global _voice
+    with _voice_lock:
+        if _voice is None:
+            _voice = Voice()
+        return _voice
+
+
+def transcribe_into(audio_key, input_key):
+    # on_change callback of st.audio_input: puts the transcript into a text input
+    audio = st.session_state.get(audio_key)
+    if audio is None:
+        return
+    try:
+        text = get_voice().transcribe(audio.getvalue())
+    except Exception:
+        logger.exception("transcription failed")
+        return
+    if text:
+        st.session_state[input_key] = text
+
+
+def speech_input(audio_key, input_key):
+    # Mic for a text input: server-side transcription when an engine is installed,
+    # else the browser's speech recognition
+    if get_voice().can_listen:
+        st.audio_input("🎤 Speak", key=audio_key, sample_rate=SAMPLE_RATE, on_change=transcribe_into, args=(audio_key, input_key))
+    else:
+        import streamlit.components.v1 as components  # fallback only, kept off the startup path
+
+        components.html(BROWSER_MIC_HTML.substitute(input_id=input_key), height=60)
+
+
+def speak_aloud(text):
+    # Plays `text`: rendered once per text and served from the audio cache, else read by
+    # the browser
+    audio = get_voice().speak(text)
+    if audio:
+        st.audio(audio, autoplay=True)
+    else:
+        import streamlit.components.v1 as components
+
+        literal = json.dumps(text).replace("</", "<\\/")  # cannot close the script tag
+        components.html(BROWSER_SPEECH_HTML.substitute(text=literal), height=0)